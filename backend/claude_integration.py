@@ -3,14 +3,51 @@ Enhanced Claude Code CLI integration with better session management
 """
 
 import asyncio
-import json
 import logging
 import os
-import shutil
-import subprocess
-import tempfile
-from dataclasses import dataclass
-from typing import Any, Dict, List, Optional
+import shlex
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Any, Deque, Dict, List, Optional, Tuple
+
+from cli_discovery import CLIDiscovery
+from cli_replay import STUB_COMMAND, TranscriptRecorder
+from codec import AssistantMessage, CLIEvent, DecodeError, ResultEvent, SystemEvent, ToolUse, decode_cli_event, dumps
+from health_monitor import CLIHealthMonitor
+from mcp_gateway import MCPGateway
+from metrics import (
+    CPU_TIME,
+    FIRST_EVENT,
+    FIRST_TEXT,
+    PEAK_RSS,
+    PROCESS_SPAWN,
+    QUEUE_WAIT,
+    REQUEST_DURATION,
+    REQUESTS,
+    RUN_DURATION,
+    RUNS,
+    STREAMED_BYTES,
+    TOOL_DURATION,
+)
+from process_utils import (
+    EXIT_GRACE_SECONDS,
+    STDERR_TAIL_LINES,
+    STREAM_LIMIT,
+    CgroupController,
+    RunLimits,
+    RunSandbox,
+    drain_to_ring,
+    iter_lines,
+    wait_for_exit,
+)
+from response_cache import CACHE_BYPASS, CACHE_USE, ResponseCache
+from scheduler import ExecutionScheduler, SchedulerBusyError
+from session_lanes import SessionLanes
+from session_lifecycle import SessionHistory, SessionReaper
+from session_store import create_session_store
+from worker_pool import ClaudeWorkerPool, WorkerDiedError
+from workspace_pool import WorkspacePool
 
 logger = logging.getLogger(__name__)
 
@@ -21,9 +58,36 @@ class ChatSession:
 
     session_id: str
     working_dir: str
-    history: List[Dict[str, str]]
+    history: SessionHistory
     created_at: float
     last_activity: float
+    cli_session_id: Optional[str] = None
+    # Process-tree usage of the session's CLI runs: last run, cumulative CPU, peak RSS
+    resources: Dict[str, Any] = field(default_factory=dict)
+
+
+@dataclass
+class StreamState:
+    """Output of one CLI run, accumulated as a list of text deltas"""
+
+    parts: List[str] = field(default_factory=list)
+    full_response: str = ""
+    is_error: bool = False
+    seq: int = 0
+    cli_session_id: Optional[str] = None
+    # Latency breakdown (monotonic clock)
+    started_at: float = field(default_factory=time.monotonic)
+    first_event_at: Optional[float] = None
+    first_text_at: Optional[float] = None
+    pending_tool: Optional[Tuple[str, float]] = None
+    text_bytes: int = 0
+    status: Optional[str] = None
+    # Peak RSS / CPU time of the process tree that served the run
+    resources: Optional[Dict[str, Any]] = None
+
+    @property
+    def text(self) -> str:
+        return "".join(self.parts)
 
 
 class AdvancedClaudeCodeManager:
@@ -32,222 +96,548 @@ class AdvancedClaudeCodeManager:
     def __init__(self, api_key: Optional[str] = None):
         self.api_key = api_key or os.getenv("CLAUDE_API_KEY")
         self.sessions: Dict[str, ChatSession] = {}
+        self.active_streams: Dict[str, StreamState] = {}
         self.claude_cli_available = False
-        self._check_claude_cli()
+        self.worker_pool: Optional[ClaudeWorkerPool] = None
+        self.live_processes = 0
+        self.run_limits = RunLimits.from_env()
+        self.cgroups = CgroupController()
+        self.health_monitor = CLIHealthMonitor()
+        self.scheduler = ExecutionScheduler()
+        self.session_lanes = SessionLanes()
+        self.session_store = create_session_store()
+        self.workspace_pool = WorkspacePool()
+        self.history_limit = int(os.getenv("SESSION_HISTORY_LIMIT", 200))
+        # With several uvicorn workers (uvicorn reads WEB_CONCURRENCY) another one may run turns of our sessions
+        self.shared_sessions = int(os.getenv("WEB_CONCURRENCY", 1)) > 1
+        self.reaper = SessionReaper(self)
+        self.mcp_config_path = os.path.join(os.path.dirname(os.path.dirname(__file__)), ".mcp.json")
+        self.mcp_gateway: Optional[MCPGateway] = None
+        if os.getenv("MCP_GATEWAY", "false").lower() == "true":
+            self.mcp_gateway = MCPGateway(self.mcp_config_path)
+        self.response_cache = ResponseCache(mcp_config_path=self.mcp_config_path)
+        self.recorder = TranscriptRecorder()
+        # Overall deadline of one CLI run; generous for complex operations like arxiv search
+        self.run_timeout = float(os.getenv("CLAUDE_RUN_TIMEOUT", 180))
+        # Typed CLI event -> handler
+        self._cli_event_handlers = {
+            AssistantMessage: self._on_assistant_message,
+            ToolUse: self._on_tool_use,
+            ResultEvent: self._on_result,
+            SystemEvent: self._on_system,
+        }
+        self.ready = False
+        self._startup_task: Optional[asyncio.Task] = None
+
+    async def start(self):
+        """Begin CLI discovery and background resources without blocking server startup"""
+        await self.session_store.start()
+        await self.workspace_pool.start()
+        await self.response_cache.start()
+        if self.mcp_gateway is not None:
+            await self.mcp_gateway.start()
+        self._startup_task = asyncio.create_task(self._startup())
+        self.reaper.start()
+
+    async def wait_ready(self):
+        """Wait until CLI discovery and startup have finished"""
+        if self._startup_task is not None:
+            await asyncio.shield(self._startup_task)
+
+    async def _startup(self):
+        await self._check_claude_cli()
+        if self.claude_cli_available:
+            self.health_monitor.start(self.claude_command)
+        if self.claude_cli_available and os.getenv("CLAUDE_WORKER_POOL", "false").lower() == "true":
+            self.worker_pool = ClaudeWorkerPool(
+                workspaces=self.workspace_pool,
+                limits=self.run_limits,
+                cgroups=self.cgroups,
+                workspace_env=self.mcp_gateway.workspace_env if self.mcp_gateway is not None else None,
+            )
+            command = self.claude_command + ["-p", "--input-format", "stream-json"] + self._cli_common_args()
+            await self.worker_pool.start(command, os.environ.copy())
+        self.ready = True
+        logger.info("Claude Code manager is ready")
+
+    async def shutdown(self):
+        """Stop background resources"""
+        await self.reaper.stop()
+        if self._startup_task is not None and not self._startup_task.done():
+            self._startup_task.cancel()
+        await self.health_monitor.stop()
+        if self.worker_pool is not None:
+            await self.worker_pool.shutdown()
+            self.worker_pool = None
+        await self.workspace_pool.stop()
+        if self.mcp_gateway is not None:
+            await self.mcp_gateway.stop()
+        await self.session_store.close()
+
+    def _cli_common_args(self) -> List[str]:
+        """Output, permission and MCP flags shared by one-shot runs and pooled workers"""
+        return [
+            "--output-format",
+            "stream-json",
+            "--verbose",
+            "--dangerously-skip-permissions",
+            "--mcp-config",
+            # With the gateway, the CLI connects to warm servers instead of launching its own
+            self.mcp_gateway.client_config_path if self.mcp_gateway is not None else self.mcp_config_path,
+        ]
+
+    async def _check_claude_cli(self) -> bool:
+        """Check if Claude Code CLI is available.
+
+        ``CLAUDE_CLI_COMMAND`` skips discovery and uses the given command line; ``stub``
+        selects the transcript-replaying stub CLI for offline runs and benchmarks.
+        """
+        override = os.getenv("CLAUDE_CLI_COMMAND", "").strip()
+        if override:
+            command = STUB_COMMAND if override == "stub" else shlex.split(override)
+            logger.info(f"Using Claude CLI command from CLAUDE_CLI_COMMAND: {' '.join(command)}")
+        else:
+            try:
+                command = await CLIDiscovery().discover()
+            except Exception as e:
+                logger.error(f"Error checking Claude Code CLI: {e}")
+                command = None
 
-    def _check_claude_cli(self) -> bool:
-        """Check if Claude Code CLI is available"""
-        try:
-            # Try different possible command names
-            commands_to_try = ["claude", "npx @anthropic-ai/claude-code", "claude-code"]
-
-            for cmd in commands_to_try:
-                try:
-                    result = subprocess.run(cmd.split() + ["--version"], capture_output=True, text=True, timeout=5)
-                    if result.returncode == 0:
-                        logger.info(f"Found Claude Code CLI: {cmd}")
-                        self.claude_command = cmd.split()
-                        self.claude_cli_available = True
-                        return True
-                except (FileNotFoundError, subprocess.TimeoutExpired):
-                    continue
-
-            logger.warning("Claude Code CLI not found")
+        if command is None:
             self.claude_cli_available = False
             return False
 
-        except Exception as e:
-            logger.error(f"Error checking Claude Code CLI: {e}")
-            self.claude_cli_available = False
-            return False
-
-    async def _check_claude_auth(self) -> Dict[str, Any]:
-        """Check if Claude CLI is authenticated"""
-        try:
-            if not self.claude_cli_available:
-                return {"authenticated": False, "message": "Claude CLI not available"}
-
-            # Try a simple command to check authentication
-            result = subprocess.run(self.claude_command + ["--help"], capture_output=True, text=True, timeout=10)
-
-            if result.returncode == 0:
-                return {"authenticated": True, "message": "Claude CLI is ready"}
-            else:
-                return {
-                    "authenticated": False,
-                    "message": "Run 'claude auth' to authenticate with your Claude Pro/Max account or Anthropic Console",
-                }
-
-        except Exception as e:
-            return {"authenticated": False, "message": f"Authentication check failed: {str(e)}"}
+        self.claude_command = command
+        self.claude_cli_available = True
+        return True
 
     async def create_session(self, session_id: str) -> ChatSession:
-        """Create a new chat session"""
-        if session_id in self.sessions:
-            return self.sessions[session_id]
-
-        working_dir = tempfile.mkdtemp(prefix=f"claude_session_{session_id}_")
-        import time
-
+        """Get a session, recovering it from the session store or creating a new one.
+
+        A single worker process owns its sessions, so one already in memory is used as
+        is. With ``WEB_CONCURRENCY`` > 1 the store is read on every call, in case another
+        worker ran a turn of the session since.
+        """
+        session = self.sessions.get(session_id)
+        if session is not None:
+            if self.shared_sessions:
+                record = await self.session_store.get_session(session_id)
+                if record is not None and record["last_activity"] > session.last_activity:
+                    # Another worker ran a turn since: continue from its CLI conversation
+                    session.cli_session_id = record["cli_session_id"]
+                    session.last_activity = record["last_activity"]
+                    session.history = await self._load_history(session_id, record["message_count"])
+            return session
+
+        record = await self.session_store.get_session(session_id)
         now = time.time()
 
-        session = ChatSession(session_id=session_id, working_dir=working_dir, history=[], created_at=now, last_activity=now)
+        if record is not None:
+            # Restarted backend or another worker's session: reuse the directory the CLI conversation is keyed by
+            working_dir = record["working_dir"]
+            await self.workspace_pool.restore(working_dir)
+            session = ChatSession(
+                session_id=session_id,
+                working_dir=working_dir,
+                history=await self._load_history(session_id, record["message_count"]),
+                created_at=record["created_at"],
+                last_activity=now,
+                cli_session_id=record["cli_session_id"],
+            )
+        else:
+            working_dir = await self.workspace_pool.acquire()
+            session = ChatSession(
+                session_id=session_id,
+                working_dir=working_dir,
+                history=SessionHistory(self.history_limit),
+                created_at=now,
+                last_activity=now,
+            )
+            self._save_session(session)
 
         self.sessions[session_id] = session
         logger.info(f"Created session {session_id} with working dir {working_dir}")
         return session
 
-    async def execute_command(self, message: str, session_id: str = "default", stream_callback=None) -> Dict[str, Any]:
-        """Execute Claude Code CLI command in a specific session with optional streaming"""
+    async def _load_history(self, session_id: str, message_count: int) -> SessionHistory:
+        """Recent turns from the session store, bounded like in-memory history"""
+        recent = await self.session_store.recent_messages(session_id, self.history_limit)
+        return SessionHistory(self.history_limit, recent, message_count)
+
+    def _save_session(self, session: ChatSession):
+        self.session_store.save_session(
+            {
+                "session_id": session.session_id,
+                "working_dir": session.working_dir,
+                "created_at": session.created_at,
+                "last_activity": session.last_activity,
+                "message_count": len(session.history),
+                "cli_session_id": session.cli_session_id,
+            }
+        )
+
+    def _record_turn(self, session: ChatSession, role: str, content: str):
+        """Append a turn to the session's history and the session store"""
+        entry = {"role": role, "content": content, "timestamp": time.time()}
+        session.history.append(entry)
+        self.session_store.append_message(session.session_id, entry)
+        self._save_session(session)
+
+    def is_session_busy(self, session_id: str) -> bool:
+        """Whether the session has a run queued or in flight"""
+        return session_id in self.active_streams or self.session_lanes.is_busy(session_id)
+
+    async def execute_command(
+        self,
+        message: str,
+        session_id: str = "default",
+        stream_callback=None,
+        client_id: Optional[str] = None,
+        priority: int = 0,
+        on_queue_position=None,
+        cache: str = CACHE_USE,
+    ) -> Dict[str, Any]:
+        """Execute Claude Code CLI command in a specific session with optional streaming.
+
+        Args:
+            message: User message.
+            session_id: Session to run in.
+            stream_callback: Async callable receiving stream events.
+            client_id: Client that sent the request, for per-client admission limits.
+            priority: Scheduling priority; higher runs first when the server is saturated.
+            on_queue_position: Called with the queue position while the request waits for a slot.
+            cache: Response cache mode: ``use``, ``refresh`` (skip the lookup but store) or ``bypass``.
+
+        Raises:
+            SchedulerBusyError: If the server is saturated and the wait queue is full.
+        """
+        started = time.monotonic()
+        outcome = "error"
         try:
+            # Requests that arrive during startup wait for CLI discovery instead of falling back to simulation
+            await self.wait_ready()
+
+            # Same-session requests run one at a time; identical pending prompts share a single run
+            result = await self.session_lanes.submit(
+                session_id,
+                message,
+                stream_callback,
+                lambda callback: self._execute_scheduled(
+                    message, session_id, callback, client_id, priority, on_queue_position, cache
+                ),
+            )
+            outcome = "cached" if result.get("cached") else "success" if result["success"] else "error"
+            return result
+
+        except SchedulerBusyError:
+            outcome = "busy"
+            raise
+        except asyncio.CancelledError:
+            outcome = "cancelled"
+            raise
+        except Exception as e:
+            logger.error(f"Error in execute_command: {e}")
+            return self._create_error_response(str(e))
+        finally:
+            REQUESTS.inc(outcome=outcome)
+            REQUEST_DURATION.observe(time.monotonic() - started, outcome=outcome)
+
+    async def _execute_scheduled(
+        self, message: str, session_id: str, stream_callback, client_id, priority: int, on_queue_position, cache: str
+    ) -> Dict[str, Any]:
+        """Wait for an execution slot, then run the message in its session"""
+        cache_key = None
+        if self.response_cache.enabled and self.claude_cli_available:
+            if cache == CACHE_BYPASS:
+                self.response_cache.bypassed += 1
+            elif not self._is_cacheable_turn(await self.create_session(session_id)):
+                # A reply to a resumed conversation depends on context the key does not cover
+                self.response_cache.uncacheable += 1
+            else:
+                cache_key = self.response_cache.key(message, self._cache_config())
+                if cache == CACHE_USE:
+                    cached = await self.response_cache.get(cache_key)
+                    if cached is not None:
+                        # A hit needs no execution slot
+                        return await self._replay_cached(message, session_id, cached, stream_callback)
+                else:
+                    self.response_cache.bypassed += 1
+
+        queued_at = time.monotonic()
+        async with self.scheduler.slot(session_id, client_id, priority, on_queue_position):
+            QUEUE_WAIT.observe(time.monotonic() - queued_at)
+
             # Get or create session
             session = await self.create_session(session_id)
-            session.last_activity = __import__("time").time()
+            session.last_activity = time.time()
+
+            # Another run of the session may have started a conversation while this one waited
+            if cache_key is not None and not self._is_cacheable_turn(session):
+                cache_key = None
 
             # Add user message to history
-            session.history.append({"role": "user", "content": message, "timestamp": session.last_activity})
+            self._record_turn(session, "user", message)
 
             # Check authentication status (Claude CLI uses authenticated session, not API key)
             if self.claude_cli_available:
-                auth_check = await self._check_claude_auth()
+                auth_check = self.health_monitor.snapshot()
                 if not auth_check["authenticated"]:
                     response = self._create_error_response(f"Claude CLI authentication required. {auth_check['message']}")
-                    session.history.append(
-                        {"role": "assistant", "content": response["response"], "timestamp": __import__("time").time()}
-                    )
+                    self._record_turn(session, "assistant", response["response"])
                     return response
 
             # Execute command
             if self.claude_cli_available:
-                result = await self._execute_real_claude_cli_streaming(message, session, stream_callback)
+                events: List[Dict[str, Any]] = []
+                if cache_key is not None:
+                    stream_callback = self._recording_callback(events, stream_callback)
+                result = await self._execute_claude_cli(message, session, stream_callback)
+                if not result["success"]:
+                    self.health_monitor.report_failure()
+                elif cache_key is not None:
+                    await self.response_cache.put(cache_key, events, result, session.session_id)
             else:
                 result = await self._execute_simulation_mode(message, session)
 
             # Add response to history
-            session.history.append(
-                {"role": "assistant", "content": result["response"], "timestamp": __import__("time").time()}
-            )
+            self._record_turn(session, "assistant", result["response"])
 
             return result
 
-        except Exception as e:
-            logger.error(f"Error in execute_command: {e}")
-            return self._create_error_response(str(e))
-
-    async def _execute_real_claude_cli(self, message: str, session: ChatSession) -> Dict[str, Any]:
-        """Execute real Claude Code CLI command using streaming JSON input"""
+    def _cache_config(self) -> str:
+        """The parts of the CLI setup that shape a reply, for the response cache key"""
+        return "\0".join(self.claude_command + self._cli_common_args() + [self.workspace_pool.template or ""])
+
+    @staticmethod
+    def _is_cacheable_turn(session: ChatSession) -> bool:
+        """Only a session's opening turn is cached: later replies depend on the conversation so far"""
+        return session.cli_session_id is None and len(session.history) == 0
+
+    @staticmethod
+    def _recording_callback(events: List[Dict[str, Any]], stream_callback):
+        """Wrap ``stream_callback`` so every event is also appended to ``events``"""
+
+        async def record(event: Dict[str, Any]):
+            events.append(event)
+            if stream_callback:
+                await stream_callback(event)
+
+        return record
+
+    async def _replay_cached(self, message: str, session_id: str, cached: Dict[str, Any], stream_callback) -> Dict[str, Any]:
+        """Answer from the response cache, streaming the recorded events as a live run would"""
+        session = await self.create_session(session_id)
+        session.last_activity = time.time()
+        # No CLI conversation is started or restored: the next turn runs without this exchange
+        self._record_turn(session, "user", message)
+        if stream_callback:
+            for event in cached["events"]:
+                await stream_callback(dict(event))
+        result = {**cached["result"], "session_id": session_id, "cached": True}
+        self._record_turn(session, "assistant", result["response"])
+        return result
+
+    async def _execute_claude_cli(self, message: str, session: ChatSession, stream_callback=None) -> Dict[str, Any]:
+        """Run a turn on the session's pooled worker, falling back to a one-shot process.
+
+        The turn resumes the session's CLI conversation when one is recorded. If the CLI
+        no longer knows that conversation, the turn is retried once as a fresh run.
+        """
+        state = StreamState()
+        self.active_streams[session.session_id] = state
+        status = "error"
         try:
-            # Claude CLI with streaming JSON input mode, skip permissions, and MCP config
-            mcp_config_path = os.path.join(os.path.dirname(os.path.dirname(__file__)), ".mcp.json")
-            cmd = self.claude_command + [
-                "-p",
-                "--output-format",
-                "stream-json",
-                "--verbose",
-                "--dangerously-skip-permissions",
-                "--mcp-config",
-                mcp_config_path,
-            ]
-
-            # Setup environment (no API key needed for authenticated session)
-            env = os.environ.copy()
-
-            # Execute with timeout
-            process = await asyncio.create_subprocess_exec(
-                *cmd,
-                stdin=asyncio.subprocess.PIPE,
-                stdout=asyncio.subprocess.PIPE,
-                stderr=asyncio.subprocess.PIPE,
-                cwd=session.working_dir,
-                env=env,
-            )
+            result = await self._run_cli_turn(message, session, stream_callback, state)
+            if not result["success"] and session.cli_session_id and self._is_resume_failure(result):
+                logger.info(f"CLI session {session.cli_session_id} of {session.session_id} expired, starting fresh")
+                session.cli_session_id = None
+                state.cli_session_id = None
+                result = await self._run_cli_turn(message, session, stream_callback, state)
+
+            if state.cli_session_id and state.cli_session_id != session.cli_session_id:
+                session.cli_session_id = state.cli_session_id
+            status = state.status or ("success" if result["success"] else "error")
+            result["resources"] = state.resources
+            self._record_resources(session, state.resources)
+            return result
+        except asyncio.CancelledError:
+            status = "cancelled"
+            raise
+        finally:
+            if self.active_streams.get(session.session_id) is state:
+                del self.active_streams[session.session_id]
+            self._observe_run(state, status)
+
+    @staticmethod
+    def _record_resources(session: ChatSession, usage: Optional[Dict[str, Any]]):
+        if usage is None:
+            return
+        totals = session.resources
+        totals["last_run"] = usage
+        totals["runs"] = totals.get("runs", 0) + 1
+        totals["cpu_seconds_total"] = round(totals.get("cpu_seconds_total", 0.0) + usage["cpu_seconds"], 3)
+        totals["peak_rss_bytes"] = max(totals.get("peak_rss_bytes", 0), usage["peak_rss_bytes"])
+
+    @staticmethod
+    def _observe_run(state: StreamState, status: str):
+        now = time.monotonic()
+        if state.pending_tool is not None:
+            # The run ended while a tool was still running
+            name, tool_started = state.pending_tool
+            TOOL_DURATION.observe(now - tool_started, tool=name)
+        RUNS.inc(status=status)
+        RUN_DURATION.observe(now - state.started_at, status=status)
+        STREAMED_BYTES.observe(state.text_bytes)
+        if state.resources is not None:
+            PEAK_RSS.observe(state.resources["peak_rss_bytes"])
+            CPU_TIME.observe(state.resources["cpu_seconds"], status=status)
+
+    async def _run_cli_turn(self, message: str, session: ChatSession, stream_callback, state: StreamState) -> Dict[str, Any]:
+        resume_args = ["--resume", session.cli_session_id] if session.cli_session_id else []
+        if self.worker_pool is not None:
+            # The user message is already recorded, so a session that has not run yet has one entry
+            acquire_started = time.monotonic()
+            worker = await self.worker_pool.acquire(session, resume_args, fresh=len(session.history) <= 1)
+            if worker is not None:
+                PROCESS_SPAWN.observe(time.monotonic() - acquire_started, mode="pool")
+                return await self._execute_pooled_turn(message, session, worker, stream_callback, state)
+        return await self._execute_real_claude_cli_streaming(message, session, stream_callback, state, resume_args)
+
+    @staticmethod
+    def _is_resume_failure(result: Dict[str, Any]) -> bool:
+        """Whether a failed run was rejected because the resumed conversation no longer exists"""
+        error = (result.get("error") or "").lower()
+        return "no conversation found" in error or ("session" in error and "not found" in error)
+
+    def get_stream_snapshot(self, session_id: str) -> Optional[Dict[str, Any]]:
+        """Text streamed so far by the session's in-flight run, for clients that need to resync"""
+        state = self.active_streams.get(session_id)
+        if state is None:
+            return None
+        return {"session_id": session_id, "seq": state.seq, "content": state.text}
 
+    async def _execute_pooled_turn(
+        self, message: str, session: ChatSession, worker, stream_callback=None, state: Optional[StreamState] = None
+    ) -> Dict[str, Any]:
+        """Execute a turn over a persistent worker's stdin"""
+        state = state or StreamState()
+        recording = self.recorder.start(message, "pool")
+        async with worker.lock:
             try:
-                # Format message as JSONL (JSON Lines)
-                jsonl_message = json.dumps({"content": message, "type": "user"}) + "\n"
-
-                # Send the JSONL message to Claude CLI and close stdin
-                stdout, stderr = await asyncio.wait_for(
-                    process.communicate(input=jsonl_message.encode("utf-8")),
-                    timeout=180.0,  # Increased timeout for complex operations like arxiv search
-                )
+                on_line = recording.add if recording is not None else None
+                async for event in worker.run_turn(message, timeout=self.run_timeout, on_line=on_line):
+                    await self._handle_cli_event(event, state, stream_callback)
             except asyncio.TimeoutError:
-                process.kill()
-                await process.wait()
-                return self._create_error_response("Command timed out after 120 seconds")
-
-            # Process results
-            stdout_text = stdout.decode("utf-8", errors="replace").strip()
-            stderr_text = stderr.decode("utf-8", errors="replace").strip()
-
-            if process.returncode == 0:
-                # Parse streaming JSON output if available
-                response = self._parse_streaming_json_output(stdout_text) or stdout_text or "Command executed successfully"
-                return {"success": True, "response": response, "error": None, "session_id": session.session_id}
-            else:
-                error_msg = stderr_text or f"Command failed with exit code {process.returncode}"
-                return {"success": False, "response": stdout_text, "error": error_msg, "session_id": session.session_id}
-
-        except Exception as e:
-            logger.error(f"Error executing real Claude CLI: {e}")
-            return self._create_error_response(str(e))
+                state.resources = worker.turn_usage()
+                await self.worker_pool.discard(worker)
+                state.status = "timeout"
+                return self._create_error_response(self._timeout_message())
+            except WorkerDiedError as e:
+                state.resources = worker.turn_usage()
+                await self.worker_pool.discard(worker)
+                return {
+                    "success": False,
+                    "response": state.text,
+                    "error": str(e),
+                    "session_id": session.session_id,
+                }
+            except BaseException:
+                # Turn abandoned mid-stream: the worker's output is no longer in sync
+                await self.worker_pool.discard(worker)
+                raise
+
+            state.resources = worker.turn_usage()
+
+        if recording is not None:
+            await recording.finish(0)
+        response_text = state.text
+        final_response = state.full_response or response_text or "Command executed successfully"
+        if state.is_error:
+            return {
+                "success": False,
+                "response": response_text,
+                "error": final_response,
+                "session_id": session.session_id,
+            }
+        return {"success": True, "response": final_response, "error": None, "session_id": session.session_id}
+
+    async def _handle_cli_event(self, event: CLIEvent, state: StreamState, stream_callback=None):
+        """Accumulate one typed CLI event into ``state`` and forward it to the stream callback as deltas"""
+        now = time.monotonic()
+        if state.first_event_at is None:
+            state.first_event_at = now
+            FIRST_EVENT.observe(now - state.started_at)
+        if state.pending_tool is not None:
+            # A tool call lasts until the CLI reports anything else
+            name, tool_started = state.pending_tool
+            TOOL_DURATION.observe(now - tool_started, tool=name)
+            state.pending_tool = None
+        handler = self._cli_event_handlers.get(type(event))
+        if handler is not None:
+            await handler(event, state, stream_callback)
+
+    async def _on_assistant_message(self, event: AssistantMessage, state: StreamState, stream_callback):
+        for text in event.texts:
+            if state.first_text_at is None:
+                state.first_text_at = time.monotonic()
+                FIRST_TEXT.observe(state.first_text_at - state.started_at)
+            state.text_bytes += len(text.encode("utf-8"))
+            state.parts.append(text)
+            state.seq += 1
+            if stream_callback:
+                await stream_callback({"type": "text", "seq": state.seq, "content": text})
+        for tool_use in event.tool_uses:
+            await self._on_tool_use(tool_use, state, stream_callback)
+
+    async def _on_tool_use(self, event: ToolUse, state: StreamState, stream_callback):
+        state.pending_tool = (event.name, time.monotonic())
+        state.seq += 1
+        # Stream tool usage information
+        if stream_callback:
+            await stream_callback(
+                {"type": "tool_use", "seq": state.seq, "tool_name": event.name, "parameters": event.parameters}
+            )
 
-    def _parse_streaming_json_output(self, output: str) -> str:
-        """Parse streaming JSON output from Claude CLI"""
-        try:
-            # Claude CLI streaming output consists of multiple JSON events
-            lines = output.strip().split("\n")
-            response_text = ""
-
-            for line in lines:
-                line = line.strip()
-                if not line:
-                    continue
-
-                try:
-                    event = json.loads(line)
-                    # Look for assistant message result
-                    if event.get("type") == "result":
-                        result = event.get("result", "")
-                        if result:
-                            return result
-                    # Also check for assistant messages
-                    elif event.get("type") == "assistant":
-                        message = event.get("message", {})
-                        content = message.get("content", [])
-                        for item in content:
-                            if item.get("type") == "text":
-                                response_text += item.get("text", "")
-                except json.JSONDecodeError:
-                    continue
-
-            return response_text.strip() if response_text else None
+    async def _on_result(self, event: ResultEvent, state: StreamState, stream_callback):
+        if event.result:
+            state.full_response = event.result
+        state.is_error = event.is_error
+        # The CLI reports its own conversation id on the init and result events
+        if event.session_id:
+            state.cli_session_id = event.session_id
 
-        except Exception as e:
-            logger.warning(f"Failed to parse streaming JSON output: {e}")
-            return None
+    async def _on_system(self, event: SystemEvent, state: StreamState, stream_callback):
+        if event.session_id:
+            state.cli_session_id = event.session_id
 
     async def _execute_real_claude_cli_streaming(
-        self, message: str, session: ChatSession, stream_callback=None
+        self,
+        message: str,
+        session: ChatSession,
+        stream_callback=None,
+        state: Optional[StreamState] = None,
+        resume_args: Optional[List[str]] = None,
     ) -> Dict[str, Any]:
-        """Execute real Claude Code CLI command with streaming support"""
+        """Execute real Claude Code CLI command with streaming support.
+
+        stdout is parsed event by event as lines arrive while stderr is drained
+        concurrently into a bounded buffer, all under one deadline of ``run_timeout``.
+        """
+        process = None
+        stderr_task = None
+        # Own process group (and cgroup if configured) so timeouts and cancellation can kill MCP children too
+        sandbox = RunSandbox(self.run_limits, self.cgroups)
         try:
             # Claude CLI with streaming JSON input mode, skip permissions, and MCP config
-            mcp_config_path = os.path.join(os.path.dirname(os.path.dirname(__file__)), ".mcp.json")
-            cmd = self.claude_command + [
-                "-p",
-                "--output-format",
-                "stream-json",
-                "--verbose",
-                "--dangerously-skip-permissions",
-                "--mcp-config",
-                mcp_config_path,
-            ]
+            cmd = self.claude_command + ["-p"] + self._cli_common_args() + (resume_args or [])
 
             # Setup environment (no API key needed for authenticated session)
             env = os.environ.copy()
+            if self.mcp_gateway is not None:
+                env.update(self.mcp_gateway.workspace_env(session.working_dir))
 
             # Execute with streaming
+            spawn_started = time.monotonic()
             process = await asyncio.create_subprocess_exec(
                 *cmd,
                 stdin=asyncio.subprocess.PIPE,
@@ -255,87 +645,109 @@ class AdvancedClaudeCodeManager:
                 stderr=asyncio.subprocess.PIPE,
                 cwd=session.working_dir,
                 env=env,
+                limit=STREAM_LIMIT,
+                **sandbox.spawn_kwargs(),
             )
+            PROCESS_SPAWN.observe(time.monotonic() - spawn_started, mode="oneshot")
+            self.live_processes += 1
+            sandbox.attach(process)
+            stderr_tail: Deque[str] = deque(maxlen=STDERR_TAIL_LINES)
+            stderr_task = asyncio.create_task(drain_to_ring(process.stderr, stderr_tail))
 
             # Format message as JSONL (JSON Lines)
-            jsonl_message = json.dumps({"content": message, "type": "user"}) + "\n"
-
-            # Send the JSONL message and read response streaming
-            process.stdin.write(jsonl_message.encode("utf-8"))
-            await process.stdin.drain()
-            process.stdin.close()
-
-            response_text = ""
-            full_response = ""
-
-            # Stream stdout
-            while True:
-                try:
-                    line = await asyncio.wait_for(process.stdout.readline(), timeout=1.0)
-                    if not line:
-                        break
-
-                    line_str = line.decode("utf-8", errors="replace").strip()
-                    if not line_str:
-                        continue
-
-                    try:
-                        event = json.loads(line_str)
-
-                        # Handle different event types
-                        if event.get("type") == "assistant":
-                            message_data = event.get("message", {})
-                            content = message_data.get("content", [])
-                            for item in content:
-                                if item.get("type") == "text":
-                                    text = item.get("text", "")
-                                    response_text += text
-                                    if stream_callback:
-                                        await stream_callback({"type": "text", "content": text, "accumulated": response_text})
-
-                        elif event.get("type") == "tool_use":
-                            # Stream tool usage information
-                            if stream_callback:
-                                await stream_callback(
-                                    {
-                                        "type": "tool_use",
-                                        "tool_name": event.get("name", ""),
-                                        "parameters": event.get("parameters", {}),
-                                    }
-                                )
-
-                        elif event.get("type") == "result":
-                            result = event.get("result", "")
-                            if result:
-                                full_response = result
-
-                    except json.JSONDecodeError:
-                        logger.debug(f"Could not parse JSON line: {line_str}")
-
-                except asyncio.TimeoutError:
-                    # Check if process is still running
-                    if process.returncode is not None:
-                        break
-                    continue
-
-            # Wait for process to complete
-            await process.wait()
-
-            # Get any remaining stderr
-            stderr = await process.stderr.read()
-            stderr_text = stderr.decode("utf-8", errors="replace").strip()
-
-            if process.returncode == 0:
+            jsonl_message = dumps({"content": message, "type": "user"}) + b"\n"
+
+            state = state or StreamState()
+            recording = self.recorder.start(message, "oneshot")
+
+            try:
+                async with asyncio.timeout(self.run_timeout):
+                    # Send the JSONL message and read response streaming
+                    process.stdin.write(jsonl_message)
+                    await process.stdin.drain()
+                    process.stdin.close()
+
+                    saw_result = False
+                    async for line in iter_lines(process.stdout):
+                        if recording is not None:
+                            recording.add(line)
+                        if not line.strip():
+                            continue
+                        try:
+                            event = decode_cli_event(line)
+                        except DecodeError:
+                            logger.debug(f"Could not parse JSON line: {line[:200]!r}")
+                            continue
+                        if event is not None:
+                            await self._handle_cli_event(event, state, stream_callback)
+                        if isinstance(event, ResultEvent):
+                            # Done; a stray descendant holding stdout open must not keep the run alive
+                            saw_result = True
+                            break
+            except TimeoutError:
+                sandbox.kill()
+                state.status = "timeout"
+                return {
+                    "success": False,
+                    "response": state.text,
+                    "error": self._timeout_message(),
+                    "session_id": session.session_id,
+                }
+
+            # The output is complete. Exit and cleanup get their own short bounds outside the run's
+            # deadline, so a slow exit cannot turn an answer into a timeout. Last look at the tree first
+            sandbox.sample()
+            # stdout may close (or the result arrive) before the CLI has exited
+            await wait_for_exit(process, EXIT_GRACE_SECONDS)
+            exit_code = process.returncode
+            # Whatever the CLI left running (e.g. an MCP server) is a leak
+            sandbox.kill()
+            await wait_for_exit(process, EXIT_GRACE_SECONDS)
+            # Let stderr reach EOF for the error message; the finally block cancels it otherwise
+            await asyncio.wait({stderr_task}, timeout=EXIT_GRACE_SECONDS)
+            if exit_code is not None:
+                returncode = exit_code
+            elif saw_result:
+                # A CLI that hangs after its result has still answered
+                returncode = 0
+            else:
+                returncode = process.returncode if process.returncode is not None else -1
+            if recording is not None:
+                await recording.finish(returncode)
+
+            if returncode == 0:
                 # Use full_response if available, otherwise use accumulated response_text
-                final_response = full_response or response_text or "Command executed successfully"
+                final_response = state.full_response or state.text or "Command executed successfully"
                 return {"success": True, "response": final_response, "error": None, "session_id": session.session_id}
             else:
-                error_msg = stderr_text or f"Command failed with exit code {process.returncode}"
-                return {"success": False, "response": response_text, "error": error_msg, "session_id": session.session_id}
+                stderr_text = "\n".join(stderr_tail).strip()
+                error_msg = stderr_text or f"Command failed with exit code {returncode}"
+                return {
+                    "success": False,
+                    "response": state.text,
+                    "error": error_msg,
+                    "session_id": session.session_id,
+                }
 
+        except asyncio.CancelledError:
+            # Client cancelled or disconnected: stop the CLI and everything it started
+            sandbox.kill()
+            raise
         except Exception as e:
             logger.error(f"Error executing real Claude CLI with streaming: {e}")
+            sandbox.kill()
             return self._create_error_response(str(e))
+        finally:
+            if process is not None:
+                self.live_processes -= 1
+            if stderr_task is not None and not stderr_task.done():
+                stderr_task.cancel()
+            usage = await sandbox.close()
+            if state is not None:
+                state.resources = usage
+
+    def _timeout_message(self) -> str:
+        return f"Command timed out after {self.run_timeout:g} seconds"
 
     async def _execute_simulation_mode(self, message: str, session: ChatSession) -> Dict[str, Any]:
         """Execute in simulation mode when Claude CLI is not available"""
@@ -369,38 +781,53 @@ For now, I can echo your messages and provide guidance on using the system!"""
         """Create a standardized error response"""
         return {"success": False, "response": "", "error": error_message, "session_id": None}
 
-    def get_session_info(self, session_id: str) -> Optional[Dict[str, Any]]:
-        """Get information about a session"""
-        if session_id not in self.sessions:
-            return None
+    async def get_session_info(self, session_id: str) -> Optional[Dict[str, Any]]:
+        """Get information about a session, including sessions held by other workers"""
+        session = self.sessions.get(session_id)
+        if session is None:
+            return await self.session_store.get_session(session_id)
 
-        session = self.sessions[session_id]
         return {
             "session_id": session.session_id,
             "created_at": session.created_at,
             "last_activity": session.last_activity,
             "message_count": len(session.history),
             "working_dir": session.working_dir,
+            "cli_session_id": session.cli_session_id,
+            "resources": session.resources,
         }
 
-    def cleanup_session(self, session_id: str):
-        """Clean up a specific session"""
-        if session_id in self.sessions:
-            session = self.sessions[session_id]
-            try:
-                if os.path.exists(session.working_dir):
-                    shutil.rmtree(session.working_dir)
-                    logger.info(f"Cleaned up session {session_id} working directory")
-            except Exception as e:
-                logger.warning(f"Failed to cleanup session {session_id}: {e}")
-
-            del self.sessions[session_id]
-
-    def cleanup_all_sessions(self):
+    async def cleanup_session(self, session_id: str, forget: bool = True):
+        """Clean up a specific session.
+
+        Args:
+            session_id: Session to clean up.
+            forget: Also delete it from the session store. Shutdown and eviction keep
+                the record so conversations survive.
+        """
+        session = self.sessions.pop(session_id, None)
+        working_dir = session.working_dir if session is not None else None
+        if forget:
+            record = await self.session_store.get_session(session_id)
+            if record is not None:
+                working_dir = working_dir or record["working_dir"]
+                await self.session_store.delete_session(session_id)
+        if session is not None and self.worker_pool is not None:
+            self.worker_pool.release_session(session_id)
+        if forget and self.response_cache.enabled:
+            await self.response_cache.purge_session(session_id)
+        if working_dir is not None:
+            if self.mcp_gateway is not None:
+                await self.mcp_gateway.release_workspace(working_dir)
+            # Renamed away at once, deleted in the background
+            self.workspace_pool.release(working_dir)
+            logger.info(f"Cleaned up session {session_id} working directory")
+
+    async def cleanup_all_sessions(self):
         """Clean up all sessions"""
-        for session_id in list(self.sessions.keys()):
-            self.cleanup_session(session_id)
+        await asyncio.gather(*(self.cleanup_session(sid, forget=False) for sid in list(self.sessions.keys())))
 
-    def list_sessions(self) -> List[Dict[str, Any]]:
-        """List all active sessions"""
-        return [self.get_session_info(sid) for sid in self.sessions.keys()]
+    async def list_sessions(self, limit: int = 50, offset: int = 0) -> Dict[str, Any]:
+        """List sessions of every worker, most recently active first"""
+        sessions, total = await self.session_store.list_sessions(limit, offset)
+        return {"sessions": sessions, "total": total, "limit": limit, "offset": offset}
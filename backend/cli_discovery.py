@@ -0,0 +1,137 @@
+"""
+Asynchronous Claude Code CLI discovery with an on-disk result cache
+"""
+
+import asyncio
+import json
+import logging
+import os
+import shutil
+from typing import Any, Dict, List, Optional
+
+from health_monitor import run_probe
+
+logger = logging.getLogger(__name__)
+
+# Candidate commands in order of preference
+CANDIDATE_COMMANDS = ["claude", "npx @anthropic-ai/claude-code", "claude-code"]
+
+# Launchers that resolve the package when they run (from their own cache, a global or a local
+# install), so their binary's path and mtime say nothing about it: always probed, never cached
+UNCACHED_LAUNCHERS = {"npx"}
+
+DEFAULT_CACHE_PATH = os.path.join(os.path.expanduser("~"), ".cache", "llm-assistant", "cli_discovery.json")
+
+
+def _binary_fingerprint(command: List[str]) -> Optional[Dict[str, Any]]:
+    """Resolve the executable of ``command`` and return its path and mtime"""
+    path = shutil.which(command[0])
+    if path is None:
+        return None
+    try:
+        mtime = os.stat(path).st_mtime
+    except OSError:
+        return None
+    return {"path": os.path.realpath(path), "mtime": mtime}
+
+
+def _cacheable(command: str) -> bool:
+    return command.split()[0] not in UNCACHED_LAUNCHERS
+
+
+class CLIDiscovery:
+    """Finds a working Claude Code CLI by probing every candidate concurrently.
+
+    Successful probes are cached on disk keyed by the resolved binary path and its
+    mtime, so a restart with an unchanged installation needs no subprocess at all.
+    Candidates run through a launcher such as ``npx`` are probed every time.
+    """
+
+    def __init__(self, cache_path: Optional[str] = None, timeout: Optional[float] = None):
+        self.cache_path = cache_path or os.getenv("CLAUDE_DISCOVERY_CACHE", DEFAULT_CACHE_PATH)
+        self.timeout = timeout if timeout is not None else float(os.getenv("CLAUDE_DISCOVERY_TIMEOUT", 5))
+
+    def _load_cache(self) -> Dict[str, Any]:
+        try:
+            with open(self.cache_path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _save_cache(self, cache: Dict[str, Any]):
+        try:
+            os.makedirs(os.path.dirname(self.cache_path), exist_ok=True)
+            tmp_path = self.cache_path + ".tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(cache, f)
+            os.replace(tmp_path, self.cache_path)
+        except OSError as e:
+            logger.warning(f"Failed to write CLI discovery cache: {e}")
+
+    async def _probe(self, command: List[str]) -> Optional[str]:
+        """Return the version string if ``command --version`` succeeds"""
+        try:
+            returncode, stdout = await run_probe(command + ["--version"], self.timeout)
+        except (FileNotFoundError, PermissionError, asyncio.TimeoutError):
+            return None
+        return stdout if returncode == 0 else None
+
+    async def discover(self, candidates: Optional[List[str]] = None) -> Optional[List[str]]:
+        """Find the preferred working CLI command.
+
+        Args:
+            candidates: Command strings in order of preference. Defaults to CANDIDATE_COMMANDS.
+
+        Returns:
+            The command as an argv list, or None if no candidate works.
+        """
+        candidates = candidates or CANDIDATE_COMMANDS
+        cache = await asyncio.to_thread(self._load_cache)
+        fingerprints = {cmd: await asyncio.to_thread(_binary_fingerprint, cmd.split()) for cmd in candidates}
+
+        results: Dict[str, Optional[str]] = {}
+        pending = {}
+        for cmd in candidates:
+            fingerprint = fingerprints[cmd]
+            if fingerprint is None:
+                results[cmd] = None
+                continue
+            cached = cache.get(cmd) if _cacheable(cmd) else None
+            if cached and cached.get("path") == fingerprint["path"] and cached.get("mtime") == fingerprint["mtime"]:
+                results[cmd] = cached.get("version") or ""
+                continue
+            pending[cmd] = asyncio.create_task(self._probe(cmd.split()))
+
+        for cmd in candidates:
+            # Stop as soon as the most preferred candidate that can still win is known
+            if cmd in pending:
+                results[cmd] = await pending.pop(cmd)
+            if results.get(cmd) is not None:
+                break
+
+        for task in pending.values():
+            task.cancel()
+
+        changed = False
+        for cmd, version in results.items():
+            fingerprint = fingerprints[cmd]
+            if not _cacheable(cmd):
+                # Drop entries written before the launcher was excluded
+                changed |= cache.pop(cmd, None) is not None
+                continue
+            if version is None or fingerprint is None:
+                continue
+            entry = {**fingerprint, "version": version}
+            if cache.get(cmd) != entry:
+                cache[cmd] = entry
+                changed = True
+        if changed:
+            await asyncio.to_thread(self._save_cache, cache)
+
+        for cmd in candidates:
+            if results.get(cmd) is not None:
+                logger.info(f"Found Claude Code CLI: {cmd}")
+                return cmd.split()
+
+        logger.warning("Claude Code CLI not found")
+        return None
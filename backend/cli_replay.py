@@ -0,0 +1,120 @@
+"""
+Recording of CLI stream-json transcripts and their replay by the stub CLI
+"""
+
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import sys
+import time
+from typing import Any, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+TRANSCRIPT_VERSION = 1
+
+# Command line of the replaying stub, selected with CLAUDE_CLI_COMMAND=stub
+STUB_COMMAND = [sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)), "stub_claude.py")]
+
+
+def normalize_prompt(prompt: str) -> str:
+    return " ".join(prompt.split())
+
+
+class Recording:
+    """stdout lines of one CLI run with their offsets from the start of the run"""
+
+    def __init__(self, path: str, prompt: str, mode: str):
+        self.path = path
+        self.prompt = prompt
+        self.mode = mode
+        self.started = time.monotonic()
+        self.frames: List[Dict[str, Any]] = []
+
+    def add(self, line: bytes):
+        self.frames.append({"t": round(time.monotonic() - self.started, 4), "out": line.decode("utf-8", errors="replace")})
+
+    async def finish(self, exit_code: Optional[int]):
+        """Write the transcript; failures are logged, never raised into the run"""
+        try:
+            await asyncio.to_thread(self._write, exit_code)
+        except OSError as e:
+            logger.warning(f"Failed to save CLI transcript {self.path}: {e}")
+
+    def _write(self, exit_code: Optional[int]):
+        header = {
+            "type": "transcript",
+            "version": TRANSCRIPT_VERSION,
+            "prompt": self.prompt,
+            "mode": self.mode,
+            "recorded_at": time.time(),
+        }
+        footer = {"t": round(time.monotonic() - self.started, 4), "exit": exit_code}
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            for record in (header, *self.frames, footer):
+                f.write(json.dumps(record, ensure_ascii=False) + "\n")
+        os.replace(tmp_path, self.path)
+
+
+class TranscriptRecorder:
+    """Saves the stream-json output of real CLI runs for the stub CLI to replay.
+
+    Enabled by setting ``CLAUDE_RECORD_DIR``; every completed run (one-shot or pooled)
+    becomes one JSONL file in that directory.
+    """
+
+    def __init__(self, directory: Optional[str] = None):
+        self.directory = directory if directory is not None else os.getenv("CLAUDE_RECORD_DIR", "")
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.directory)
+
+    def start(self, prompt: str, mode: str) -> Optional[Recording]:
+        if not self.enabled:
+            return None
+        digest = hashlib.sha1(normalize_prompt(prompt).encode("utf-8")).hexdigest()[:8]
+        name = f"{time.strftime('%Y%m%d-%H%M%S')}-{time.monotonic_ns() % 10**6:06d}-{digest}.jsonl"
+        return Recording(os.path.join(self.directory, name), prompt, mode)
+
+
+def load_transcript(path: str) -> Dict[str, Any]:
+    """Read one transcript file into ``{"prompt", "frames", "exit"}``"""
+    with open(path, "r", encoding="utf-8") as f:
+        records = [json.loads(line) for line in f if line.strip()]
+    if not records or records[0].get("type") != "transcript":
+        raise ValueError(f"{path} is not a CLI transcript")
+    frames = [r for r in records[1:] if "out" in r]
+    footer = next((r for r in reversed(records) if "exit" in r), {})
+    return {"prompt": records[0].get("prompt", ""), "frames": frames, "exit": footer.get("exit") or 0}
+
+
+def load_transcripts(path: str) -> List[Dict[str, Any]]:
+    """Load a transcript file, or every ``*.jsonl`` transcript in a directory (sorted by name)"""
+    if os.path.isdir(path):
+        paths = sorted(os.path.join(path, name) for name in os.listdir(path) if name.endswith(".jsonl"))
+    else:
+        paths = [path]
+    transcripts = []
+    for transcript_path in paths:
+        try:
+            transcripts.append(load_transcript(transcript_path))
+        except (OSError, ValueError) as e:
+            logger.warning(f"Skipping transcript {transcript_path}: {e}")
+    return transcripts
+
+
+def synthetic_transcript(prompt: str, chunks: int, first_delay: float, interval: float) -> Dict[str, Any]:
+    """A made-up run for when no recordings exist: init, ``chunks`` text deltas, result"""
+    words = [f"chunk{i} " for i in range(chunks)]
+    frames = [{"t": 0.0, "out": json.dumps({"type": "system", "subtype": "init", "session_id": ""})}]
+    for i, word in enumerate(words):
+        event = {"type": "assistant", "message": {"role": "assistant", "content": [{"type": "text", "text": word}]}}
+        frames.append({"t": round(first_delay + i * interval, 4), "out": json.dumps(event)})
+    result = {"type": "result", "subtype": "success", "result": "".join(words), "is_error": False, "session_id": ""}
+    frames.append({"t": round(first_delay + chunks * interval, 4), "out": json.dumps(result)})
+    return {"prompt": prompt, "frames": frames, "exit": 0}
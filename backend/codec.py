@@ -0,0 +1,201 @@
+"""
+JSON codec for CLI stream events and WebSocket frames
+"""
+
+import json
+import logging
+import os
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Optional, Union
+
+logger = logging.getLogger(__name__)
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import msgspec
+except ImportError:
+    msgspec = None
+
+
+class DecodeError(ValueError):
+    """Raised when a line is not valid JSON, whichever backend decoded it"""
+
+
+class JSONCodec:
+    """Standard library backend; always available"""
+
+    name = "json"
+
+    def __init__(self):
+        # ASCII output keeps the C encoder on its fast path and makes the bytes conversion a copy
+        self._decode = json.JSONDecoder().decode
+        self._encode = json.JSONEncoder(separators=(",", ":")).encode
+
+    def loads(self, data: Union[bytes, str]) -> Any:
+        try:
+            return self._decode(data.decode("utf-8") if isinstance(data, bytes) else data)
+        except ValueError as e:
+            raise DecodeError(str(e)) from e
+
+    def dumps(self, obj: Any) -> bytes:
+        return self._encode(obj).encode("ascii")
+
+    def dumps_text(self, obj: Any) -> str:
+        """Encode for a text WebSocket frame, without a bytes round trip"""
+        return self._encode(obj)
+
+
+class OrjsonCodec(JSONCodec):
+    name = "orjson"
+
+    def loads(self, data: Union[bytes, str]) -> Any:
+        try:
+            return orjson.loads(data)
+        except orjson.JSONDecodeError as e:
+            raise DecodeError(str(e)) from e
+
+    def dumps(self, obj: Any) -> bytes:
+        return orjson.dumps(obj)
+
+    def dumps_text(self, obj: Any) -> str:
+        return orjson.dumps(obj).decode("utf-8")
+
+
+class MsgspecCodec(JSONCodec):
+    name = "msgspec"
+
+    def __init__(self):
+        super().__init__()
+        self._decoder = msgspec.json.Decoder()
+        self._encoder = msgspec.json.Encoder()
+
+    def loads(self, data: Union[bytes, str]) -> Any:
+        try:
+            return self._decoder.decode(data)
+        except msgspec.DecodeError as e:
+            raise DecodeError(str(e)) from e
+
+    def dumps(self, obj: Any) -> bytes:
+        return self._encoder.encode(obj)
+
+    def dumps_text(self, obj: Any) -> str:
+        return self._encoder.encode(obj).decode("utf-8")
+
+
+AVAILABLE_CODECS: Dict[str, Callable[[], JSONCodec]] = {"json": JSONCodec}
+if orjson is not None:
+    AVAILABLE_CODECS["orjson"] = OrjsonCodec
+if msgspec is not None:
+    AVAILABLE_CODECS["msgspec"] = MsgspecCodec
+
+
+def select_codec(name: Optional[str] = None) -> JSONCodec:
+    """Pick a codec by name, or the fastest installed one for ``auto``.
+
+    Args:
+        name: ``auto``, ``msgspec``, ``orjson`` or ``json``. Defaults to ``JSON_CODEC``.
+    """
+    name = (name or os.getenv("JSON_CODEC", "auto")).lower()
+    if name == "auto":
+        for candidate in ("msgspec", "orjson", "json"):
+            if candidate in AVAILABLE_CODECS:
+                return AVAILABLE_CODECS[candidate]()
+    if name not in AVAILABLE_CODECS:
+        logger.warning(f"JSON codec '{name}' is not installed, using the standard library")
+        return JSONCodec()
+    return AVAILABLE_CODECS[name]()
+
+
+codec = select_codec()
+
+
+def loads(data: Union[bytes, str]) -> Any:
+    return codec.loads(data)
+
+
+def dumps(obj: Any) -> bytes:
+    return codec.dumps(obj)
+
+
+def dumps_text(obj: Any) -> str:
+    return codec.dumps_text(obj)
+
+
+# Typed Claude CLI stream-json events
+
+
+@dataclass(slots=True)
+class ToolUse:
+    name: str
+    parameters: Dict[str, Any] = field(default_factory=dict)
+
+
+@dataclass(slots=True)
+class AssistantMessage:
+    texts: List[str] = field(default_factory=list)
+    tool_uses: List[ToolUse] = field(default_factory=list)
+
+
+@dataclass(slots=True)
+class ResultEvent:
+    result: str = ""
+    is_error: bool = False
+    session_id: Optional[str] = None
+
+
+@dataclass(slots=True)
+class SystemEvent:
+    subtype: str = ""
+    session_id: Optional[str] = None
+
+
+CLIEvent = Union[AssistantMessage, ToolUse, ResultEvent, SystemEvent]
+
+
+def _parse_assistant(data: Dict[str, Any]) -> AssistantMessage:
+    event = AssistantMessage()
+    for item in (data.get("message") or {}).get("content") or ():
+        kind = item.get("type")
+        if kind == "text":
+            event.texts.append(item.get("text", ""))
+        elif kind == "tool_use":
+            event.tool_uses.append(ToolUse(item.get("name", ""), item.get("input") or {}))
+    return event
+
+
+def _parse_tool_use(data: Dict[str, Any]) -> ToolUse:
+    return ToolUse(data.get("name", ""), data.get("parameters") or {})
+
+
+def _parse_result(data: Dict[str, Any]) -> ResultEvent:
+    return ResultEvent(data.get("result") or "", bool(data.get("is_error")), data.get("session_id"))
+
+
+def _parse_system(data: Dict[str, Any]) -> SystemEvent:
+    return SystemEvent(data.get("subtype", ""), data.get("session_id"))
+
+
+# stream-json "type" -> parser; other event types are ignored
+CLI_EVENT_PARSERS: Dict[str, Callable[[Dict[str, Any]], CLIEvent]] = {
+    "assistant": _parse_assistant,
+    "tool_use": _parse_tool_use,
+    "result": _parse_result,
+    "system": _parse_system,
+}
+
+
+def decode_cli_event(line: bytes) -> Optional[CLIEvent]:
+    """Decode one stream-json line into a typed event, or None for events we do not use.
+
+    Raises:
+        DecodeError: If the line is not valid JSON.
+    """
+    data = codec.loads(line)
+    if not isinstance(data, dict):
+        return None
+    parser = CLI_EVENT_PARSERS.get(data.get("type"))
+    return parser(data) if parser is not None else None
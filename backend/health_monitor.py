@@ -0,0 +1,128 @@
+"""
+Background readiness monitor for the Claude Code CLI
+"""
+
+import asyncio
+import logging
+import os
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+async def run_probe(command: List[str], timeout: float) -> Tuple[int, str]:
+    """Run a short CLI command without blocking the event loop.
+
+    Args:
+        command: Command line to execute.
+        timeout: Seconds to wait before killing the process.
+
+    Returns:
+        Tuple of (return code, decoded stdout).
+
+    Raises:
+        FileNotFoundError: If the executable does not exist.
+        asyncio.TimeoutError: If the command did not finish in time.
+    """
+    process = await asyncio.create_subprocess_exec(
+        *command,
+        stdin=asyncio.subprocess.DEVNULL,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.DEVNULL,
+    )
+    try:
+        stdout, _ = await asyncio.wait_for(process.communicate(), timeout=timeout)
+    except asyncio.TimeoutError:
+        process.kill()
+        await process.wait()
+        raise
+    except asyncio.CancelledError:
+        if process.returncode is None:
+            process.kill()
+        raise
+    return process.returncode, stdout.decode("utf-8", errors="replace").strip()
+
+
+class CLIHealthMonitor:
+    """Periodically probes CLI readiness and serves the cached result from memory.
+
+    ``snapshot`` never spawns a process: it returns the last probe result and, when that
+    result is older than the TTL, asks the background loop to refresh it. A failed run
+    can call ``report_failure`` to get an immediate re-probe.
+    """
+
+    def __init__(
+        self,
+        interval: Optional[float] = None,
+        ttl: Optional[float] = None,
+        probe_timeout: Optional[float] = None,
+    ):
+        self.interval = interval if interval is not None else float(os.getenv("CLAUDE_HEALTH_INTERVAL", 60))
+        self.ttl = ttl if ttl is not None else float(os.getenv("CLAUDE_HEALTH_TTL", 120))
+        self.probe_timeout = (
+            probe_timeout if probe_timeout is not None else float(os.getenv("CLAUDE_HEALTH_PROBE_TIMEOUT", 10))
+        )
+        self.command: List[str] = []
+        self._status: Dict[str, Any] = {
+            "authenticated": True,
+            "message": "Claude CLI status not checked yet",
+            "checked_at": None,
+        }
+        self._refresh = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self, command: List[str]):
+        """Start the background probe loop for ``command``"""
+        self.command = command
+        self._refresh.set()
+        self._task = asyncio.create_task(self._loop())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Return the cached CLI status, scheduling a refresh if it has expired"""
+        checked_at = self._status["checked_at"]
+        if checked_at is not None and time.time() - checked_at > self.ttl:
+            self._refresh.set()
+        return self._status
+
+    def report_failure(self):
+        """Request an immediate re-probe after a failed CLI run"""
+        self._refresh.set()
+
+    async def probe(self) -> Dict[str, Any]:
+        """Probe the CLI once and update the cached status"""
+        try:
+            returncode, _ = await run_probe(self.command + ["--help"], self.probe_timeout)
+            if returncode == 0:
+                status = {"authenticated": True, "message": "Claude CLI is ready"}
+            else:
+                status = {
+                    "authenticated": False,
+                    "message": "Run 'claude auth' to authenticate with your Claude Pro/Max account or Anthropic Console",
+                }
+        except Exception as e:
+            status = {"authenticated": False, "message": f"Authentication check failed: {str(e) or type(e).__name__}"}
+
+        status["checked_at"] = time.time()
+        if status["authenticated"] != self._status["authenticated"]:
+            logger.info(f"Claude CLI status changed: {status['message']}")
+        self._status = status
+        return status
+
+    async def _loop(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._refresh.wait(), timeout=self.interval)
+            except asyncio.TimeoutError:
+                pass
+            self._refresh.clear()
+            await self.probe()
@@ -2,16 +2,26 @@
 FastAPI backend for LLM Assistant Bot
 """
 
-import json
+import asyncio
 import logging
+import os
+import uuid
+from collections import deque
 from contextlib import asynccontextmanager
-from typing import Dict
+from typing import AsyncIterator, Deque, Dict, Optional
 
 from claude_integration import AdvancedClaudeCodeManager
+from codec import dumps, dumps_text, loads
 from dotenv import load_dotenv
-from fastapi import FastAPI, HTTPException, WebSocket, WebSocketDisconnect
+from fastapi import FastAPI, HTTPException, Query, Request, Response, WebSocket, WebSocketDisconnect
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
+from metrics import registry
 from pydantic import BaseModel
+from response_cache import CACHE_BYPASS, CACHE_MODES, CACHE_REFRESH, CACHE_USE
+from scheduler import SchedulerBusyError
+from session_bus import SessionBus
+from stream_batcher import StreamBatcher, batching_stats
 
 # Load environment variables
 load_dotenv()
@@ -28,10 +38,12 @@ claude_manager = AdvancedClaudeCodeManager()
 async def lifespan(app: FastAPI):
     # Startup
     logger.info("Starting LLM Assistant Bot...")
+    await claude_manager.start()
     yield
     # Shutdown
     logger.info("Shutting down...")
-    claude_manager.cleanup_all_sessions()
+    await claude_manager.cleanup_all_sessions()
+    await claude_manager.shutdown()
 
 
 app = FastAPI(title="LLM Assistant Bot", version="0.1.0", lifespan=lifespan)
@@ -45,39 +57,209 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Warm MCP servers shared by every CLI run
+if claude_manager.mcp_gateway is not None:
+    app.mount("/mcp", claude_manager.mcp_gateway.app)
+
 
 # Models
 class ChatMessage(BaseModel):
     message: str
     session_id: str = "default"
+    priority: int = 0
+
+
+# Frame types that may be dropped when a client cannot keep up; the final response never is
+DROPPABLE_FRAME_TYPES = {"stream", "stream_batch"}
+
+# Idle interval after which a streaming HTTP response sends a keepalive
+STREAM_KEEPALIVE_SECONDS = float(os.getenv("STREAM_KEEPALIVE_SECONDS", 15))
+
+
+def cache_mode_from_headers(request: Request) -> str:
+    """Response cache mode of a REST request.
+
+    ``X-Response-Cache: use|refresh|bypass`` sets it explicitly; otherwise
+    ``Cache-Control: no-store`` bypasses the cache and ``no-cache`` refreshes it.
+    """
+    explicit = request.headers.get("x-response-cache", "").strip().lower()
+    if explicit in CACHE_MODES:
+        return explicit
+    directives = {d.strip().lower() for d in request.headers.get("cache-control", "").split(",")}
+    if "no-store" in directives:
+        return CACHE_BYPASS
+    if "no-cache" in directives:
+        return CACHE_REFRESH
+    return CACHE_USE
+
+
+class ClientConnection:
+    """A WebSocket plus its own bounded send queue and sender task.
+
+    Producers only enqueue, so a slow browser never stalls the CLI stdout reader or
+    other clients. When the queue is full, intermediate stream frames are dropped
+    (clients detect the seq gap and resync) or, with the ``disconnect`` policy, the
+    client is closed. Non-droppable frames evict the oldest droppable frame instead.
+    """
+
+    def __init__(self, websocket: WebSocket, client_id: str, max_queue: int, overflow_policy: str, binary: bool = True):
+        self.websocket = websocket
+        self.client_id = client_id
+        self.max_queue = max_queue
+        self.overflow_policy = overflow_policy
+        self.binary = binary
+        self.queue: Deque[dict] = deque()
+        self.dropped = 0
+        self._ready = asyncio.Event()
+        self._task = asyncio.create_task(self._sender())
+
+    def enqueue(self, message: dict) -> bool:
+        """Queue a frame for sending. Returns False if it was dropped."""
+        if len(self.queue) >= self.max_queue:
+            if self.overflow_policy == "disconnect":
+                logger.warning(f"Client {self.client_id} send queue overflow, disconnecting")
+                self.close()
+                return False
+            if message.get("type") in DROPPABLE_FRAME_TYPES:
+                self.dropped += 1
+                return False
+            for index, queued in enumerate(self.queue):
+                if queued.get("type") in DROPPABLE_FRAME_TYPES:
+                    del self.queue[index]
+                    self.dropped += 1
+                    break
+        self.queue.append(message)
+        self._ready.set()
+        return True
+
+    async def _sender(self):
+        try:
+            while True:
+                await self._ready.wait()
+                while self.queue:
+                    message = self.queue.popleft()
+                    # Each client gets the frame type it asked for without a bytes <-> str round trip
+                    if self.binary:
+                        await self.websocket.send_bytes(dumps(message))
+                    else:
+                        await self.websocket.send_text(dumps_text(message))
+                self._ready.clear()
+        except Exception as e:
+            logger.debug(f"Sender for client {self.client_id} stopped: {e}")
+
+    def stop(self):
+        """Stop the sender task"""
+        self._task.cancel()
+        self.queue.clear()
+
+    def close(self):
+        """Stop sending and close the WebSocket"""
+        self.stop()
+        asyncio.create_task(self._close_socket())
+
+    async def _close_socket(self):
+        try:
+            await self.websocket.close()
+        except Exception:
+            pass
 
 
 # WebSocket connection manager
 class ConnectionManager:
-    def __init__(self):
-        self.active_connections: Dict[str, WebSocket] = {}
-
-    async def connect(self, websocket: WebSocket, client_id: str):
+    def __init__(self, max_queue: Optional[int] = None, overflow_policy: Optional[str] = None):
+        self.active_connections: Dict[str, ClientConnection] = {}
+        self.max_queue = max_queue if max_queue is not None else int(os.getenv("WS_SEND_QUEUE_SIZE", 256))
+        self.overflow_policy = overflow_policy or os.getenv("WS_OVERFLOW_POLICY", "drop_stream")
+        self.binary_frames = os.getenv("WS_FRAME_FORMAT", "binary").lower() == "binary"
+        self.dropped_frames = 0
+
+    async def connect(self, websocket: WebSocket, client_id: str) -> ClientConnection:
         await websocket.accept()
-        self.active_connections[client_id] = websocket
+        previous = self.active_connections.get(client_id)
+        if previous is not None:
+            # Reconnect with the same client id replaces the stale connection
+            previous.close()
+        connection = ClientConnection(websocket, client_id, self.max_queue, self.overflow_policy, self.binary_frames)
+        self.active_connections[client_id] = connection
         logger.info(f"Client {client_id} connected")
+        return connection
 
-    def disconnect(self, client_id: str):
-        if client_id in self.active_connections:
+    def disconnect(self, client_id: str, websocket: Optional[WebSocket] = None):
+        connection = self.active_connections.get(client_id)
+        if connection is not None and (websocket is None or connection.websocket is websocket):
+            connection.stop()
+            self.dropped_frames += connection.dropped
             del self.active_connections[client_id]
             logger.info(f"Client {client_id} disconnected")
 
     async def send_personal_message(self, message: dict, client_id: str):
         if client_id in self.active_connections:
-            await self.active_connections[client_id].send_text(json.dumps(message))
+            self.active_connections[client_id].enqueue(message)
 
     async def broadcast(self, message: dict):
-        for connection in self.active_connections.values():
-            await connection.send_text(json.dumps(message))
+        # Enqueueing never waits on the network, so every client is served concurrently
+        for connection in list(self.active_connections.values()):
+            connection.enqueue(message)
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "connections": len(self.active_connections),
+            "queued_frames": sum(len(c.queue) for c in self.active_connections.values()),
+            "dropped_frames": self.dropped_frames + sum(c.dropped for c in self.active_connections.values()),
+        }
 
 
 manager = ConnectionManager()
 
+# Run frames of each session, fanned out to every subscribed WebSocket
+session_bus = SessionBus(snapshot=claude_manager.get_stream_snapshot)
+
+
+def _cli_process_count() -> int:
+    count = claude_manager.live_processes
+    if claude_manager.worker_pool is not None:
+        pool = claude_manager.worker_pool.stats()
+        count += pool["spare"] + pool["pinned"]
+    return count
+
+
+def _response_cache_lookups():
+    stats = claude_manager.response_cache.stats()
+    return {("memory_hit",): stats["memory_hits"], ("disk_hit",): stats["disk_hits"], ("miss",): stats["misses"]}
+
+
+# Sampled on every scrape of GET /metrics
+registry.gauge("llm_assistant_active_sessions", "Sessions held in memory", lambda: len(claude_manager.sessions))
+registry.gauge("llm_assistant_cli_processes", "Live CLI processes (one-shot runs and pooled workers)", _cli_process_count)
+registry.gauge("llm_assistant_websocket_connections", "Open WebSocket connections", lambda: len(manager.active_connections))
+registry.gauge(
+    "llm_assistant_send_queue_depth", "Frames waiting in WebSocket send queues", lambda: manager.stats()["queued_frames"]
+)
+registry.gauge(
+    "llm_assistant_dropped_frames_total",
+    "Stream frames dropped for slow clients",
+    lambda: manager.stats()["dropped_frames"],
+    kind="counter",
+)
+registry.gauge(
+    "llm_assistant_session_subscribers",
+    "WebSocket subscriptions to session event streams",
+    lambda: session_bus.stats()["subscribers"],
+)
+registry.gauge(
+    "llm_assistant_scheduler_active_runs", "Runs holding an execution slot", lambda: claude_manager.scheduler.active
+)
+registry.gauge(
+    "llm_assistant_scheduler_queued_runs", "Runs waiting for an execution slot", lambda: claude_manager.scheduler.queued
+)
+registry.gauge(
+    "llm_assistant_response_cache_lookups_total",
+    "Response cache lookups by result",
+    _response_cache_lookups,
+    labels=["result"],
+    kind="counter",
+)
+
 
 # Routes
 @app.get("/")
@@ -90,16 +272,51 @@ async def health_check():
     return {"status": "healthy", "service": "llm-assistant-bot"}
 
 
+@app.get("/metrics")
+async def metrics():
+    """Prometheus metrics: request latency breakdown, CLI runs and live resource gauges"""
+    return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4")
+
+
+@app.get("/ready")
+async def readiness_check():
+    """Readiness probe: 200 once CLI discovery and startup have finished"""
+    status = {
+        "ready": claude_manager.ready,
+        "claude_cli_available": claude_manager.claude_cli_available,
+        "claude_cli": claude_manager.health_monitor.snapshot() if claude_manager.claude_cli_available else None,
+    }
+    if not claude_manager.ready:
+        return JSONResponse(status_code=503, content=status)
+    return status
+
+
+@app.get("/api/stats")
+async def get_stats():
+    """Streaming, connection and scheduling statistics"""
+    return {
+        "stream_batching": batching_stats.snapshot(),
+        "connections": manager.stats(),
+        "scheduler": claude_manager.scheduler.stats(),
+        "session_lanes": claude_manager.session_lanes.stats(),
+        "session_reaper": claude_manager.reaper.stats(),
+        "workspace_pool": claude_manager.workspace_pool.stats(),
+        "mcp_gateway": claude_manager.mcp_gateway.stats() if claude_manager.mcp_gateway is not None else None,
+        "response_cache": claude_manager.response_cache.stats(),
+        "session_bus": session_bus.stats(),
+    }
+
+
 @app.get("/api/sessions")
-async def list_sessions():
-    """List all active sessions"""
-    return {"sessions": claude_manager.list_sessions()}
+async def list_sessions(limit: int = Query(50, ge=1, le=500), offset: int = Query(0, ge=0)):
+    """List sessions, most recently active first"""
+    return await claude_manager.list_sessions(limit, offset)
 
 
 @app.get("/api/sessions/{session_id}")
 async def get_session_info(session_id: str):
     """Get information about a specific session"""
-    session_info = claude_manager.get_session_info(session_id)
+    session_info = await claude_manager.get_session_info(session_id)
     if session_info is None:
         raise HTTPException(status_code=404, detail="Session not found")
     return session_info
@@ -108,72 +325,266 @@ async def get_session_info(session_id: str):
 @app.delete("/api/sessions/{session_id}")
 async def delete_session(session_id: str):
     """Delete a specific session"""
-    session_info = claude_manager.get_session_info(session_id)
+    session_info = await claude_manager.get_session_info(session_id)
     if session_info is None:
         raise HTTPException(status_code=404, detail="Session not found")
 
-    claude_manager.cleanup_session(session_id)
+    await claude_manager.cleanup_session(session_id)
     return {"message": f"Session {session_id} deleted successfully"}
 
 
 @app.post("/api/chat")
-async def chat_endpoint(message: ChatMessage):
+async def chat_endpoint(message: ChatMessage, request: Request, response: Response):
     """Process chat message through Claude Code CLI"""
     try:
-        result = await claude_manager.execute_command(message.message, message.session_id)
+        result = await claude_manager.execute_command(
+            message.message, message.session_id, priority=message.priority, cache=cache_mode_from_headers(request)
+        )
+        response.headers["X-Cache"] = "HIT" if result.get("cached") else "MISS"
 
         return {
             "response": result["response"],
             "session_id": result.get("session_id", message.session_id),
             "success": result["success"],
             "error": result.get("error"),
+            "cached": result.get("cached", False),
         }
 
+    except SchedulerBusyError as e:
+        raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": "5"})
     except Exception as e:
         logger.error(f"Chat endpoint error: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
 
-@app.websocket("/ws/{client_id}")
-async def websocket_endpoint(websocket: WebSocket, client_id: str):
-    await manager.connect(websocket, client_id)
+def encode_stream_event(event: dict, fmt: str) -> bytes:
+    """Encode one event as an SSE message or an NDJSON line"""
+    data = dumps(event)
+    if fmt == "ndjson":
+        return data + b"\n"
+    seq = f"id: {event['seq']}\n" if "seq" in event else ""
+    return f"event: {event['type']}\n{seq}data: ".encode() + data + b"\n\n"
+
+
+async def stream_chat_events(message: ChatMessage, request: Request, fmt: str) -> AsyncIterator[bytes]:
+    """Run a chat message and yield its events as the CLI produces them.
+
+    Yields the ``text``/``tool_use`` events of the WebSocket path, ``queued`` while
+    waiting for a slot, then one ``result`` (or ``busy``/``error``). Events that pile up
+    while the client is slow are written in one chunk. When the client disconnects the
+    generator is closed and the run is cancelled.
+    """
+    events: asyncio.Queue = asyncio.Queue()
+    # WebSocket clients subscribed to the session watch the run as well
+    request_id = uuid.uuid4().hex
+
+    async def on_event(event: dict):
+        events.put_nowait(event)
+        session_bus.publish(message.session_id, {"type": "stream", "request_id": request_id, "data": event})
+
+    async def on_queue_position(position: int):
+        events.put_nowait({"type": "queued", "position": position})
+        session_bus.publish(message.session_id, {"type": "queued", "request_id": request_id, "data": {"position": position}})
+
+    async def run():
+        session_bus.begin(message.session_id, request_id, message.message)
+        final = None
+        try:
+            result = await claude_manager.execute_command(
+                message.message,
+                message.session_id,
+                stream_callback=on_event,
+                priority=message.priority,
+                on_queue_position=on_queue_position,
+                cache=cache_mode_from_headers(request),
+            )
+            data = {
+                "response": result["response"],
+                "session_id": result.get("session_id", message.session_id),
+                "success": result["success"],
+                "error": result.get("error"),
+                "cached": result.get("cached", False),
+            }
+            events.put_nowait({"type": "result", **data})
+            final = {"type": "response", "request_id": request_id, "data": data}
+        except SchedulerBusyError as e:
+            events.put_nowait({"type": "busy", "error": str(e)})
+            final = {"type": "busy", "request_id": request_id, "data": {"error": str(e), "session_id": message.session_id}}
+        except asyncio.CancelledError:
+            final = {"type": "cancelled", "request_id": request_id, "data": {"session_id": message.session_id}}
+            raise
+        except Exception as e:
+            logger.error(f"Chat stream error: {e}")
+            events.put_nowait({"type": "error", "error": str(e)})
+        finally:
+            session_bus.finish(message.session_id, request_id, final)
+            events.put_nowait(None)
+
+    task = asyncio.create_task(run())
     try:
         while True:
-            data = await websocket.receive_text()
-            message_data = json.loads(data)
+            try:
+                event = await asyncio.wait_for(events.get(), STREAM_KEEPALIVE_SECONDS)
+            except asyncio.TimeoutError:
+                if await request.is_disconnected():
+                    return
+                # Keep proxies from timing out an idle stream
+                yield b": keepalive\n\n" if fmt == "sse" else b"\n"
+                continue
+
+            chunk = []
+            while event is not None:
+                chunk.append(encode_stream_event(event, fmt))
+                if events.empty():
+                    break
+                event = events.get_nowait()
+            if chunk:
+                yield b"".join(chunk)
+            if event is None:
+                return
+    finally:
+        # Finished, or the client went away: stop the run and the CLI behind it
+        task.cancel()
+
+
+@app.post("/api/chat/stream")
+async def chat_stream_endpoint(message: ChatMessage, request: Request, format: str = Query("sse", pattern="^(sse|ndjson)$")):
+    """Process a chat message and stream its events as Server-Sent Events or NDJSON"""
+    media_type = "text/event-stream" if format == "sse" else "application/x-ndjson"
+    return StreamingResponse(
+        stream_chat_events(message, request, format),
+        media_type=media_type,
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
 
-            # Process message through Claude Code CLI with session support
-            session_id = message_data.get("session_id", "default")
 
-            # Define streaming callback
-            async def stream_callback(data):
-                """Send streaming updates to client"""
-                stream_response = {"type": "stream", "data": data}
-                await manager.send_personal_message(stream_response, client_id)
+@app.websocket("/ws/{client_id}")
+async def websocket_endpoint(websocket: WebSocket, client_id: str):
+    connection = await manager.connect(websocket, client_id)
+
+    # In-flight runs started by this connection, by request id
+    runs: Dict[str, asyncio.Task] = {}
+
+    async def run_chat(request_id: str, message_data: dict):
+        """Run one chat request and publish its stream and final response to the session's subscribers"""
+        session_id = message_data.get("session_id", "default")
+        message = message_data.get("message", "")
 
-            # Execute with streaming
+        async def send_frame(frame: dict):
+            """Send a (possibly batched) stream frame to the session's subscribers"""
+            session_bus.publish(session_id, frame)
+
+        async def send_queue_position(position: int):
+            """Tell the clients where the request stands while the server is saturated"""
+            session_bus.publish(session_id, {"type": "queued", "request_id": request_id, "data": {"position": position}})
+
+        batcher = StreamBatcher(send_frame, request_id=request_id)
+        final = None
+        try:
+            # Execute with streaming; small events are coalesced into fewer frames
             result = await claude_manager.execute_command(
-                message_data.get("message", ""), session_id, stream_callback=stream_callback
+                message,
+                session_id,
+                stream_callback=batcher.add,
+                client_id=client_id,
+                priority=int(message_data.get("priority", 0)),
+                on_queue_position=send_queue_position,
+                cache=message_data.get("cache") if message_data.get("cache") in CACHE_MODES else CACHE_USE,
             )
+            await batcher.flush()
 
-            # Send final response
-            response = {
+            # Final response
+            final = {
                 "type": "response",
+                "request_id": request_id,
                 "data": {
                     "response": result["response"],
                     "success": result["success"],
                     "error": result["error"],
                     "session_id": result.get("session_id", session_id),
+                    "cached": result.get("cached", False),
                 },
             }
+        except SchedulerBusyError as e:
+            final = {"type": "busy", "request_id": request_id, "data": {"error": str(e), "session_id": session_id}}
+        except asyncio.CancelledError:
+            batcher.close()
+            final = {"type": "cancelled", "request_id": request_id, "data": {"session_id": session_id}}
+            raise
+        except Exception as e:
+            logger.error(f"WebSocket request {request_id} failed: {str(e)}")
+            # Every run ends with a terminal frame, or its subscribers would wait for it forever
+            final = {"type": "error", "request_id": request_id, "data": {"error": str(e), "session_id": session_id}}
+        finally:
+            session_bus.finish(session_id, request_id, final)
+            runs.pop(request_id, None)
+
+    try:
+        while True:
+            data = await websocket.receive_text()
+            message_data = loads(data)
+            message_type = message_data.get("type", "message")
+
+            # Process message through Claude Code CLI with session support
+            session_id = message_data.get("session_id", "default")
 
-            await manager.send_personal_message(response, client_id)
+            if message_type == "ping":
+                await manager.send_personal_message({"type": "pong"}, client_id)
+                continue
+
+            if message_type == "subscribe":
+                # Watch the session's runs; runs still held are replayed after the last seq this client saw
+                session_bus.subscribe(
+                    session_id,
+                    connection,
+                    request_id=message_data.get("request_id"),
+                    since=int(message_data.get("since") or 0),
+                )
+                continue
+
+            if message_type == "unsubscribe":
+                session_bus.unsubscribe(session_id, connection)
+                continue
+
+            if message_type == "cancel":
+                # Cancelling the task kills the CLI process tree of that run, whichever client started it
+                task = runs.get(message_data.get("request_id"))
+                if task is None:
+                    run = session_bus.get_run(session_id, message_data.get("request_id"))
+                    task = run.task if run is not None and not run.done else None
+                if task is not None:
+                    task.cancel()
+                continue
+
+            if message_type == "resync":
+                # Reconnecting client: send the text streamed so far so it can continue from the last sequence number
+                snapshot = claude_manager.get_stream_snapshot(session_id)
+                await manager.send_personal_message(
+                    {"type": "resync", "data": snapshot or {"session_id": session_id, "seq": 0, "content": None}},
+                    client_id,
+                )
+                continue
+
+            request_id = str(message_data.get("request_id") or uuid.uuid4().hex)
+            if request_id in runs:
+                await manager.send_personal_message(
+                    {"type": "error", "request_id": request_id, "data": {"error": "Duplicate request_id"}}, client_id
+                )
+                continue
+            # The sender follows its own run through the session bus
+            session_bus.subscribe(session_id, connection, replay=False)
+            runs[request_id] = asyncio.create_task(run_chat(request_id, message_data))
+            session_bus.begin(session_id, request_id, message_data.get("message", ""), task=runs[request_id])
 
     except WebSocketDisconnect:
-        manager.disconnect(client_id)
+        manager.disconnect(client_id, websocket)
     except Exception as e:
         logger.error(f"WebSocket error: {str(e)}")
-        manager.disconnect(client_id)
+        manager.disconnect(client_id, websocket)
+    finally:
+        # Runs keep going while other clients (or this one, reconnected) watch their session;
+        # unwatched runs are cancelled by the bus after a grace period
+        session_bus.unsubscribe_all(connection)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,364 @@
+"""
+Gateway hosting the configured MCP servers warm in the backend for every CLI run
+"""
+
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import time
+from typing import Any, Dict, Optional, Set, Tuple
+from urllib.parse import quote
+
+import mcp.types as types
+from mcp.client.session import ClientSession
+from mcp.client.stdio import StdioServerParameters, stdio_client
+from mcp.server.lowlevel import Server
+from mcp.server.sse import SseServerTransport
+from session_store import DEFAULT_STATE_DIR
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import PlainTextResponse
+from starlette.routing import Mount, Route
+
+logger = logging.getLogger(__name__)
+
+# Requests relayed to the upstream server, with the capability that enables them and their result type
+FORWARDED_REQUESTS = {
+    types.ListToolsRequest: ("tools", types.ListToolsResult),
+    types.CallToolRequest: ("tools", types.CallToolResult),
+    types.ListResourcesRequest: ("resources", types.ListResourcesResult),
+    types.ListResourceTemplatesRequest: ("resources", types.ListResourceTemplatesResult),
+    types.ReadResourceRequest: ("resources", types.ReadResourceResult),
+    types.ListPromptsRequest: ("prompts", types.ListPromptsResult),
+    types.GetPromptRequest: ("prompts", types.GetPromptResult),
+}
+
+LOCAL_HOSTS = ("127.0.0.1", "::1", "localhost")
+
+# Environment variable carrying a CLI process's workspace token, expanded by the CLI in the gateway URLs
+WORKSPACE_ENV = "MCP_GATEWAY_WORKSPACE"
+
+
+class _UpstreamServer:
+    """A stdio MCP server process from ``.mcp.json``, started on first use and kept warm"""
+
+    def __init__(self, name: str, params: StdioServerParameters, start_timeout: float):
+        self.name = name
+        self.params = params
+        self.start_timeout = start_timeout
+        self.connections = 0
+        self.idle_since = time.monotonic()
+        self.session: Optional[ClientSession] = None
+        self.capabilities: Optional[types.ServerCapabilities] = None
+        self.wanted = False
+        self.restarts = 0
+        self.last_error: Optional[str] = None
+        self._task: Optional[asyncio.Task] = None
+        self._stop = asyncio.Event()
+        self._start_lock = asyncio.Lock()
+
+    @property
+    def running(self) -> bool:
+        return self.session is not None and self._task is not None and not self._task.done()
+
+    async def ensure_started(self) -> ClientSession:
+        """Start the server process if it is not running and return its client session"""
+        async with self._start_lock:
+            if self.running:
+                return self.session
+            self.wanted = True
+            self._stop = asyncio.Event()
+            ready = asyncio.get_running_loop().create_future()
+            self._task = asyncio.create_task(self._run(ready))
+            try:
+                await asyncio.wait_for(asyncio.shield(ready), self.start_timeout)
+            except BaseException:
+                await self._shutdown()
+                raise
+            logger.info(f"MCP server '{self.name}' started")
+            return self.session
+
+    async def _run(self, ready: asyncio.Future):
+        stop = self._stop
+        session = None
+        try:
+            async with stdio_client(self.params) as (read, write):
+                async with ClientSession(read, write) as session:
+                    result = await session.initialize()
+                    self.capabilities = result.capabilities
+                    self.session = session
+                    ready.set_result(None)
+                    await stop.wait()
+        except Exception as e:
+            self.last_error = str(e)
+            logger.error(f"MCP server '{self.name}' failed: {e}")
+            if not ready.done():
+                ready.set_exception(e)
+        finally:
+            # A restart may already have installed a newer session
+            if self.session is session:
+                self.session = None
+
+    async def _shutdown(self):
+        self._stop.set()
+        if self._task is None:
+            return
+        try:
+            await asyncio.wait_for(self._task, 5)
+        except (asyncio.TimeoutError, asyncio.CancelledError):
+            pass
+        self._task = None
+
+    async def stop(self):
+        self.wanted = False
+        await self._shutdown()
+
+    async def check(self, timeout: float):
+        """Ping a server that is in use and restart it if it does not answer"""
+        if not self.wanted or self._start_lock.locked():
+            # Not in use, or (re)starting right now
+            return
+        try:
+            if not self.running:
+                raise RuntimeError("process exited")
+            await asyncio.wait_for(self.session.send_ping(), timeout)
+            return
+        except Exception as e:
+            self.last_error = str(e) or type(e).__name__
+            logger.warning(f"MCP server '{self.name}' is unhealthy ({self.last_error}), restarting")
+        await self._shutdown()
+        self.restarts += 1
+        try:
+            await self.ensure_started()
+        except Exception as e:
+            logger.error(f"Failed to restart MCP server '{self.name}': {e}")
+
+
+class _LocalOnly:
+    """ASGI wrapper rejecting requests from other hosts: proxied tools run with the backend's rights"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        client = scope.get("client")
+        if client is None or client[0] not in LOCAL_HOSTS:
+            await PlainTextResponse("Forbidden", status_code=403)(scope, receive, send)
+            return
+        await self.app(scope, receive, send)
+
+
+class MCPGateway:
+    """Hosts the stdio MCP servers from ``.mcp.json`` warm and serves them over SSE.
+
+    Each CLI run gets a generated config whose entries point at this gateway instead
+    of launching the servers itself, so ``npx``/``uvx`` startup happens once per
+    workspace (or once overall) rather than once per message. Servers start lazily on
+    their first connection, are pinged periodically while in use and restarted when
+    they stop answering. Servers configured with a URL are passed through unchanged.
+
+    Servers are isolated by default: every session workspace gets its own upstream
+    process, started in that workspace, so stateful servers (a browser, a shell) never
+    share pages, cookies or files between users. The CLI finds its workspace's
+    upstream through ``MCP_GATEWAY_WORKSPACE`` (see ``workspace_env``), which it expands
+    in the gateway URLs. An isolated upstream is stopped when its session is cleaned up
+    or after ``idle_timeout`` seconds without a connection. Stateless servers listed in
+    ``MCP_GATEWAY_SHARED_SERVERS`` run once for every CLI run, in the backend's
+    directory; MCP request ids keep their calls apart.
+    """
+
+    def __init__(
+        self,
+        config_path: str,
+        base_url: Optional[str] = None,
+        health_interval: Optional[float] = None,
+        start_timeout: Optional[float] = None,
+        idle_timeout: Optional[float] = None,
+        shared_servers: Optional[Set[str]] = None,
+    ):
+        self.config_path = config_path
+        self.base_url = (
+            base_url or os.getenv("MCP_GATEWAY_URL") or f"http://127.0.0.1:{os.getenv('PORT', '8000')}/mcp"
+        ).rstrip("/")
+        self.health_interval = (
+            health_interval if health_interval is not None else float(os.getenv("MCP_GATEWAY_HEALTH_INTERVAL", 30))
+        )
+        self.start_timeout = start_timeout if start_timeout is not None else float(os.getenv("MCP_GATEWAY_START_TIMEOUT", 60))
+        self.idle_timeout = idle_timeout if idle_timeout is not None else float(os.getenv("MCP_GATEWAY_IDLE_TIMEOUT", 600))
+        if shared_servers is None:
+            shared_servers = {n.strip() for n in os.getenv("MCP_GATEWAY_SHARED_SERVERS", "").split(",") if n.strip()}
+        self.shared_servers = shared_servers
+        state_dir = os.getenv("CLAUDE_STATE_DIR", DEFAULT_STATE_DIR)
+        self.client_config_path = os.path.join(state_dir, "mcp_gateway.json")
+        # Server name -> launch parameters (cwd is the workspace for isolated servers)
+        self.params: Dict[str, StdioServerParameters] = {}
+        self.transports: Dict[str, SseServerTransport] = {}
+        # (server name, workspace token or None when shared) -> running upstream
+        self.servers: Dict[Tuple[str, Optional[str]], _UpstreamServer] = {}
+        # Workspace token -> directory
+        self.workspaces: Dict[str, str] = {}
+        self.passthrough: Dict[str, Dict[str, Any]] = {}
+        self._load_config()
+        self.app = Starlette(routes=self._routes())
+        self._health_task: Optional[asyncio.Task] = None
+
+    def _load_config(self):
+        try:
+            with open(self.config_path, "r", encoding="utf-8") as f:
+                entries = json.load(f).get("mcpServers", {})
+        except (OSError, ValueError) as e:
+            logger.warning(f"No MCP servers for the gateway ({self.config_path}: {e})")
+            entries = {}
+
+        for name, entry in entries.items():
+            if "command" not in entry:
+                self.passthrough[name] = entry
+                continue
+            self.params[name] = StdioServerParameters(
+                command=entry["command"],
+                args=entry.get("args", []),
+                env={**os.environ, **entry.get("env", {})},
+                cwd=entry.get("cwd"),
+            )
+            self.transports[name] = SseServerTransport(f"/{quote(name)}/messages/")
+
+    @staticmethod
+    def _workspace_token(working_dir: str) -> str:
+        return hashlib.sha256(os.path.realpath(working_dir).encode("utf-8")).hexdigest()[:32]
+
+    def workspace_env(self, working_dir: str) -> Dict[str, str]:
+        """Environment for a CLI process running in ``working_dir``: selects that workspace's upstreams"""
+        token = self._workspace_token(working_dir)
+        self.workspaces[token] = working_dir
+        return {WORKSPACE_ENV: token}
+
+    def _upstream(self, name: str, token: Optional[str]) -> Optional[_UpstreamServer]:
+        """The upstream serving ``name`` for a workspace token, created on first use"""
+        if name in self.shared_servers:
+            token = None
+        elif token not in self.workspaces:
+            return None
+        upstream = self.servers.get((name, token))
+        if upstream is None:
+            params = self.params[name]
+            if token is not None:
+                # Relative cwd entries are resolved inside the workspace
+                working_dir = self.workspaces[token]
+                params = params.model_copy(
+                    update={"cwd": os.path.join(working_dir, params.cwd) if params.cwd else working_dir}
+                )
+            upstream = self.servers[(name, token)] = _UpstreamServer(name, params, self.start_timeout)
+        return upstream
+
+    async def release_workspace(self, working_dir: str):
+        """Stop the isolated upstreams of a workspace whose session is being cleaned up"""
+        token = self._workspace_token(working_dir)
+        self.workspaces.pop(token, None)
+        upstreams = [self.servers.pop(key) for key in [k for k in self.servers if k[1] == token]]
+        await asyncio.gather(*(u.stop() for u in upstreams), return_exceptions=True)
+
+    def _routes(self):
+        routes = []
+        for name, transport in self.transports.items():
+            routes.append(Route(f"/{quote(name)}/sse", endpoint=self._sse_endpoint(name)))
+            routes.append(Mount(f"/{quote(name)}/messages/", app=_LocalOnly(transport.handle_post_message)))
+        return routes
+
+    def _sse_endpoint(self, name: str):
+        async def handle(scope, receive, send):
+            token = Request(scope).query_params.get("workspace") or None
+            upstream = self._upstream(name, token)
+            if upstream is None:
+                await PlainTextResponse(f"Unknown workspace for MCP server '{name}'", status_code=404)(scope, receive, send)
+                return
+            upstream.connections += 1
+            try:
+                try:
+                    await upstream.ensure_started()
+                except Exception as e:
+                    await PlainTextResponse(f"MCP server '{name}' unavailable: {e}", status_code=503)(scope, receive, send)
+                    return
+                server = self._build_server(upstream)
+                async with self.transports[name].connect_sse(scope, receive, send) as (read, write):
+                    await server.run(read, write, server.create_initialization_options())
+            finally:
+                upstream.connections -= 1
+                upstream.idle_since = time.monotonic()
+
+        return _LocalOnly(handle)
+
+    @staticmethod
+    def _build_server(upstream: _UpstreamServer) -> Server:
+        """A proxy server advertising the upstream's capabilities and relaying its requests"""
+        server = Server(upstream.name)
+        for request_type, (capability, result_type) in FORWARDED_REQUESTS.items():
+            if getattr(upstream.capabilities, capability, None) is None:
+                continue
+
+            async def forward(request, request_type=request_type, result_type=result_type):
+                session = await upstream.ensure_started()
+                # Rebuild without the downstream JSON-RPC envelope fields (jsonrpc, id)
+                relayed = request_type(method=request.method, params=request.params)
+                result = await session.send_request(types.ClientRequest(relayed), result_type)
+                return types.ServerResult(result)
+
+            server.request_handlers[request_type] = forward
+        return server
+
+    async def start(self):
+        """Write the CLI config and start health checks; servers themselves start lazily"""
+        config = {"mcpServers": dict(self.passthrough)}
+        for name in self.params:
+            url = f"{self.base_url}/{quote(name)}/sse"
+            if name not in self.shared_servers:
+                url += f"?workspace=${{{WORKSPACE_ENV}:-}}"
+            config["mcpServers"][name] = {"type": "sse", "url": url}
+        await asyncio.to_thread(self._write_client_config, config)
+        self._health_task = asyncio.create_task(self._health_loop())
+        logger.info(f"MCP gateway serving {len(self.params)} server(s) at {self.base_url}")
+
+    def _write_client_config(self, config: Dict[str, Any]):
+        os.makedirs(os.path.dirname(self.client_config_path), exist_ok=True)
+        tmp_path = self.client_config_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(config, f, indent=2)
+        os.replace(tmp_path, self.client_config_path)
+
+    async def stop(self):
+        if self._health_task is not None:
+            self._health_task.cancel()
+            self._health_task = None
+        await asyncio.gather(*(s.stop() for s in self.servers.values()), return_exceptions=True)
+
+    async def _health_loop(self):
+        while True:
+            await asyncio.sleep(self.health_interval)
+            await self._stop_idle()
+            await asyncio.gather(
+                *(s.check(timeout=min(self.health_interval, 10)) for s in self.servers.values()), return_exceptions=True
+            )
+
+    async def _stop_idle(self):
+        """Stop isolated upstreams nobody has connected to for ``idle_timeout`` seconds"""
+        now = time.monotonic()
+        idle = [
+            key
+            for key, upstream in self.servers.items()
+            if key[1] is not None and upstream.connections == 0 and now - upstream.idle_since > self.idle_timeout
+        ]
+        upstreams = [self.servers.pop(key) for key in idle]
+        await asyncio.gather(*(u.stop() for u in upstreams), return_exceptions=True)
+
+    def stats(self) -> Dict[str, Any]:
+        stats = {}
+        for name in self.params:
+            upstreams = [u for (n, _), u in self.servers.items() if n == name]
+            stats[name] = {
+                "shared": name in self.shared_servers,
+                "running": sum(1 for u in upstreams if u.running),
+                "restarts": sum(u.restarts for u in upstreams),
+                "last_error": next((u.last_error for u in upstreams if u.last_error), None),
+            }
+        return stats
@@ -0,0 +1,210 @@
+"""
+Prometheus-style metrics: counters, histograms and sampled gauges in text exposition format
+"""
+
+import math
+import threading
+from typing import Callable, Dict, List, Optional, Sequence, Tuple, Union
+
+# Latency buckets in seconds, from sub-millisecond cache hits to long tool-heavy runs
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+BYTES_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+
+LabelValues = Tuple[str, ...]
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: Optional[Tuple[str, str]] = None) -> str:
+    pairs = list(zip(names, values))
+    if extra is not None:
+        pairs.append(extra)
+    if not pairs:
+        return ""
+    escaped = (str(v).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"') for _, v in pairs)
+    return "{" + ",".join(f'{k}="{v}"' for (k, _), v in zip(pairs, escaped)) + "}"
+
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(labels)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, str]) -> LabelValues:
+        return tuple(str(labels.get(name, "")) for name in self.label_names)
+
+    def render(self) -> List[str]:
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}", *self._samples()]
+
+    def _samples(self) -> List[str]:
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labels: Sequence[str] = ()):
+        super().__init__(name, documentation, labels)
+        self._values: Dict[LabelValues, float] = {}
+
+    def inc(self, amount: float = 1, **labels: str):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels: str) -> float:
+        return self._values.get(self._key(labels), 0)
+
+    def _samples(self) -> List[str]:
+        with self._lock:
+            items = sorted(self._values.items())
+        return [f"{self.name}{_format_labels(self.label_names, key)} {_format_value(v)}" for key, v in items]
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labels: Sequence[str] = (), buckets: Sequence[float] = LATENCY_BUCKETS):
+        super().__init__(name, documentation, labels)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+        # label values -> (per-bucket counts, sum, count)
+        self._values: Dict[LabelValues, Tuple[List[int], float, int]] = {}
+
+    def observe(self, value: float, **labels: str):
+        key = self._key(labels)
+        with self._lock:
+            counts, total, count = self._values.get(key) or ([0] * len(self.buckets), 0.0, 0)
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+                    break
+            self._values[key] = (counts, total + value, count + 1)
+
+    def count(self, **labels: str) -> int:
+        entry = self._values.get(self._key(labels))
+        return entry[2] if entry else 0
+
+    def _samples(self) -> List[str]:
+        with self._lock:
+            items = sorted((key, (list(c), s, n)) for key, (c, s, n) in self._values.items())
+        lines = []
+        for key, (counts, total, count) in items:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                le = ("le", _format_value(bound))
+                lines.append(f"{self.name}_bucket{_format_labels(self.label_names, key, le)} {cumulative}")
+            labels = _format_labels(self.label_names, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+            lines.append(f"{self.name}_count{labels} {count}")
+        return lines
+
+
+GaugeSample = Union[float, Dict[LabelValues, float]]
+
+
+class Gauge(_Metric):
+    """A value sampled at scrape time by calling ``sample``.
+
+    ``sample`` returns a number, or a dict of label values to numbers for labeled gauges.
+    Counters kept elsewhere (e.g. in a component's ``stats``) can be exported the same
+    way with ``kind="counter"``.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        sample: Callable[[], GaugeSample],
+        labels: Sequence[str] = (),
+        kind: str = "gauge",
+    ):
+        super().__init__(name, documentation, labels)
+        self.sample = sample
+        self.kind = kind
+
+    def _samples(self) -> List[str]:
+        try:
+            value = self.sample()
+        except Exception:
+            return []
+        if isinstance(value, dict):
+            return [
+                f"{self.name}{_format_labels(self.label_names, key)} {_format_value(v)}" for key, v in sorted(value.items())
+            ]
+        return [f"{self.name} {_format_value(value)}"]
+
+
+class MetricsRegistry:
+    """Holds every metric and renders them for ``GET /metrics``"""
+
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+
+    def _register(self, metric: _Metric) -> _Metric:
+        # Re-registering (e.g. a second manager in the same process) returns the existing metric
+        return self._metrics.setdefault(metric.name, metric)
+
+    def counter(self, name: str, documentation: str, labels: Sequence[str] = ()) -> Counter:
+        return self._register(Counter(name, documentation, labels))
+
+    def histogram(
+        self, name: str, documentation: str, labels: Sequence[str] = (), buckets: Sequence[float] = LATENCY_BUCKETS
+    ) -> Histogram:
+        return self._register(Histogram(name, documentation, labels, buckets))
+
+    def gauge(
+        self,
+        name: str,
+        documentation: str,
+        sample: Callable[[], GaugeSample],
+        labels: Sequence[str] = (),
+        kind: str = "gauge",
+    ) -> Gauge:
+        """Register a sampled metric, replacing an earlier one of the same name"""
+        gauge = Gauge(name, documentation, sample, labels, kind)
+        self._metrics[name] = gauge
+        return gauge
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics.values():
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+registry = MetricsRegistry()
+
+# Request and CLI run instrumentation
+REQUESTS = registry.counter("llm_assistant_requests_total", "Chat requests by outcome", ["outcome"])
+REQUEST_DURATION = registry.histogram(
+    "llm_assistant_request_duration_seconds", "Total time to answer a chat request", ["outcome"]
+)
+QUEUE_WAIT = registry.histogram("llm_assistant_queue_wait_seconds", "Time spent waiting for an execution slot")
+PROCESS_SPAWN = registry.histogram(
+    "llm_assistant_cli_spawn_seconds", "Time to get a CLI process for a run (pool: acquire, oneshot: exec)", ["mode"]
+)
+FIRST_EVENT = registry.histogram("llm_assistant_cli_first_event_seconds", "Time from run start to the first CLI event")
+FIRST_TEXT = registry.histogram("llm_assistant_cli_first_text_seconds", "Time from run start to the first streamed text")
+TOOL_DURATION = registry.histogram(
+    "llm_assistant_tool_duration_seconds", "Time from a tool_use event to the next CLI event", ["tool"]
+)
+RUN_DURATION = registry.histogram("llm_assistant_cli_run_duration_seconds", "Duration of a CLI run", ["status"])
+RUNS = registry.counter("llm_assistant_cli_runs_total", "CLI runs by exit status", ["status"])
+STREAMED_BYTES = registry.histogram(
+    "llm_assistant_streamed_bytes", "UTF-8 bytes of text streamed per run", buckets=BYTES_BUCKETS
+)
+PEAK_RSS = registry.histogram(
+    "llm_assistant_cli_peak_rss_bytes",
+    "Peak RSS of the CLI process tree during a run",
+    buckets=(64 * 2**20, 128 * 2**20, 256 * 2**20, 512 * 2**20, 2**30, 2 * 2**30, 4 * 2**30, 8 * 2**30),
+)
+CPU_TIME = registry.histogram("llm_assistant_cli_cpu_seconds", "CPU time of the CLI process tree during a run", ["status"])
@@ -0,0 +1,502 @@
+"""
+Helpers for managing Claude Code CLI subprocess trees
+"""
+
+import asyncio
+import logging
+import os
+import signal
+import uuid
+from dataclasses import dataclass
+from typing import Any, AsyncIterator, Deque, Dict, List, Optional, Tuple
+
+try:
+    import resource
+except ImportError:  # Not available on Windows
+    resource = None
+
+logger = logging.getLogger(__name__)
+
+# StreamReader buffer size for CLI pipes; longer lines are reassembled from chunks
+STREAM_LIMIT = int(os.getenv("CLAUDE_STREAM_LIMIT", 1024 * 1024))
+
+# Largest single stream-json event accepted; bigger ones are skipped
+MAX_EVENT_BYTES = int(os.getenv("CLAUDE_MAX_EVENT_BYTES", 64 * 1024 * 1024))
+
+# Lines of stderr kept per CLI process for error messages
+STDERR_TAIL_LINES = int(os.getenv("CLAUDE_STDERR_TAIL_LINES", 200))
+
+
+# Seconds a CLI gets to exit after its result event before its tree is killed
+EXIT_GRACE_SECONDS = float(os.getenv("CLAUDE_EXIT_GRACE", 2))
+
+# Seconds between samples of a CLI process tree's memory and CPU usage
+ACCOUNTING_INTERVAL = float(os.getenv("CLAUDE_ACCOUNTING_INTERVAL", 0.25))
+
+PAGE_SIZE = os.sysconf("SC_PAGE_SIZE") if hasattr(os, "sysconf") else 4096
+CLK_TCK = os.sysconf("SC_CLK_TCK") if hasattr(os, "sysconf") else 100
+
+# Per-thread children lists (CONFIG_PROC_CHILDREN) let a tree be walked without scanning every PID
+PROC_CHILDREN = os.path.exists(f"/proc/{os.getpid()}/task/{os.getpid()}/children")
+
+
+def kill_process_tree(process: asyncio.subprocess.Process, cgroup: Optional["RunCgroup"] = None):
+    """Kill a CLI process and everything it spawned (MCP servers, browsers, ...).
+
+    The process must have been started with ``start_new_session=True`` so that it leads
+    its own process group. With a cgroup, descendants that left the group are killed too.
+
+    Args:
+        process: The subprocess to kill.
+        cgroup: The run's cgroup, if it has one.
+    """
+    if cgroup is not None:
+        cgroup.kill()
+    if process is None:
+        return
+    try:
+        os.killpg(process.pid, signal.SIGKILL)
+    except (ProcessLookupError, PermissionError):
+        # Group already gone (or never created): fall back to the direct child
+        if process.returncode is None:
+            try:
+                process.kill()
+            except ProcessLookupError:
+                pass
+    except Exception as e:
+        logger.warning(f"Failed to kill process tree of pid={process.pid}: {e}")
+
+
+async def wait_for_exit(process: asyncio.subprocess.Process, timeout: float) -> bool:
+    """Wait until the process itself has exited. Returns False on timeout.
+
+    Unlike ``process.wait()``, this does not also wait for the pipes to close, which
+    leftover descendants may keep open indefinitely.
+    """
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + timeout
+    while process.returncode is None:
+        if loop.time() >= deadline:
+            return False
+        await asyncio.sleep(0.02)
+    return True
+
+
+async def iter_lines(stream: asyncio.StreamReader, max_bytes: Optional[int] = None) -> AsyncIterator[bytes]:
+    """Yield newline-terminated lines from ``stream`` as soon as each one is complete.
+
+    Unlike ``readline``, a line longer than the reader's buffer limit does not raise:
+    it is read in buffer-sized chunks and joined. Lines over ``max_bytes`` are skipped
+    (with a warning) so one huge event cannot exhaust memory.
+
+    Args:
+        stream: Subprocess stdout or stderr.
+        max_bytes: Largest line to return. Defaults to ``MAX_EVENT_BYTES``.
+
+    Yields:
+        Lines without their trailing newline; the last one may be unterminated.
+    """
+    max_bytes = max_bytes if max_bytes is not None else MAX_EVENT_BYTES
+    parts = []
+    size = 0
+    while True:
+        try:
+            chunk = await stream.readuntil(b"\n")
+            complete = True
+        except asyncio.LimitOverrunError as e:
+            # No newline within the buffer: take what is there and keep going
+            chunk = await stream.read(e.consumed)
+            complete = False
+        except asyncio.IncompleteReadError as e:
+            chunk = e.partial
+            complete = None  # EOF
+
+        size += len(chunk)
+        if size <= max_bytes:
+            parts.append(chunk)
+        elif parts:
+            logger.warning(f"Skipping a CLI output line over {max_bytes} bytes")
+            parts = []
+
+        if complete is False:
+            continue
+        if size <= max_bytes and (complete or size):
+            yield b"".join(parts).rstrip(b"\r\n")
+        if complete is None:
+            return
+        parts = []
+        size = 0
+
+
+async def drain_to_ring(stream: asyncio.StreamReader, ring: Deque[str]):
+    """Keep reading ``stream`` into a bounded deque of decoded lines until EOF.
+
+    Draining stderr concurrently with stdout keeps a verbose CLI from blocking on a
+    full pipe; the deque keeps only the tail needed for error messages.
+    """
+    async for line in iter_lines(stream):
+        ring.append(line.decode("utf-8", errors="replace"))
+
+
+@dataclass
+class RunLimits:
+    """rlimits applied to every CLI process (and inherited by its children); 0 means unlimited.
+
+    Limits are per process, not per tree: use a cgroup to bound a whole run. The CPU
+    limit of a pooled worker covers every turn it serves. ``processes`` (RLIMIT_NPROC)
+    counts every process of the backend's user, so size it accordingly.
+    """
+
+    address_space_mb: int = 0
+    cpu_seconds: int = 0
+    open_files: int = 0
+    processes: int = 0
+
+    @classmethod
+    def from_env(cls) -> "RunLimits":
+        return cls(
+            address_space_mb=int(os.getenv("CLAUDE_RLIMIT_AS_MB", 0)),
+            cpu_seconds=int(os.getenv("CLAUDE_RLIMIT_CPU_SECONDS", 0)),
+            open_files=int(os.getenv("CLAUDE_RLIMIT_NOFILE", 0)),
+            processes=int(os.getenv("CLAUDE_RLIMIT_NPROC", 0)),
+        )
+
+    def rlimits(self) -> List[Tuple[int, int]]:
+        """(resource, value) pairs for the limits that are set"""
+        if resource is None:
+            return []
+        pairs = [
+            (resource.RLIMIT_AS, self.address_space_mb * 1024 * 1024),
+            (resource.RLIMIT_CPU, self.cpu_seconds),
+            (resource.RLIMIT_NOFILE, self.open_files),
+            (resource.RLIMIT_NPROC, self.processes),
+        ]
+        return [(res, value) for res, value in pairs if value > 0]
+
+
+def _apply_rlimits(pid: int, limits: List[Tuple[int, int]]):
+    for res, value in limits:
+        # The child inherited our hard limit and may not be raised above it
+        _, hard = resource.getrlimit(res)
+        if hard != resource.RLIM_INFINITY:
+            value = min(value, hard)
+        resource.prlimit(pid, res, (value, value))
+
+
+class RunCgroup:
+    """A cgroup v2 holding one CLI process tree"""
+
+    def __init__(self, path: str):
+        self.path = path
+
+    def _read(self, name: str) -> Optional[str]:
+        try:
+            with open(os.path.join(self.path, name), "r") as f:
+                return f.read()
+        except OSError:
+            return None
+
+    def pids(self) -> List[int]:
+        return [int(pid) for pid in (self._read("cgroup.procs") or "").split()]
+
+    def cpu_seconds(self) -> Optional[float]:
+        for line in (self._read("cpu.stat") or "").splitlines():
+            key, _, value = line.partition(" ")
+            if key == "usage_usec":
+                return int(value) / 1_000_000
+        return None
+
+    def kill(self):
+        """Kill every process in the cgroup, including ones that left the process group"""
+        try:
+            with open(os.path.join(self.path, "cgroup.kill"), "w") as f:
+                f.write("1")
+            return
+        except OSError:
+            pass
+        # cgroup.kill needs Linux 5.14; signal the members one by one instead
+        for pid in self.pids():
+            try:
+                os.kill(pid, signal.SIGKILL)
+            except OSError:
+                pass
+
+    async def remove(self):
+        """Kill what is left and delete the cgroup once it is empty"""
+        self.kill()
+        for _ in range(50):
+            try:
+                os.rmdir(self.path)
+                return
+            except FileNotFoundError:
+                return
+            except OSError:
+                await asyncio.sleep(0.1)
+        logger.warning(f"Could not remove cgroup {self.path}")
+
+
+class CgroupController:
+    """Creates one child cgroup per CLI process under a delegated cgroup v2 directory.
+
+    ``CLAUDE_CGROUP_ROOT`` must be a cgroup the backend may write to that holds no
+    processes itself (e.g. a systemd ``Delegate=yes`` slice with the backend running in
+    a sibling cgroup). Without it, runs are bounded by process groups and rlimits only.
+    """
+
+    def __init__(
+        self,
+        root: Optional[str] = None,
+        memory_max: Optional[str] = None,
+        pids_max: Optional[str] = None,
+        cpu_max: Optional[str] = None,
+    ):
+        self.root = root if root is not None else os.getenv("CLAUDE_CGROUP_ROOT", "")
+        self.limits = {
+            "memory.max": memory_max if memory_max is not None else os.getenv("CLAUDE_CGROUP_MEMORY_MAX", ""),
+            "pids.max": pids_max if pids_max is not None else os.getenv("CLAUDE_CGROUP_PIDS_MAX", ""),
+            # "<quota> <period>" in microseconds, e.g. "200000 100000" for two CPUs
+            "cpu.max": cpu_max if cpu_max is not None else os.getenv("CLAUDE_CGROUP_CPU_MAX", ""),
+        }
+        self.available = bool(self.root) and self._prepare()
+
+    def _prepare(self) -> bool:
+        if not os.access(os.path.join(self.root, "cgroup.procs"), os.W_OK):
+            logger.warning(f"CLAUDE_CGROUP_ROOT {self.root} is not a writable cgroup v2 directory, not using cgroups")
+            return False
+        try:
+            with open(os.path.join(self.root, "cgroup.controllers"), "r") as f:
+                controllers = f.read().split()
+            wanted = [c for c in ("cpu", "memory", "pids") if c in controllers]
+            with open(os.path.join(self.root, "cgroup.subtree_control"), "w") as f:
+                f.write(" ".join(f"+{c}" for c in wanted))
+        except OSError as e:
+            logger.warning(f"Could not enable cgroup controllers in {self.root}: {e}")
+        return True
+
+    def create(self) -> Optional[RunCgroup]:
+        if not self.available:
+            return None
+        path = os.path.join(self.root, f"run-{uuid.uuid4().hex[:12]}")
+        try:
+            os.mkdir(path)
+        except OSError as e:
+            logger.warning(f"Could not create cgroup {path}: {e}")
+            return None
+        for name, value in self.limits.items():
+            if not value:
+                continue
+            try:
+                with open(os.path.join(path, name), "w") as f:
+                    f.write(value)
+            except OSError as e:
+                logger.warning(f"Could not set {name}={value} on {path}: {e}")
+        return RunCgroup(path)
+
+
+class ProcessTreeMonitor:
+    """Samples the RSS and CPU time of a process tree while it runs.
+
+    Members are the processes of the cgroup when there is one, else the descendants of
+    the group leader found through ``/proc/<pid>/task/*/children``. Kernels without
+    those lists need a scan of every PID for the process group, which the periodic
+    samples run in a thread. RSS is summed over members at each sample; CPU time comes
+    from the cgroup (exact) or from the members' own CPU time as last sampled
+    (processes that start and exit between two samples are missed).
+    """
+
+    def __init__(self, pgid: int, cgroup: Optional[RunCgroup] = None, interval: Optional[float] = None):
+        self.pgid = pgid
+        self.cgroup = cgroup
+        self.interval = interval if interval is not None else ACCOUNTING_INTERVAL
+        self.peak_rss = 0
+        self.peak_processes = 0
+        self._cpu_by_pid: Dict[int, float] = {}
+        self._cpu_base = 0.0
+        self._task: Optional[asyncio.Task] = None
+        self.available = os.path.isdir("/proc")
+        self._scans_all_pids = cgroup is None and not PROC_CHILDREN
+
+    def start(self):
+        if self.available and self.interval > 0 and self._task is None:
+            self.sample()
+            self._task = asyncio.create_task(self._loop())
+
+    def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    async def _loop(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            if self._scans_all_pids:
+                await asyncio.to_thread(self.sample)
+            else:
+                self.sample()
+
+    def _members(self) -> List[int]:
+        if self.cgroup is not None:
+            return self.cgroup.pids()
+        if PROC_CHILDREN:
+            return self._descendants()
+        members = []
+        for entry in os.listdir("/proc"):
+            if entry.isdigit():
+                try:
+                    if os.getpgid(int(entry)) == self.pgid:
+                        members.append(int(entry))
+                except OSError:
+                    continue
+        return members
+
+    def _descendants(self) -> List[int]:
+        # Children orphaned by an exited parent are reparented away and no longer found
+        members = []
+        stack = [self.pgid]
+        while stack:
+            pid = stack.pop()
+            try:
+                tids = os.listdir(f"/proc/{pid}/task")
+            except OSError:
+                continue
+            members.append(pid)
+            for tid in tids:
+                try:
+                    with open(f"/proc/{pid}/task/{tid}/children", "r") as f:
+                        stack.extend(int(child) for child in f.read().split())
+                except OSError:
+                    continue
+        return members
+
+    def sample(self):
+        """Take one sample now (e.g. right before the tree exits)"""
+        if not self.available:
+            return
+        rss = 0
+        count = 0
+        for pid in self._members():
+            try:
+                with open(f"/proc/{pid}/stat", "r") as f:
+                    fields = f.read().rsplit(")", 1)[1].split()
+            except (OSError, IndexError):
+                continue
+            # Fields after the command name start at field 3 (state): utime=14, stime=15, rss=24
+            self._cpu_by_pid[pid] = (int(fields[11]) + int(fields[12])) / CLK_TCK
+            rss += int(fields[21]) * PAGE_SIZE
+            count += 1
+        self.peak_rss = max(self.peak_rss, rss)
+        self.peak_processes = max(self.peak_processes, count)
+
+    def cpu_seconds(self) -> float:
+        if self.cgroup is not None:
+            cpu = self.cgroup.cpu_seconds()
+            if cpu is not None:
+                return cpu
+        return sum(self._cpu_by_pid.values())
+
+    def begin(self):
+        """Start a new measurement window (one turn of a long-lived worker) and sample until ``end``"""
+        self.sample()
+        self._cpu_base = self.cpu_seconds()
+        self.peak_rss = 0
+        self.peak_processes = 0
+        self.start()
+
+    def end(self):
+        """Take a last sample and stop sampling; ``usage`` keeps reporting the window"""
+        self.sample()
+        self.stop()
+
+    def usage(self) -> Optional[Dict[str, Any]]:
+        """Peak RSS, CPU time and peak process count since the last ``begin`` (or start)"""
+        if not self.available:
+            return None
+        return {
+            "peak_rss_bytes": self.peak_rss,
+            "cpu_seconds": round(max(self.cpu_seconds() - self._cpu_base, 0.0), 3),
+            "peak_processes": self.peak_processes,
+        }
+
+
+class RunSandbox:
+    """Isolation and accounting for one CLI process: its own process group, an optional
+    cgroup, rlimits, and a monitor of the tree's resource usage.
+
+    Usage::
+
+        sandbox = RunSandbox(limits, cgroups)
+        process = await asyncio.create_subprocess_exec(*cmd, **sandbox.spawn_kwargs(), ...)
+        sandbox.attach(process)
+        ...
+        usage = await sandbox.close()
+    """
+
+    def __init__(self, limits: RunLimits, cgroups: CgroupController):
+        self.limits = limits
+        self.cgroup = cgroups.create()
+        self.process: Optional[asyncio.subprocess.Process] = None
+        self.monitor: Optional[ProcessTreeMonitor] = None
+
+    def spawn_kwargs(self) -> Dict[str, Any]:
+        return {"start_new_session": True}
+
+    def _confine(self, pid: int):
+        """Move a freshly spawned process into the cgroup and apply the rlimits from the parent.
+
+        A ``preexec_fn`` would do this before exec, but it is unsafe in a process running
+        other threads (the backend's thread pools). The CLI only spawns its MCP servers
+        well after startup, so they inherit both; anything earlier is still in the
+        process group.
+        """
+        if self.cgroup is not None:
+            try:
+                with open(os.path.join(self.cgroup.path, "cgroup.procs"), "w") as f:
+                    f.write(str(pid))
+            except OSError as e:
+                logger.warning(f"Could not move pid={pid} into cgroup {self.cgroup.path}: {e}")
+        rlimits = self.limits.rlimits()
+        if not rlimits:
+            return
+        if not hasattr(resource, "prlimit"):
+            logger.warning("resource.prlimit is not available on this platform, CLI rlimits are not applied")
+            return
+        try:
+            _apply_rlimits(pid, rlimits)
+        except OSError as e:
+            logger.warning(f"Could not apply rlimits to pid={pid}: {e}")
+
+    def attach(self, process: asyncio.subprocess.Process, sample: bool = True):
+        """Confine and track a spawned process. Call it right after the spawn.
+
+        Args:
+            process: The process started with ``spawn_kwargs``.
+            sample: Start sampling right away. Long-lived workers pass False and sample
+                each turn between ``monitor.begin()`` and ``monitor.end()``.
+        """
+        self.process = process
+        self._confine(process.pid)
+        self.monitor = ProcessTreeMonitor(process.pid, self.cgroup)
+        if sample:
+            self.monitor.start()
+
+    def sample(self):
+        if self.monitor is not None:
+            self.monitor.sample()
+
+    def usage(self) -> Optional[Dict[str, Any]]:
+        return self.monitor.usage() if self.monitor is not None else None
+
+    def kill(self):
+        kill_process_tree(self.process, self.cgroup)
+
+    async def close(self) -> Optional[Dict[str, Any]]:
+        """Stop monitoring, kill anything left of the tree and release the cgroup"""
+        usage = self.usage()
+        if self.monitor is not None:
+            self.monitor.stop()
+        if self.cgroup is not None:
+            await self.cgroup.remove()
+        elif self.process is not None:
+            # Descendants still running after the CLI exited (stray MCP servers) go too
+            kill_process_tree(self.process)
+        return usage
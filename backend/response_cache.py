@@ -0,0 +1,293 @@
+"""
+Opt-in cache of CLI responses for repeated lookup-style prompts
+"""
+
+import asyncio
+import hashlib
+import logging
+import os
+import time
+import unicodedata
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from codec import DecodeError, dumps, loads
+from session_store import DEFAULT_STATE_DIR
+
+logger = logging.getLogger(__name__)
+
+# Per-request cache modes
+CACHE_USE = "use"  # serve hits, store misses
+CACHE_REFRESH = "refresh"  # skip lookup, store the fresh result
+CACHE_BYPASS = "bypass"  # neither read nor write
+CACHE_MODES = (CACHE_USE, CACHE_REFRESH, CACHE_BYPASS)
+
+# Subdirectory of the disk tier listing the keys each session stored
+SESSION_INDEX_DIR = "sessions"
+
+
+class ResponseCache:
+    """Two-tier (memory LRU, then disk) cache of successful CLI runs.
+
+    An entry holds the stream events of a run and its result, so a hit is replayed
+    to the client as the same event sequence a live run would produce. Keys combine
+    the normalized prompt, the CLI configuration (command line and the like, given by
+    the caller) and a hash of the MCP configuration, so entries are shared by every
+    session. Only the opening turn of a session is looked up or stored, since later
+    replies depend on the conversation so far.
+
+    A hit never starts or restores a CLI conversation: the session's next turn runs
+    without the cached exchange in its context. That only suits self-contained lookups,
+    so the cache is off by default. Deleting a session purges the entries it stored.
+
+    The disk tier is shared by every backend process using the same state directory.
+    """
+
+    def __init__(
+        self,
+        enabled: Optional[bool] = None,
+        ttl: Optional[float] = None,
+        memory_entries: Optional[int] = None,
+        disk_max_mb: Optional[float] = None,
+        cache_dir: Optional[str] = None,
+        mcp_config_path: Optional[str] = None,
+    ):
+        self.enabled = enabled if enabled is not None else os.getenv("RESPONSE_CACHE", "false").lower() == "true"
+        self.ttl = ttl if ttl is not None else float(os.getenv("RESPONSE_CACHE_TTL", 3600))
+        self.memory_entries = (
+            memory_entries if memory_entries is not None else int(os.getenv("RESPONSE_CACHE_MEMORY_ENTRIES", 256))
+        )
+        self.disk_max_bytes = int(
+            (disk_max_mb if disk_max_mb is not None else float(os.getenv("RESPONSE_CACHE_DISK_MB", 256))) * 1024 * 1024
+        )
+        self.cache_dir = cache_dir or os.getenv(
+            "RESPONSE_CACHE_DIR", os.path.join(os.getenv("CLAUDE_STATE_DIR", DEFAULT_STATE_DIR), "response_cache")
+        )
+        self.mcp_config_path = mcp_config_path
+        self._memory: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._session_keys: Dict[str, Set[str]] = {}
+        self._mcp_hash: Tuple[Optional[float], str] = (None, "")
+        self._disk_usage = 0
+        self._disk_lock = asyncio.Lock()
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.bypassed = 0
+        self.uncacheable = 0
+        self.evictions = 0
+        self.purged = 0
+
+    async def start(self):
+        if self.enabled and self.disk_max_bytes > 0:
+            self._disk_usage = await asyncio.to_thread(self._scan_disk)
+            logger.info(f"Response cache enabled (ttl={self.ttl}s, {self._disk_usage} bytes on disk)")
+
+    @staticmethod
+    def normalize(message: str) -> str:
+        """Unicode-normalize and collapse whitespace so trivially different prompts share a key"""
+        return " ".join(unicodedata.normalize("NFKC", message).split())
+
+    def _mcp_config_hash(self) -> str:
+        """Hash of the MCP configuration, recomputed when the file changes"""
+        if not self.mcp_config_path:
+            return ""
+        try:
+            mtime = os.path.getmtime(self.mcp_config_path)
+        except OSError:
+            return ""
+        if self._mcp_hash[0] != mtime:
+            with open(self.mcp_config_path, "rb") as f:
+                self._mcp_hash = (mtime, hashlib.sha256(f.read()).hexdigest())
+        return self._mcp_hash[1]
+
+    def key(self, message: str, config: str = "") -> str:
+        """Cache key of a prompt.
+
+        Args:
+            message: The user's prompt.
+            config: Everything else that shapes the reply, e.g. the CLI command line.
+        """
+        material = "\0".join((self.normalize(message), config, self._mcp_config_hash()))
+        return hashlib.sha256(material.encode("utf-8")).hexdigest()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, key[:2], f"{key}.json")
+
+    def _index_path(self, session_id: str) -> str:
+        name = hashlib.sha256(session_id.encode("utf-8")).hexdigest()[:32]
+        return os.path.join(self.cache_dir, SESSION_INDEX_DIR, name)
+
+    async def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """The cached ``{"events": [...], "result": {...}}`` for ``key``, or None"""
+        now = time.time()
+        entry = self._memory.get(key)
+        if entry is not None:
+            if entry["expires_at"] > now:
+                self._memory.move_to_end(key)
+                self.memory_hits += 1
+                return entry
+            del self._memory[key]
+
+        if self.disk_max_bytes > 0:
+            entry = await asyncio.to_thread(self._read_disk, key, now)
+            if entry is not None:
+                self.disk_hits += 1
+                self._remember(key, entry)
+                return entry
+
+        self.misses += 1
+        return None
+
+    async def put(self, key: str, events: List[Dict[str, Any]], result: Dict[str, Any], session_id: str):
+        """Store a successful run of ``session_id``"""
+        entry = {"expires_at": time.time() + self.ttl, "events": events, "result": result}
+        self._remember(key, entry)
+        self._session_keys.setdefault(session_id, set()).add(key)
+        self.stores += 1
+        if self.disk_max_bytes > 0:
+            try:
+                async with self._disk_lock:
+                    await asyncio.to_thread(self._write_disk, key, entry, session_id)
+            except OSError as e:
+                logger.warning(f"Failed to write response cache entry: {e}")
+
+    async def purge_session(self, session_id: str):
+        """Drop every entry a session stored, so a deleted conversation is never served again"""
+        keys = self._session_keys.pop(session_id, set())
+        removed = set()
+        if self.disk_max_bytes > 0:
+            async with self._disk_lock:
+                keys, removed = await asyncio.to_thread(self._purge_disk, session_id, keys)
+        for key in keys:
+            if self._memory.pop(key, None) is not None:
+                removed.add(key)
+        self.purged += len(removed)
+
+    def _remember(self, key: str, entry: Dict[str, Any]):
+        self._memory[key] = entry
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_entries:
+            self._memory.popitem(last=False)
+            self.evictions += 1
+
+    def _read_disk(self, key: str, now: float) -> Optional[Dict[str, Any]]:
+        path = self._path(key)
+        try:
+            with open(path, "rb") as f:
+                entry = loads(f.read())
+        except FileNotFoundError:
+            return None
+        except (OSError, DecodeError) as e:
+            logger.warning(f"Dropping unreadable response cache entry {path}: {e}")
+            entry = None
+        if entry is not None and entry.get("expires_at", 0) > now:
+            return entry
+        self._unlink(path)
+        return None
+
+    def _write_disk(self, key: str, entry: Dict[str, Any], session_id: str):
+        data = dumps(entry)
+        if len(data) > self.disk_max_bytes:
+            return
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._unlink(path)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+        self._disk_usage += len(data)
+        # Other processes sharing the directory find the session's entries through its index
+        index_path = self._index_path(session_id)
+        os.makedirs(os.path.dirname(index_path), exist_ok=True)
+        with open(index_path, "a") as f:
+            f.write(f"{key}\n")
+        if self._disk_usage > self.disk_max_bytes:
+            self._disk_usage = self._scan_disk(evict=True)
+
+    def _purge_disk(self, session_id: str, keys: Set[str]) -> Tuple[Set[str], Set[str]]:
+        """Remove the session's entries from disk; returns every key it stored and the ones removed"""
+        index_path = self._index_path(session_id)
+        try:
+            with open(index_path, "r") as f:
+                keys = keys | set(f.read().split())
+            os.remove(index_path)
+        except OSError:
+            pass
+        removed = set()
+        for key in keys:
+            path = self._path(key)
+            if os.path.exists(path):
+                self._unlink(path)
+                removed.add(key)
+        return keys, removed
+
+    def _unlink(self, path: str):
+        try:
+            size = os.path.getsize(path)
+            os.remove(path)
+            self._disk_usage = max(self._disk_usage - size, 0)
+        except OSError:
+            pass
+
+    def _scan_disk(self, evict: bool = False) -> int:
+        """Total size of the disk tier; with ``evict``, drop expired then oldest entries down to 90% of the limit"""
+        now = time.time()
+        files = []
+        for root, dirs, names in os.walk(self.cache_dir):
+            if root == self.cache_dir and SESSION_INDEX_DIR in dirs:
+                dirs.remove(SESSION_INDEX_DIR)
+                if evict:
+                    self._prune_indexes(now)
+            for name in names:
+                path = os.path.join(root, name)
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    continue
+                files.append((st.st_mtime, st.st_size, path))
+
+        total = sum(size for _, size, _ in files)
+        if not evict:
+            return total
+        target = self.disk_max_bytes * 0.9
+        for mtime, size, path in sorted(files):
+            if total <= target and mtime + self.ttl > now:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
+            self.evictions += 1
+        return total
+
+    def _prune_indexes(self, now: float):
+        """Remove session indexes whose entries have all expired (the index is appended on every store)"""
+        index_dir = os.path.join(self.cache_dir, SESSION_INDEX_DIR)
+        for name in os.listdir(index_dir):
+            path = os.path.join(index_dir, name)
+            try:
+                if os.path.getmtime(path) + self.ttl <= now:
+                    os.remove(path)
+            except OSError:
+                continue
+
+    def stats(self) -> Dict[str, Any]:
+        hits = self.memory_hits + self.disk_hits
+        lookups = hits + self.misses
+        return {
+            "enabled": self.enabled,
+            "memory_hits": self.memory_hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "hit_rate": round(hits / lookups, 3) if lookups else 0.0,
+            "stores": self.stores,
+            "bypassed": self.bypassed,
+            "uncacheable": self.uncacheable,
+            "evictions": self.evictions,
+            "purged": self.purged,
+            "memory_entries": len(self._memory),
+            "disk_bytes": self._disk_usage,
+        }
@@ -0,0 +1,492 @@
+"""
+Router mode: spread sessions over several backend nodes by consistent hashing
+
+Run one backend (``main:app``) per port and this app in front of them:
+
+    PORT=8001 CLAUDE_STATE_DIR=state/node1 uv run run_backend.py
+    PORT=8002 CLAUDE_STATE_DIR=state/node2 uv run run_backend.py
+    APP_MODE=router ROUTER_NODES=http://127.0.0.1:8001,http://127.0.0.1:8002 uv run run_backend.py
+
+Every request is proxied to the node owning its ``session_id``, so a session's
+history, working directory and CLI processes stay on one node.
+"""
+
+import asyncio
+import bisect
+import hashlib
+import logging
+import os
+import time
+from contextlib import asynccontextmanager
+from dataclasses import dataclass
+from typing import Any, AsyncIterator, Dict, Iterable, List, Optional
+
+import httpx
+import websockets
+from codec import DecodeError, loads
+from dotenv import load_dotenv
+from fastapi import FastAPI, HTTPException, Query, Request, WebSocket
+from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, StreamingResponse
+from pydantic import BaseModel
+from starlette.background import BackgroundTask
+
+load_dotenv()
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Headers that describe one hop and are not forwarded
+HOP_BY_HOP_HEADERS = {
+    "connection",
+    "keep-alive",
+    "proxy-authenticate",
+    "proxy-authorization",
+    "te",
+    "trailers",
+    "transfer-encoding",
+    "upgrade",
+    "host",
+    "content-length",
+}
+
+
+class HashRing:
+    """Consistent hash ring with virtual nodes.
+
+    Each node is placed at ``vnodes`` points on the ring and a key belongs to the
+    first point clockwise from its hash. Adding or removing a node only moves the
+    keys of the segments it gains or loses, about 1/N of all sessions.
+    """
+
+    def __init__(self, nodes: Iterable[str] = (), vnodes: int = 128):
+        self.vnodes = vnodes
+        self.nodes: List[str] = []
+        self._points: List[int] = []
+        self._owners: List[str] = []
+        for node in nodes:
+            self.add(node)
+
+    @staticmethod
+    def _hash(key: str) -> int:
+        return int.from_bytes(hashlib.md5(key.encode("utf-8")).digest()[:8], "big")
+
+    def add(self, node: str):
+        if node in self.nodes:
+            return
+        self.nodes.append(node)
+        for i in range(self.vnodes):
+            point = self._hash(f"{node}#{i}")
+            index = bisect.bisect(self._points, point)
+            self._points.insert(index, point)
+            self._owners.insert(index, node)
+
+    def remove(self, node: str):
+        if node not in self.nodes:
+            return
+        self.nodes.remove(node)
+        kept = [(p, o) for p, o in zip(self._points, self._owners) if o != node]
+        self._points = [p for p, _ in kept]
+        self._owners = [o for _, o in kept]
+
+    def preference_list(self, key: str) -> List[str]:
+        """Every node in the order a key falls back to them: owner first, then clockwise"""
+        if not self._points:
+            return []
+        start = bisect.bisect(self._points, self._hash(key))
+        nodes: List[str] = []
+        for i in range(len(self._points)):
+            owner = self._owners[(start + i) % len(self._points)]
+            if owner not in nodes:
+                nodes.append(owner)
+                if len(nodes) == len(self.nodes):
+                    break
+        return nodes
+
+    def owner(self, key: str) -> Optional[str]:
+        nodes = self.preference_list(key)
+        return nodes[0] if nodes else None
+
+
+@dataclass
+class BackendNode:
+    url: str
+    healthy: bool = False
+    failures: int = 0
+    last_check: Optional[float] = None
+    last_error: Optional[str] = None
+    requests: int = 0
+
+
+class SessionRouter:
+    """Node membership, health checks and owner lookup for router mode.
+
+    Nodes are health-checked with ``GET /ready``. A node that fails
+    ``failure_threshold`` checks in a row, or refuses a proxied connection, is taken
+    out of rotation: its sessions move to the next node on the ring and come back
+    once it passes a check again. Sessions of other nodes never move.
+    """
+
+    def __init__(
+        self,
+        nodes: Optional[List[str]] = None,
+        vnodes: Optional[int] = None,
+        health_interval: Optional[float] = None,
+        failure_threshold: Optional[int] = None,
+        connect_timeout: Optional[float] = None,
+    ):
+        if nodes is None:
+            nodes = [n.strip().rstrip("/") for n in os.getenv("ROUTER_NODES", "").split(",") if n.strip()]
+        self.ring = HashRing(vnodes=vnodes if vnodes is not None else int(os.getenv("ROUTER_VIRTUAL_NODES", 128)))
+        self.nodes: Dict[str, BackendNode] = {}
+        for url in nodes:
+            self.add_node(url)
+        self.health_interval = (
+            health_interval if health_interval is not None else float(os.getenv("ROUTER_HEALTH_INTERVAL", 2))
+        )
+        self.failure_threshold = (
+            failure_threshold if failure_threshold is not None else int(os.getenv("ROUTER_FAILURE_THRESHOLD", 2))
+        )
+        self.connect_timeout = (
+            connect_timeout if connect_timeout is not None else float(os.getenv("ROUTER_CONNECT_TIMEOUT", 3))
+        )
+        self.failovers = 0
+        self.client: Optional[httpx.AsyncClient] = None
+        self._health_task: Optional[asyncio.Task] = None
+
+    async def start(self):
+        # No read timeout: chat requests last as long as the CLI run behind them
+        self.client = httpx.AsyncClient(timeout=httpx.Timeout(None, connect=self.connect_timeout))
+        await self.check_all()
+        self._health_task = asyncio.create_task(self._health_loop())
+        logger.info(f"Routing sessions over {len(self.nodes)} nodes: {self.status()['nodes']}")
+
+    async def stop(self):
+        if self._health_task is not None:
+            self._health_task.cancel()
+        if self.client is not None:
+            await self.client.aclose()
+
+    def add_node(self, url: str) -> BackendNode:
+        url = url.rstrip("/")
+        node = self.nodes.get(url)
+        if node is None:
+            node = self.nodes[url] = BackendNode(url)
+            self.ring.add(url)
+        return node
+
+    def remove_node(self, url: str) -> bool:
+        url = url.rstrip("/")
+        if self.nodes.pop(url, None) is None:
+            return False
+        self.ring.remove(url)
+        return True
+
+    def candidates(self, session_id: str) -> List[BackendNode]:
+        """Healthy nodes for a session, owner first"""
+        return [self.nodes[url] for url in self.ring.preference_list(session_id) if self.nodes[url].healthy]
+
+    def mark_failed(self, node: BackendNode, error: BaseException):
+        """Take a node out of rotation after a refused connection"""
+        logger.warning(f"Backend node {node.url} unreachable, failing over: {error!r}")
+        node.healthy = False
+        node.failures = max(node.failures, self.failure_threshold)
+        node.last_error = repr(error)
+        self.failovers += 1
+
+    async def check(self, node: BackendNode):
+        try:
+            response = await self.client.get(f"{node.url}/ready", timeout=self.connect_timeout)
+            ok = response.status_code == 200
+            error = None if ok else f"HTTP {response.status_code}"
+        except httpx.HTTPError as e:
+            ok, error = False, repr(e)
+        node.last_check = time.time()
+        if ok:
+            if not node.healthy:
+                logger.info(f"Backend node {node.url} is healthy")
+            node.healthy, node.failures, node.last_error = True, 0, None
+            return
+        node.failures += 1
+        node.last_error = error
+        if node.healthy and node.failures >= self.failure_threshold:
+            logger.warning(f"Backend node {node.url} failed {node.failures} health checks: {error}")
+            node.healthy = False
+
+    async def check_all(self):
+        await asyncio.gather(*(self.check(node) for node in list(self.nodes.values())))
+
+    async def _health_loop(self):
+        while True:
+            await asyncio.sleep(self.health_interval)
+            try:
+                await self.check_all()
+            except Exception as e:
+                logger.error(f"Health check failed: {e}")
+
+    def status(self) -> Dict[str, Any]:
+        return {
+            "virtual_nodes": self.ring.vnodes,
+            "failovers": self.failovers,
+            "nodes": [
+                {
+                    "url": node.url,
+                    "healthy": node.healthy,
+                    "failures": node.failures,
+                    "last_error": node.last_error,
+                    "requests": node.requests,
+                }
+                for node in self.nodes.values()
+            ],
+        }
+
+
+session_router = SessionRouter()
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    logger.info("Starting LLM Assistant Bot router...")
+    await session_router.start()
+    yield
+    logger.info("Shutting down router...")
+    await session_router.stop()
+
+
+app = FastAPI(title="LLM Assistant Bot Router", version="0.1.0", lifespan=lifespan)
+
+app.add_middleware(
+    CORSMiddleware,
+    allow_origins=["*"],  # In production, replace with specific origins
+    allow_credentials=True,
+    allow_methods=["*"],
+    allow_headers=["*"],
+)
+
+
+class NodeRequest(BaseModel):
+    url: str
+
+
+def _forward_headers(headers) -> Dict[str, str]:
+    return {k: v for k, v in headers.items() if k.lower() not in HOP_BY_HOP_HEADERS}
+
+
+def _session_id_of(body: bytes) -> str:
+    try:
+        data = loads(body)
+    except DecodeError:
+        return "default"
+    return str(data.get("session_id") or "default") if isinstance(data, dict) else "default"
+
+
+async def _relay(upstream: httpx.Response) -> AsyncIterator[bytes]:
+    try:
+        async for chunk in upstream.aiter_raw():
+            yield chunk
+    finally:
+        # Closing the upstream request makes the node cancel the run
+        await upstream.aclose()
+
+
+async def proxy_request(request: Request, session_id: str, path: str) -> StreamingResponse:
+    """Send a request to the session's owner node and stream the response back.
+
+    Fails over to the next node on the ring only when the connection is refused,
+    i.e. before the owner could have started any work.
+    """
+    body = await request.body()
+    for node in session_router.candidates(session_id):
+        upstream_request = session_router.client.build_request(
+            request.method,
+            node.url + path,
+            params=request.query_params,
+            headers=_forward_headers(request.headers),
+            content=body,
+        )
+        try:
+            upstream = await session_router.client.send(upstream_request, stream=True)
+        except (httpx.ConnectError, httpx.ConnectTimeout) as e:
+            session_router.mark_failed(node, e)
+            continue
+        node.requests += 1
+        headers = _forward_headers(upstream.headers)
+        headers["X-Backend-Node"] = node.url
+        return StreamingResponse(
+            _relay(upstream), status_code=upstream.status_code, headers=headers, background=BackgroundTask(upstream.aclose)
+        )
+    raise HTTPException(status_code=503, detail="No backend node available", headers={"Retry-After": "5"})
+
+
+@app.get("/health")
+async def health_check():
+    return {"status": "healthy", "service": "llm-assistant-router"}
+
+
+@app.get("/ready")
+async def readiness_check():
+    """Ready while at least one backend node is healthy"""
+    status = session_router.status()
+    if not any(node["healthy"] for node in status["nodes"]):
+        return JSONResponse(status_code=503, content={"ready": False, **status})
+    return {"ready": True, **status}
+
+
+@app.get("/api/router")
+async def router_status():
+    """Nodes, their health and how many requests each has served"""
+    return session_router.status()
+
+
+@app.post("/api/router/nodes")
+async def add_router_node(node: NodeRequest):
+    """Add a backend node; it takes over its share of sessions once it passes a health check"""
+    await session_router.check(session_router.add_node(node.url))
+    return session_router.status()
+
+
+@app.delete("/api/router/nodes")
+async def remove_router_node(url: str = Query(...)):
+    """Remove a backend node; its sessions move to the next nodes on the ring"""
+    if not session_router.remove_node(url):
+        raise HTTPException(status_code=404, detail="Node not found")
+    return session_router.status()
+
+
+async def _fan_out_json(path: str, params: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """GET ``path`` from every healthy node; unreachable nodes are left out"""
+    nodes = [node for node in session_router.nodes.values() if node.healthy]
+
+    async def fetch(node: BackendNode):
+        try:
+            response = await session_router.client.get(node.url + path, params=params)
+            response.raise_for_status()
+            return node.url, response.json()
+        except httpx.HTTPError as e:
+            logger.warning(f"GET {path} on {node.url} failed: {e!r}")
+            return node.url, None
+
+    return {url: data for url, data in await asyncio.gather(*(fetch(node) for node in nodes)) if data is not None}
+
+
+@app.get("/api/stats")
+async def get_stats():
+    """Statistics of every node, plus the router's own"""
+    return {"router": session_router.status(), "nodes": await _fan_out_json("/api/stats")}
+
+
+@app.get("/api/sessions")
+async def list_sessions(limit: int = Query(50, ge=1, le=500), offset: int = Query(0, ge=0)):
+    """Sessions of every node, most recently active first"""
+    pages = await _fan_out_json("/api/sessions", {"limit": offset + limit, "offset": 0})
+    sessions = sorted(
+        (session for page in pages.values() for session in page["sessions"]),
+        key=lambda s: s.get("last_activity") or 0,
+        reverse=True,
+    )
+    total = sum(page["total"] for page in pages.values())
+    return {"sessions": sessions[offset : offset + limit], "total": total, "limit": limit, "offset": offset}
+
+
+@app.api_route("/api/sessions/{session_id}", methods=["GET", "DELETE"])
+async def session_endpoint(session_id: str, request: Request):
+    return await proxy_request(request, session_id, f"/api/sessions/{session_id}")
+
+
+@app.post("/api/chat")
+async def chat_endpoint(request: Request):
+    return await proxy_request(request, _session_id_of(await request.body()), "/api/chat")
+
+
+@app.post("/api/chat/stream")
+async def chat_stream_endpoint(request: Request):
+    return await proxy_request(request, _session_id_of(await request.body()), "/api/chat/stream")
+
+
+def _ws_url(url: str) -> str:
+    return "ws" + url[len("http") :] if url.startswith("http") else url
+
+
+@app.websocket("/ws/{client_id}")
+async def websocket_endpoint(websocket: WebSocket, client_id: str):
+    """Relay a browser WebSocket to the owner node of each message's session.
+
+    One upstream connection is opened per node the client talks to, and frames from
+    all of them are forwarded as they arrive. When an upstream node goes away, the
+    browser connection is closed so the client reconnects and resubscribes through
+    the session's new owner.
+    """
+    await websocket.accept()
+    upstreams: Dict[str, Any] = {}
+    pumps: Dict[str, asyncio.Task] = {}
+    send_lock = asyncio.Lock()
+    closing = False
+
+    async def pump(node: BackendNode, upstream):
+        try:
+            async for frame in upstream:
+                async with send_lock:
+                    if isinstance(frame, bytes):
+                        await websocket.send_bytes(frame)
+                    else:
+                        await websocket.send_text(frame)
+        except Exception as e:
+            logger.debug(f"Upstream {node.url} for client {client_id} closed: {e!r}")
+        finally:
+            upstreams.pop(node.url, None)
+            pumps.pop(node.url, None)
+        if not closing:
+            try:
+                # 1012: service restart, the client should reconnect
+                await websocket.close(code=1012)
+            except Exception:
+                pass
+
+    async def upstream_for(session_id: str):
+        for node in session_router.candidates(session_id):
+            upstream = upstreams.get(node.url)
+            if upstream is not None:
+                return upstream
+            try:
+                upstream = await websockets.connect(
+                    f"{_ws_url(node.url)}/ws/{client_id}", max_size=None, open_timeout=session_router.connect_timeout
+                )
+            except (OSError, TimeoutError, websockets.InvalidHandshake) as e:
+                session_router.mark_failed(node, e)
+                continue
+            node.requests += 1
+            upstreams[node.url] = upstream
+            pumps[node.url] = asyncio.create_task(pump(node, upstream))
+            return upstream
+        return None
+
+    try:
+        while True:
+            message = await websocket.receive()
+            if message["type"] == "websocket.disconnect":
+                break
+            data = message.get("text") if message.get("text") is not None else message.get("bytes")
+            upstream = await upstream_for(_session_id_of(data.encode("utf-8") if isinstance(data, str) else data))
+            if upstream is None:
+                async with send_lock:
+                    await websocket.send_json({"type": "error", "data": {"error": "No backend node available"}})
+                continue
+            try:
+                await upstream.send(data)
+            except websockets.ConnectionClosed:
+                # The pump closes the browser side as well
+                break
+    except Exception as e:
+        logger.debug(f"WebSocket relay for client {client_id} stopped: {e!r}")
+    finally:
+        closing = True
+        for task in list(pumps.values()):
+            task.cancel()
+        for upstream in list(upstreams.values()):
+            await upstream.close()
+
+
+if __name__ == "__main__":
+    import uvicorn
+
+    uvicorn.run(app, host="0.0.0.0", port=8000)
@@ -0,0 +1,220 @@
+"""
+Admission control and fair scheduling for CLI executions
+"""
+
+import asyncio
+import inspect
+import logging
+import os
+import time
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+from typing import Any, Callable, Deque, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class SchedulerBusyError(Exception):
+    """Raised when the wait queue is full and a request is rejected"""
+
+
+class _Ticket:
+    """A request waiting for (or holding) an execution slot"""
+
+    def __init__(self, session_id: str, client_id: Optional[str], priority: int, on_position: Optional[Callable]):
+        self.session_id = session_id
+        self.client_id = client_id
+        self.priority = priority
+        self.on_position = on_position
+        self.granted = asyncio.get_running_loop().create_future()
+        self.enqueued_at = time.monotonic()
+        self.position: Optional[int] = None
+
+
+class ExecutionScheduler:
+    """Limits concurrent CLI runs and hands out free slots fairly.
+
+    Waiting requests are grouped by priority and, within a priority, by session.
+    Slots are granted to the highest priority first and round-robin across sessions,
+    so one busy session cannot starve the others. A per-client limit caps how many
+    slots a single browser tab can hold at once; runs of one session are already
+    serialized by its lane (``session_lanes``).
+
+    Priorities come from clients, so they are clamped to ``-max_priority..max_priority``.
+    The default of 0 ignores them and every request is served in fair order.
+    """
+
+    def __init__(
+        self,
+        max_concurrent: Optional[int] = None,
+        max_per_client: Optional[int] = None,
+        max_queue: Optional[int] = None,
+        max_priority: Optional[int] = None,
+    ):
+        self.max_concurrent = max_concurrent if max_concurrent is not None else int(os.getenv("MAX_CONCURRENT_RUNS", 4))
+        self.max_per_client = max_per_client if max_per_client is not None else int(os.getenv("MAX_RUNS_PER_CLIENT", 2))
+        self.max_queue = max_queue if max_queue is not None else int(os.getenv("MAX_QUEUED_RUNS", 32))
+        self.max_priority = abs(max_priority if max_priority is not None else int(os.getenv("MAX_REQUEST_PRIORITY", 0)))
+        self.active = 0
+        self.active_by_client: Dict[str, int] = {}
+        # priority -> session_id -> waiting tickets (OrderedDict order is the round-robin order)
+        self._queues: Dict[int, "OrderedDict[str, Deque[_Ticket]]"] = {}
+        self.queued = 0
+        self.rejected = 0
+        self.total_wait = 0.0
+        self.granted_count = 0
+
+    @asynccontextmanager
+    async def slot(
+        self,
+        session_id: str,
+        client_id: Optional[str] = None,
+        priority: int = 0,
+        on_position: Optional[Callable[[int], Any]] = None,
+    ):
+        """Hold an execution slot for the duration of the ``async with`` block.
+
+        Args:
+            session_id: Session the run belongs to.
+            client_id: Client that sent the request, if known.
+            priority: Higher values are served first, within ``max_priority`` either way.
+            on_position: Called with the 1-based queue position while waiting.
+
+        Raises:
+            SchedulerBusyError: If the request has to wait and the queue is full.
+        """
+        ticket = await self.acquire(session_id, client_id, priority, on_position)
+        try:
+            yield ticket
+        finally:
+            self.release(ticket)
+
+    async def acquire(
+        self,
+        session_id: str,
+        client_id: Optional[str] = None,
+        priority: int = 0,
+        on_position: Optional[Callable[[int], Any]] = None,
+    ) -> _Ticket:
+        priority = max(-self.max_priority, min(priority, self.max_priority))
+        ticket = _Ticket(session_id, client_id, priority, on_position)
+        if self.queued == 0 and self._can_run(ticket):
+            self._grant(ticket)
+            return ticket
+
+        if self.queued >= self.max_queue:
+            self.rejected += 1
+            raise SchedulerBusyError("Server is busy, please retry later")
+
+        self._queues.setdefault(priority, OrderedDict()).setdefault(session_id, deque()).append(ticket)
+        self.queued += 1
+        self._dispatch()
+        try:
+            await ticket.granted
+        except asyncio.CancelledError:
+            if ticket.granted.done() and not ticket.granted.cancelled():
+                # Granted just as we were cancelled: give the slot back
+                self.release(ticket)
+            else:
+                self._remove(ticket)
+                self._dispatch()
+            raise
+        return ticket
+
+    def release(self, ticket: _Ticket):
+        self.active -= 1
+        if ticket.client_id is not None:
+            self._decrement(self.active_by_client, ticket.client_id)
+        self._dispatch()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "active": self.active,
+            "queued": self.queued,
+            "rejected": self.rejected,
+            "avg_wait_seconds": round(self.total_wait / self.granted_count, 3) if self.granted_count else 0.0,
+        }
+
+    @staticmethod
+    def _decrement(counts: Dict[str, int], key: str):
+        counts[key] -= 1
+        if counts[key] <= 0:
+            del counts[key]
+
+    def _can_run(self, ticket: _Ticket) -> bool:
+        if self.active >= self.max_concurrent:
+            return False
+        if ticket.client_id is not None and self.active_by_client.get(ticket.client_id, 0) >= self.max_per_client:
+            return False
+        return True
+
+    def _grant(self, ticket: _Ticket):
+        self.active += 1
+        if ticket.client_id is not None:
+            self.active_by_client[ticket.client_id] = self.active_by_client.get(ticket.client_id, 0) + 1
+        self.total_wait += time.monotonic() - ticket.enqueued_at
+        self.granted_count += 1
+        if not ticket.granted.done():
+            ticket.granted.set_result(True)
+
+    def _remove(self, ticket: _Ticket):
+        sessions = self._queues.get(ticket.priority)
+        if not sessions or ticket.session_id not in sessions:
+            return
+        waiting = sessions[ticket.session_id]
+        if ticket in waiting:
+            waiting.remove(ticket)
+            self.queued -= 1
+        if not waiting:
+            del sessions[ticket.session_id]
+        if not sessions:
+            del self._queues[ticket.priority]
+
+    def _dispatch(self):
+        """Grant free slots, then tell the remaining waiters where they stand"""
+        while self.active < self.max_concurrent and self._grant_next():
+            pass
+        self._notify_positions()
+
+    def _grant_next(self) -> bool:
+        for priority in sorted(self._queues, reverse=True):
+            sessions = self._queues[priority]
+            for session_id in list(sessions):
+                ticket = sessions[session_id][0]
+                if not self._can_run(ticket):
+                    continue
+                sessions[session_id].popleft()
+                self.queued -= 1
+                # Rotate: this session goes to the back of the round-robin order
+                if sessions[session_id]:
+                    sessions.move_to_end(session_id)
+                else:
+                    del sessions[session_id]
+                if not sessions:
+                    del self._queues[priority]
+                self._grant(ticket)
+                return True
+        return False
+
+    def _waiting_order(self) -> List[_Ticket]:
+        """Estimated service order: by priority, then interleaved across sessions"""
+        order: List[_Ticket] = []
+        for priority in sorted(self._queues, reverse=True):
+            lanes = [list(waiting) for waiting in self._queues[priority].values()]
+            depth = max((len(lane) for lane in lanes), default=0)
+            for index in range(depth):
+                order.extend(lane[index] for lane in lanes if index < len(lane))
+        return order
+
+    def _notify_positions(self):
+        for position, ticket in enumerate(self._waiting_order(), start=1):
+            if ticket.position == position or ticket.on_position is None:
+                ticket.position = position
+                continue
+            ticket.position = position
+            try:
+                result = ticket.on_position(position)
+                if inspect.isawaitable(result):
+                    asyncio.ensure_future(result)
+            except Exception as e:
+                logger.debug(f"Queue position callback failed: {e}")
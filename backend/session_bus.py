@@ -0,0 +1,221 @@
+"""
+Per-session fan-out of run frames to every subscribed client, with late-join replay
+"""
+
+import asyncio
+import logging
+import os
+import time
+from collections import OrderedDict, deque
+from dataclasses import dataclass, field
+from typing import Any, Callable, Deque, Dict, List, Optional, Protocol
+
+logger = logging.getLogger(__name__)
+
+# Frames whose events are kept in a run's replay buffer
+STREAM_FRAME_TYPES = ("stream", "stream_batch")
+
+
+class Subscriber(Protocol):
+    def enqueue(self, message: dict) -> bool: ...
+
+
+@dataclass
+class SessionRun:
+    """One run of a session: who started it, its recent stream events and its final frame"""
+
+    request_id: str
+    session_id: str
+    message: str
+    events: Deque[Dict[str, Any]]
+    task: Optional[asyncio.Task] = None
+    last_seq: int = 0
+    final: Optional[dict] = None
+    finished_at: Optional[float] = None
+
+    @property
+    def done(self) -> bool:
+        return self.finished_at is not None
+
+    def start_frame(self) -> dict:
+        return {
+            "type": "run",
+            "request_id": self.request_id,
+            "data": {"session_id": self.session_id, "message": self.message, "done": self.done},
+        }
+
+
+@dataclass
+class SessionChannel:
+    session_id: str
+    subscribers: List[Subscriber] = field(default_factory=list)
+    runs: "OrderedDict[str, SessionRun]" = field(default_factory=OrderedDict)
+    orphan_timer: Optional[asyncio.TimerHandle] = None
+
+
+class SessionBus:
+    """Publishes the frames of each session's runs to every client subscribed to it.
+
+    The stream events of a run are kept in a bounded ring buffer, so a client that
+    subscribes late (a second tab, a reconnect) gets the run's ``run`` frame and the
+    events after the last ``seq`` it saw, then the live frames, without starting the
+    CLI again. If the buffer no longer reaches back that far, the text so far is sent
+    as a ``resync`` snapshot instead. Finished runs are kept for ``linger`` seconds so a
+    reconnecting client still receives the final response. An in-flight run whose
+    session has lost every subscriber is cancelled after ``orphan_grace`` seconds.
+    """
+
+    def __init__(
+        self,
+        replay_events: Optional[int] = None,
+        linger: Optional[float] = None,
+        orphan_grace: Optional[float] = None,
+        snapshot: Optional[Callable[[str], Optional[Dict[str, Any]]]] = None,
+    ):
+        self.replay_events = replay_events if replay_events is not None else int(os.getenv("SESSION_REPLAY_EVENTS", 1024))
+        self.linger = linger if linger is not None else float(os.getenv("SESSION_RUN_LINGER_SECONDS", 60))
+        self.orphan_grace = orphan_grace if orphan_grace is not None else float(os.getenv("SESSION_ORPHAN_GRACE_SECONDS", 30))
+        self.snapshot = snapshot
+        self.channels: Dict[str, SessionChannel] = {}
+        self.published_frames = 0
+        self.replayed_events = 0
+        self.snapshot_resyncs = 0
+        self.orphans_cancelled = 0
+
+    def _channel(self, session_id: str) -> SessionChannel:
+        channel = self.channels.get(session_id)
+        if channel is None:
+            channel = self.channels[session_id] = SessionChannel(session_id)
+        return channel
+
+    def subscribe(
+        self, session_id: str, subscriber: Subscriber, request_id: Optional[str] = None, since: int = 0, replay: bool = True
+    ):
+        """Subscribe to a session and, with ``replay``, send the runs still held for it.
+
+        ``since`` is the last ``seq`` the subscriber saw of run ``request_id``; other
+        runs are replayed from the start.
+        """
+        channel = self._channel(session_id)
+        if subscriber not in channel.subscribers:
+            channel.subscribers.append(subscriber)
+        if channel.orphan_timer is not None:
+            channel.orphan_timer.cancel()
+            channel.orphan_timer = None
+        self._prune(channel)
+        if replay:
+            for run in list(channel.runs.values()):
+                self._replay(run, subscriber, since if run.request_id == request_id else 0)
+
+    def _replay(self, run: SessionRun, subscriber: Subscriber, since: int):
+        frames = [run.start_frame()]
+        first_buffered = run.events[0]["seq"] if run.events else run.last_seq + 1
+        events = [event for event in run.events if event["seq"] > since]
+        if since + 1 < first_buffered:
+            # Part of what the subscriber missed has left the buffer
+            snapshot = self.snapshot(run.session_id) if self.snapshot is not None and not run.done else None
+            if snapshot is not None:
+                self.snapshot_resyncs += 1
+                frames.append({"type": "resync", "request_id": run.request_id, "data": snapshot})
+            elif run.done:
+                # The final response carries the whole text
+                events = []
+        if events:
+            self.replayed_events += len(events)
+            frames.append({"type": "stream_batch", "request_id": run.request_id, "data": events, "replay": True})
+        if run.final is not None:
+            frames.append(run.final)
+        for frame in frames:
+            subscriber.enqueue(frame)
+
+    def unsubscribe(self, session_id: str, subscriber: Subscriber):
+        channel = self.channels.get(session_id)
+        if channel is None or subscriber not in channel.subscribers:
+            return
+        channel.subscribers.remove(subscriber)
+        if not channel.subscribers and any(not run.done and run.task is not None for run in channel.runs.values()):
+            # Give a reconnecting client time to come back before stopping the CLI
+            channel.orphan_timer = asyncio.get_running_loop().call_later(self.orphan_grace, self._cancel_orphans, channel)
+        self._prune(channel)
+
+    def unsubscribe_all(self, subscriber: Subscriber):
+        """Drop a closed connection from every session it subscribed to"""
+        for session_id in [s for s, c in self.channels.items() if subscriber in c.subscribers]:
+            self.unsubscribe(session_id, subscriber)
+
+    def _cancel_orphans(self, channel: SessionChannel):
+        channel.orphan_timer = None
+        if channel.subscribers:
+            return
+        for run in channel.runs.values():
+            if not run.done and run.task is not None:
+                logger.info(f"Cancelling run {run.request_id} of session {channel.session_id}: no subscribers left")
+                self.orphans_cancelled += 1
+                run.task.cancel()
+
+    def begin(self, session_id: str, request_id: str, message: str, task: Optional[asyncio.Task] = None) -> SessionRun:
+        """Register a new run and announce it to the session's subscribers"""
+        channel = self._channel(session_id)
+        run = SessionRun(request_id, session_id, message, deque(maxlen=self.replay_events), task=task)
+        channel.runs[request_id] = run
+        # Pruned only once the run is in, or a channel without subscribers would be dropped under it
+        self._prune(channel)
+        self._fan_out(channel, run.start_frame())
+        return run
+
+    def publish(self, session_id: str, frame: dict):
+        """Send a frame of a run to every subscriber, buffering its stream events for late joiners"""
+        channel = self.channels.get(session_id)
+        if channel is None:
+            return
+        run = channel.runs.get(frame.get("request_id"))
+        if run is not None and frame.get("type") in STREAM_FRAME_TYPES:
+            events = frame["data"] if frame["type"] == "stream_batch" else [frame["data"]]
+            for event in events:
+                if "seq" in event:
+                    run.events.append(event)
+                    run.last_seq = event["seq"]
+        self._fan_out(channel, frame)
+
+    def finish(self, session_id: str, request_id: str, final: Optional[dict] = None):
+        """Mark a run finished and publish its final frame (response, busy, cancelled or error)"""
+        channel = self.channels.get(session_id)
+        run = channel.runs.get(request_id) if channel is not None else None
+        if run is None:
+            return
+        run.final = final
+        run.finished_at = time.monotonic()
+        if final is not None:
+            self._fan_out(channel, final)
+        asyncio.get_running_loop().call_later(self.linger, self._prune, channel)
+
+    def get_run(self, session_id: str, request_id: str) -> Optional[SessionRun]:
+        channel = self.channels.get(session_id)
+        return channel.runs.get(request_id) if channel is not None else None
+
+    def _fan_out(self, channel: SessionChannel, frame: dict):
+        self.published_frames += 1
+        # Each subscriber has its own bounded send queue, so a slow one never holds up the rest
+        for subscriber in list(channel.subscribers):
+            subscriber.enqueue(frame)
+
+    def _prune(self, channel: SessionChannel):
+        """Forget runs that finished more than ``linger`` seconds ago, and the channel once unused"""
+        now = time.monotonic()
+        for request_id in [r for r, run in channel.runs.items() if run.done and run.finished_at + self.linger <= now]:
+            del channel.runs[request_id]
+        if not channel.subscribers and not channel.runs and self.channels.get(channel.session_id) is channel:
+            del self.channels[channel.session_id]
+
+    def stats(self) -> Dict[str, Any]:
+        runs = [run for channel in self.channels.values() for run in channel.runs.values()]
+        return {
+            "sessions": len(self.channels),
+            "subscribers": sum(len(c.subscribers) for c in self.channels.values()),
+            "runs_in_flight": sum(1 for run in runs if not run.done),
+            "buffered_events": sum(len(run.events) for run in runs),
+            "published_frames": self.published_frames,
+            "replayed_events": self.replayed_events,
+            "snapshot_resyncs": self.snapshot_resyncs,
+            "orphans_cancelled": self.orphans_cancelled,
+        }
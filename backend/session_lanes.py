@@ -0,0 +1,141 @@
+"""
+Per-session execution lanes with coalescing of identical prompts
+"""
+
+import asyncio
+import logging
+import os
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+StreamCallback = Callable[[Dict[str, Any]], Awaitable[None]]
+
+
+class _Subscriber:
+    """One waiter's view of a shared run's event stream"""
+
+    def __init__(self, callback: Optional[StreamCallback]):
+        self.callback = callback
+        self.cursor = 0
+
+    async def catch_up(self, events: List[Dict[str, Any]]):
+        """Deliver every event this subscriber has not seen yet, in order"""
+        while self.cursor < len(events):
+            event = events[self.cursor]
+            self.cursor += 1
+            if self.callback is None:
+                continue
+            try:
+                await self.callback(event)
+            except Exception as e:
+                logger.debug(f"Stream subscriber failed: {e}")
+
+
+class _SharedRun:
+    """A single execution whose result and stream are shared by every coalesced waiter"""
+
+    def __init__(self, key: Tuple[str, str]):
+        self.key = key
+        self.created_at = time.monotonic()
+        self.events: List[Dict[str, Any]] = []
+        self.subscribers: List[_Subscriber] = []
+        self.task: Optional[asyncio.Task] = None
+        self.closing = False
+
+    async def fan_out(self, event: Dict[str, Any]):
+        self.events.append(event)
+        for subscriber in list(self.subscribers):
+            await subscriber.catch_up(self.events)
+
+
+class SessionLanes:
+    """Serializes runs per session and lets identical pending prompts share one run.
+
+    Requests for the same session execute one at a time in arrival order, so history
+    entries never interleave and two CLI processes never work in the same directory.
+    A request whose normalized prompt matches a run submitted for the same session
+    within ``coalesce_window`` seconds joins that run instead of starting a new one:
+    it receives the events streamed so far, then the live stream, then the same result.
+    """
+
+    def __init__(self, coalesce_window: Optional[float] = None):
+        self.coalesce_window = (
+            coalesce_window if coalesce_window is not None else float(os.getenv("COALESCE_WINDOW_SECONDS", 2))
+        )
+        self._locks: Dict[str, asyncio.Lock] = {}
+        self._lock_users: Dict[str, int] = {}
+        self._shared: Dict[Tuple[str, str], _SharedRun] = {}
+        self.coalesced = 0
+
+    @staticmethod
+    def _normalize(message: str) -> str:
+        return " ".join(message.split())
+
+    async def submit(
+        self,
+        session_id: str,
+        message: str,
+        stream_callback: Optional[StreamCallback],
+        runner: Callable[[StreamCallback], Awaitable[Dict[str, Any]]],
+    ) -> Dict[str, Any]:
+        """Run ``runner`` in the session's lane, or join an identical run already submitted.
+
+        Args:
+            session_id: Session whose lane to use.
+            message: The prompt, used as the coalescing key.
+            stream_callback: This waiter's stream callback.
+            runner: Executes the prompt, streaming events to the callback it is given.
+
+        Returns:
+            The run's result.
+        """
+        key = (session_id, self._normalize(message))
+        shared = self._shared.get(key)
+        joinable = (
+            shared is not None
+            and not shared.closing
+            and not shared.task.done()
+            and time.monotonic() - shared.created_at <= self.coalesce_window
+        )
+        if joinable:
+            self.coalesced += 1
+            logger.info(f"Coalescing identical prompt into pending run for session {session_id}")
+        else:
+            shared = _SharedRun(key)
+            self._shared[key] = shared
+            shared.task = asyncio.create_task(self._run(session_id, shared, runner))
+
+        subscriber = _Subscriber(stream_callback)
+        shared.subscribers.append(subscriber)
+        await subscriber.catch_up(shared.events)
+        try:
+            return await asyncio.shield(shared.task)
+        finally:
+            shared.subscribers.remove(subscriber)
+            if not shared.subscribers and not shared.task.done():
+                # Nobody is waiting for this run any more: stop it
+                shared.closing = True
+                shared.task.cancel()
+
+    async def _run(self, session_id: str, shared: _SharedRun, runner) -> Dict[str, Any]:
+        lock = self._locks.setdefault(session_id, asyncio.Lock())
+        self._lock_users[session_id] = self._lock_users.get(session_id, 0) + 1
+        try:
+            async with lock:
+                return await runner(shared.fan_out)
+        finally:
+            if self._shared.get(shared.key) is shared:
+                del self._shared[shared.key]
+            self._lock_users[session_id] -= 1
+            if self._lock_users[session_id] == 0:
+                del self._lock_users[session_id]
+                del self._locks[session_id]
+
+    def is_busy(self, session_id: str) -> bool:
+        """Whether the session has a run queued or executing in its lane"""
+        return session_id in self._locks
+
+    def stats(self) -> Dict[str, int]:
+        return {"busy_sessions": len(self._locks), "coalesced": self.coalesced}
@@ -0,0 +1,132 @@
+"""
+Session lifecycle: bounded history and background eviction of idle sessions
+"""
+
+import asyncio
+import logging
+import os
+import time
+from collections import deque
+from typing import Any, Deque, Dict, Iterator, List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class SessionHistory:
+    """Chat history that keeps only the most recent turns in memory.
+
+    Every turn is also appended to the session store, so older turns are simply
+    dropped from the ring buffer. ``len`` counts every turn ever recorded;
+    iteration yields the in-memory tail.
+    """
+
+    def __init__(self, limit: int, recent: Optional[List[Dict[str, Any]]] = None, count: int = 0):
+        self._recent: Deque[Dict[str, Any]] = deque(recent or (), maxlen=max(limit, 1))
+        self.count = max(count, len(self._recent))
+
+    def append(self, entry: Dict[str, Any]):
+        self._recent.append(entry)
+        self.count += 1
+
+    def __len__(self) -> int:
+        return self.count
+
+    def __iter__(self) -> Iterator[Dict[str, Any]]:
+        return iter(self._recent)
+
+
+def _directory_size(path: str) -> int:
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.lstat(os.path.join(root, name)).st_size
+            except OSError:
+                continue
+    return total
+
+
+class SessionReaper:
+    """Evicts sessions by idle TTL, then least-recently-used under count and disk budgets.
+
+    Eviction removes the session from memory and deletes its working directory; the
+    session store record is kept, so a returning user continues the same conversation.
+    Sessions with a run in flight are never evicted.
+    """
+
+    def __init__(
+        self,
+        manager,
+        idle_ttl: Optional[float] = None,
+        max_sessions: Optional[int] = None,
+        disk_budget_mb: Optional[float] = None,
+        interval: Optional[float] = None,
+    ):
+        self.manager = manager
+        self.idle_ttl = idle_ttl if idle_ttl is not None else float(os.getenv("SESSION_IDLE_TTL", 3600))
+        self.max_sessions = max_sessions if max_sessions is not None else int(os.getenv("MAX_SESSIONS", 100))
+        self.disk_budget = (
+            (disk_budget_mb if disk_budget_mb is not None else float(os.getenv("SESSION_DISK_BUDGET_MB", 1024))) * 1024 * 1024
+        )
+        self.interval = interval if interval is not None else float(os.getenv("SESSION_REAP_INTERVAL", 60))
+        self.evicted = 0
+        self.disk_usage = 0
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self):
+        self._task = asyncio.create_task(self._loop())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _loop(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.reap()
+            except Exception as e:
+                logger.error(f"Session reaper failed: {e}")
+
+    async def reap(self):
+        """Run one eviction pass"""
+        sessions = self.manager.sessions
+        now = time.time()
+        idle = [
+            sid
+            for sid, session in sessions.items()
+            if now - session.last_activity > self.idle_ttl and not self.manager.is_session_busy(sid)
+        ]
+        for session_id in idle:
+            await self._evict(session_id, "idle")
+
+        # Least recently used first
+        candidates = sorted(
+            (s for s in sessions.values() if not self.manager.is_session_busy(s.session_id)),
+            key=lambda s: s.last_activity,
+        )
+
+        while len(sessions) > self.max_sessions and candidates:
+            await self._evict(candidates.pop(0).session_id, "session limit")
+
+        sizes = {s.session_id: await asyncio.to_thread(_directory_size, s.working_dir) for s in list(sessions.values())}
+        self.disk_usage = sum(sizes.values())
+        while self.disk_usage > self.disk_budget and candidates:
+            victim = candidates.pop(0)
+            self.disk_usage -= sizes.get(victim.session_id, 0)
+            await self._evict(victim.session_id, "disk budget")
+
+    async def _evict(self, session_id: str, reason: str):
+        if session_id not in self.manager.sessions:
+            return
+        logger.info(f"Evicting session {session_id} ({reason})")
+        await self.manager.cleanup_session(session_id, forget=False)
+        self.evicted += 1
+
+    def stats(self) -> Dict[str, Any]:
+        return {"evicted": self.evicted, "disk_usage_bytes": self.disk_usage}
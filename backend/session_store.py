@@ -0,0 +1,221 @@
+"""
+Durable session store shared by every uvicorn worker on the host
+"""
+
+import asyncio
+import logging
+import os
+import sqlite3
+import threading
+from typing import Any, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_STATE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "llm-assistant")
+
+SESSION_FIELDS = ("session_id", "working_dir", "created_at", "last_activity", "message_count", "cli_session_id")
+
+
+class SessionStore:
+    """In-memory session store and the interface every backend implements.
+
+    Writes (``save_session``, ``append_message``) are fire-and-forget so they never
+    sit on the request path; reads are coroutines.
+    """
+
+    def __init__(self):
+        self._sessions: Dict[str, Dict[str, Any]] = {}
+        self._messages: Dict[str, List[Dict[str, Any]]] = {}
+
+    async def start(self):
+        pass
+
+    async def close(self):
+        pass
+
+    async def flush(self):
+        """Make every queued write visible to readers"""
+
+    def save_session(self, record: Dict[str, Any]):
+        self._sessions[record["session_id"]] = dict(record)
+
+    def append_message(self, session_id: str, entry: Dict[str, Any]):
+        self._messages.setdefault(session_id, []).append(dict(entry))
+
+    async def get_session(self, session_id: str) -> Optional[Dict[str, Any]]:
+        record = self._sessions.get(session_id)
+        return dict(record) if record is not None else None
+
+    async def recent_messages(self, session_id: str, limit: int) -> List[Dict[str, Any]]:
+        return [dict(m) for m in self._messages.get(session_id, [])[-limit:]]
+
+    async def list_sessions(self, limit: int, offset: int) -> Tuple[List[Dict[str, Any]], int]:
+        records = sorted(self._sessions.values(), key=lambda r: r["last_activity"], reverse=True)
+        return [dict(r) for r in records[offset : offset + limit]], len(records)
+
+    async def delete_session(self, session_id: str):
+        self._sessions.pop(session_id, None)
+        self._messages.pop(session_id, None)
+
+
+class SQLiteSessionStore(SessionStore):
+    """SQLite (WAL mode) store with batched writes.
+
+    Session rows are indexed by ``session_id`` and ``last_activity``; messages are
+    append-only rows indexed by session. Writes are queued and committed by a
+    background task in one transaction per batch, so many turns cost one fsync.
+    WAL lets every uvicorn worker read while another writes, and a cold start only
+    opens the file: sessions are loaded lazily through the index when first used.
+    """
+
+    def __init__(self, path: Optional[str] = None, batch_interval: Optional[float] = None, batch_size: int = 256):
+        super().__init__()
+        state_dir = os.getenv("CLAUDE_STATE_DIR", DEFAULT_STATE_DIR)
+        self.path = path or os.getenv("SESSION_DB_PATH", os.path.join(state_dir, "sessions.db"))
+        self.batch_interval = (
+            batch_interval if batch_interval is not None else float(os.getenv("SESSION_STORE_BATCH_MS", 50)) / 1000
+        )
+        self.batch_size = batch_size
+        self._conn: Optional[sqlite3.Connection] = None
+        self._db_lock = threading.Lock()
+        self._pending: List[Tuple[str, tuple]] = []
+        self._flush_lock = asyncio.Lock()
+        self._wakeup = asyncio.Event()
+        self._writer: Optional[asyncio.Task] = None
+
+    def _connect(self):
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        conn = sqlite3.connect(self.path, check_same_thread=False, timeout=30)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS sessions (
+                session_id TEXT PRIMARY KEY,
+                working_dir TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                last_activity REAL NOT NULL,
+                message_count INTEGER NOT NULL DEFAULT 0,
+                cli_session_id TEXT
+            );
+            CREATE INDEX IF NOT EXISTS idx_sessions_last_activity ON sessions (last_activity DESC);
+            CREATE TABLE IF NOT EXISTS messages (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                session_id TEXT NOT NULL,
+                role TEXT NOT NULL,
+                content TEXT,
+                timestamp REAL
+            );
+            CREATE INDEX IF NOT EXISTS idx_messages_session ON messages (session_id, id);
+            """
+        )
+        conn.commit()
+        self._conn = conn
+
+    async def start(self):
+        await asyncio.to_thread(self._connect)
+        self._writer = asyncio.create_task(self._write_loop())
+        logger.info(f"Session store opened at {self.path}")
+
+    async def close(self):
+        if self._writer is not None:
+            self._writer.cancel()
+            self._writer = None
+        await self.flush()
+        if self._conn is not None:
+            await asyncio.to_thread(self._conn.close)
+            self._conn = None
+
+    def save_session(self, record: Dict[str, Any]):
+        self._enqueue(
+            "INSERT INTO sessions (session_id, working_dir, created_at, last_activity, message_count, cli_session_id) "
+            "VALUES (?, ?, ?, ?, ?, ?) "
+            "ON CONFLICT(session_id) DO UPDATE SET working_dir = excluded.working_dir, "
+            "last_activity = excluded.last_activity, message_count = excluded.message_count, "
+            "cli_session_id = excluded.cli_session_id",
+            tuple(record.get(field) for field in SESSION_FIELDS),
+        )
+
+    def append_message(self, session_id: str, entry: Dict[str, Any]):
+        self._enqueue(
+            "INSERT INTO messages (session_id, role, content, timestamp) VALUES (?, ?, ?, ?)",
+            (session_id, entry.get("role"), entry.get("content"), entry.get("timestamp")),
+        )
+
+    def _enqueue(self, sql: str, params: tuple):
+        self._pending.append((sql, params))
+        if len(self._pending) >= self.batch_size:
+            self._wakeup.set()
+
+    def _execute_batch(self, batch: List[Tuple[str, tuple]]):
+        with self._db_lock:
+            with self._conn:
+                for sql, params in batch:
+                    self._conn.execute(sql, params)
+
+    async def flush(self):
+        # Holding the lock also waits for a batch the writer task is committing
+        async with self._flush_lock:
+            if not self._pending or self._conn is None:
+                return
+            batch, self._pending = self._pending, []
+            try:
+                await asyncio.to_thread(self._execute_batch, batch)
+            except sqlite3.Error as e:
+                logger.error(f"Failed to write {len(batch)} session store rows: {e}")
+
+    async def _write_loop(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.batch_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            await self.flush()
+
+    def _query(self, sql: str, params: tuple = ()) -> List[Dict[str, Any]]:
+        with self._db_lock:
+            return [dict(row) for row in self._conn.execute(sql, params).fetchall()]
+
+    async def get_session(self, session_id: str) -> Optional[Dict[str, Any]]:
+        await self.flush()
+        rows = await asyncio.to_thread(self._query, "SELECT * FROM sessions WHERE session_id = ?", (session_id,))
+        return rows[0] if rows else None
+
+    async def recent_messages(self, session_id: str, limit: int) -> List[Dict[str, Any]]:
+        rows = await asyncio.to_thread(
+            self._query,
+            "SELECT role, content, timestamp FROM messages WHERE session_id = ? ORDER BY id DESC LIMIT ?",
+            (session_id, limit),
+        )
+        return list(reversed(rows))
+
+    async def list_sessions(self, limit: int, offset: int) -> Tuple[List[Dict[str, Any]], int]:
+        await self.flush()
+        rows = await asyncio.to_thread(
+            self._query, "SELECT * FROM sessions ORDER BY last_activity DESC LIMIT ? OFFSET ?", (limit, offset)
+        )
+        total = await asyncio.to_thread(self._query, "SELECT COUNT(*) AS n FROM sessions")
+        return rows, total[0]["n"]
+
+    async def delete_session(self, session_id: str):
+        await self.flush()
+
+        def delete():
+            with self._db_lock:
+                with self._conn:
+                    self._conn.execute("DELETE FROM messages WHERE session_id = ?", (session_id,))
+                    self._conn.execute("DELETE FROM sessions WHERE session_id = ?", (session_id,))
+
+        await asyncio.to_thread(delete)
+
+
+def create_session_store() -> SessionStore:
+    """Build the store selected by ``SESSION_STORE`` (``sqlite`` or ``memory``)"""
+    backend = os.getenv("SESSION_STORE", "sqlite").lower()
+    if backend == "memory":
+        return SessionStore()
+    if backend != "sqlite":
+        logger.warning(f"Unknown SESSION_STORE '{backend}', using sqlite")
+    return SQLiteSessionStore()
@@ -0,0 +1,119 @@
+"""
+Time/size-based coalescing of stream events into WebSocket frames
+"""
+
+import asyncio
+import os
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+
+class BatchingStats:
+    """Counters shared by every batcher, reported on the stats endpoint"""
+
+    def __init__(self):
+        self.events = 0
+        self.frames = 0
+        self.size_flushes = 0
+        self.timer_flushes = 0
+        self.forced_flushes = 0
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "events": self.events,
+            "frames": self.frames,
+            "events_per_frame": round(self.events / self.frames, 2) if self.frames else 0.0,
+            "size_flushes": self.size_flushes,
+            "timer_flushes": self.timer_flushes,
+            "forced_flushes": self.forced_flushes,
+        }
+
+
+batching_stats = BatchingStats()
+
+
+class StreamBatcher:
+    """Merges the stream events of one run on a connection into one frame per time window.
+
+    A batch is flushed when the window elapses, when its estimated size reaches
+    ``max_bytes``, or explicitly via ``flush`` (before the final response is sent).
+    A single buffered event is sent as a plain ``stream`` frame; several are sent as
+    one ``stream_batch`` frame whose ``data`` is the list of events. Frames carry the
+    ``request_id`` of the run they belong to when one is given.
+    """
+
+    def __init__(
+        self,
+        send: Callable[[Dict[str, Any]], Awaitable[None]],
+        window: Optional[float] = None,
+        max_bytes: Optional[int] = None,
+        stats: BatchingStats = batching_stats,
+        request_id: Optional[str] = None,
+    ):
+        self.send = send
+        self.request_id = request_id
+        self.window = window if window is not None else float(os.getenv("STREAM_BATCH_WINDOW_MS", 30)) / 1000
+        self.max_bytes = max_bytes if max_bytes is not None else int(os.getenv("STREAM_BATCH_MAX_BYTES", 16384))
+        self.stats = stats
+        self._events: List[Dict[str, Any]] = []
+        self._bytes = 0
+        self._timer: Optional[asyncio.Task] = None
+
+    @staticmethod
+    def _estimate_size(event: Dict[str, Any]) -> int:
+        # Text deltas dominate the payload; a fixed overhead covers keys and tool events
+        return len(event.get("content") or "") + 64
+
+    async def add(self, event: Dict[str, Any]):
+        """Buffer one stream event, flushing if the batch is full"""
+        self.stats.events += 1
+        if self.window <= 0:
+            await self._send([event])
+            return
+
+        self._events.append(event)
+        self._bytes += self._estimate_size(event)
+        if self._bytes >= self.max_bytes:
+            self.stats.size_flushes += 1
+            await self._flush_now()
+        elif self._timer is None:
+            self._timer = asyncio.create_task(self._flush_later())
+
+    async def flush(self):
+        """Send everything buffered right away, e.g. before the final result"""
+        if self._events:
+            self.stats.forced_flushes += 1
+        await self._flush_now()
+
+    def close(self):
+        """Drop buffered events and stop the timer (connection is gone)"""
+        self._cancel_timer()
+        self._events = []
+        self._bytes = 0
+
+    def _cancel_timer(self):
+        if self._timer is not None and self._timer is not asyncio.current_task():
+            self._timer.cancel()
+        self._timer = None
+
+    async def _flush_later(self):
+        await asyncio.sleep(self.window)
+        self._timer = None
+        if self._events:
+            self.stats.timer_flushes += 1
+        await self._flush_now()
+
+    async def _flush_now(self):
+        self._cancel_timer()
+        events, self._events, self._bytes = self._events, [], 0
+        if events:
+            await self._send(events)
+
+    async def _send(self, events: List[Dict[str, Any]]):
+        self.stats.frames += 1
+        if len(events) == 1:
+            frame = {"type": "stream", "data": events[0]}
+        else:
+            frame = {"type": "stream_batch", "data": events}
+        if self.request_id is not None:
+            frame["request_id"] = self.request_id
+        await self.send(frame)
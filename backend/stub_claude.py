@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+"""
+Stub Claude Code CLI replaying recorded stream-json transcripts
+
+Accepts the flags the backend passes (``-p``, ``--input-format stream-json``,
+``--resume``, ...) and answers each user message on stdin by replaying a transcript
+saved with ``CLAUDE_RECORD_DIR``. Select it with ``CLAUDE_CLI_COMMAND=stub``.
+
+Environment:
+    CLAUDE_STUB_TRANSCRIPTS: Transcript file or directory. Without it, synthetic runs are generated.
+    CLAUDE_STUB_SPEED: Playback speed; 1 replays the recorded timing, 0 sends everything at once.
+    CLAUDE_STUB_JITTER: Random +/- fraction applied to every delay (e.g. 0.2).
+    CLAUDE_STUB_CHUNKS, CLAUDE_STUB_FIRST_DELAY, CLAUDE_STUB_INTERVAL: Shape of synthetic runs.
+"""
+
+import json
+import os
+import random
+import sys
+import time
+import uuid
+import zlib
+
+from cli_replay import load_transcripts, normalize_prompt, synthetic_transcript
+
+VERSION = "0.0.0 (Claude Code stub)"
+
+
+def extract_prompt(line: str) -> str:
+    """The user text of a stdin line in either the one-shot or the stream-json input shape"""
+    try:
+        data = json.loads(line)
+    except ValueError:
+        return line.strip()
+    if not isinstance(data, dict):
+        return str(data)
+    content = data.get("message", {}).get("content") if "message" in data else data.get("content")
+    if isinstance(content, list):
+        content = "".join(item.get("text", "") for item in content if isinstance(item, dict))
+    return content or ""
+
+
+class Replayer:
+    def __init__(self, session_id: str):
+        self.session_id = session_id
+        self.speed = float(os.getenv("CLAUDE_STUB_SPEED", 1))
+        self.jitter = float(os.getenv("CLAUDE_STUB_JITTER", 0))
+        source = os.getenv("CLAUDE_STUB_TRANSCRIPTS")
+        self.transcripts = load_transcripts(source) if source else []
+        self.by_prompt = {normalize_prompt(t["prompt"]): t for t in self.transcripts}
+
+    def pick(self, prompt: str):
+        transcript = self.by_prompt.get(normalize_prompt(prompt))
+        if transcript is not None:
+            return transcript
+        if self.transcripts:
+            # Unknown prompt: a stable choice so repeated benchmark runs replay the same thing
+            return self.transcripts[zlib.crc32(prompt.encode("utf-8")) % len(self.transcripts)]
+        return synthetic_transcript(
+            prompt,
+            chunks=int(os.getenv("CLAUDE_STUB_CHUNKS", 20)),
+            first_delay=float(os.getenv("CLAUDE_STUB_FIRST_DELAY", 0.5)),
+            interval=float(os.getenv("CLAUDE_STUB_INTERVAL", 0.05)),
+        )
+
+    def _delay(self, offset: float) -> float:
+        if self.speed <= 0:
+            return 0.0
+        return offset / self.speed * (1 + random.uniform(-self.jitter, self.jitter))
+
+    def replay(self, transcript) -> int:
+        started = time.monotonic()
+        due = 0.0
+        for frame in transcript["frames"]:
+            # Never earlier than the previous frame, so jitter cannot reorder events
+            due = max(due, self._delay(frame["t"]))
+            wait = started + due - time.monotonic()
+            if wait > 0:
+                time.sleep(wait)
+            sys.stdout.write(self._rewrite(frame["out"]) + "\n")
+            sys.stdout.flush()
+        return transcript["exit"]
+
+    def _rewrite(self, line: str) -> str:
+        """Report this process's conversation id instead of the recorded one, so --resume works"""
+        try:
+            event = json.loads(line)
+        except ValueError:
+            return line
+        if isinstance(event, dict) and "session_id" in event:
+            event["session_id"] = self.session_id
+            return json.dumps(event, ensure_ascii=False)
+        return line
+
+
+def main(args) -> int:
+    if "--version" in args:
+        print(VERSION)
+        return 0
+    if "--help" in args or "-h" in args:
+        print("Usage: stub_claude.py [-p] [--input-format stream-json] [--resume ID] [...]")
+        return 0
+
+    persistent = "--input-format" in args
+    session_id = args[args.index("--resume") + 1] if "--resume" in args else str(uuid.uuid4())
+    replayer = Replayer(session_id)
+    exit_code = 0
+    for line in sys.stdin:
+        if not line.strip():
+            continue
+        exit_code = replayer.replay(replayer.pick(extract_prompt(line)))
+        if not persistent:
+            break
+    return exit_code
+
+
+if __name__ == "__main__":
+    try:
+        sys.exit(main(sys.argv[1:]))
+    except (BrokenPipeError, KeyboardInterrupt):
+        sys.exit(1)
@@ -0,0 +1,394 @@
+"""
+Warm pool of persistent Claude Code CLI worker processes
+"""
+
+import asyncio
+import logging
+import os
+import time
+from collections import deque
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional, Set
+
+from codec import CLIEvent, DecodeError, ResultEvent, decode_cli_event, dumps
+from process_utils import (
+    STDERR_TAIL_LINES,
+    STREAM_LIMIT,
+    CgroupController,
+    RunLimits,
+    RunSandbox,
+    drain_to_ring,
+    iter_lines,
+)
+from workspace_pool import WorkspacePool
+
+logger = logging.getLogger(__name__)
+
+
+class WorkerDiedError(RuntimeError):
+    """Raised when a worker process exits in the middle of a turn"""
+
+
+class ClaudeWorker:
+    """A long-lived Claude Code CLI process in ``--input-format stream-json`` mode"""
+
+    def __init__(
+        self,
+        command: List[str],
+        working_dir: str,
+        env: Dict[str, str],
+        limits: Optional[RunLimits] = None,
+        cgroups: Optional[CgroupController] = None,
+    ):
+        self.command = command
+        self.working_dir = working_dir
+        self.env = env
+        self.limits = limits or RunLimits()
+        self.cgroups = cgroups
+        self.process: Optional[asyncio.subprocess.Process] = None
+        self.session_id: Optional[str] = None
+        self.lock = asyncio.Lock()
+        self.created_at = time.time()
+        self.last_used = self.created_at
+        self.turns = 0
+        self.stderr_tail: deque = deque(maxlen=STDERR_TAIL_LINES)
+        self._stderr_task: Optional[asyncio.Task] = None
+        self._lines: Optional[AsyncIterator[bytes]] = None
+        self.sandbox: Optional[RunSandbox] = None
+
+    async def start(self):
+        """Spawn the CLI process"""
+        self.sandbox = RunSandbox(self.limits, self.cgroups or CgroupController(root=""))
+        self.process = await asyncio.create_subprocess_exec(
+            *self.command,
+            stdin=asyncio.subprocess.PIPE,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE,
+            cwd=self.working_dir,
+            env=self.env,
+            limit=STREAM_LIMIT,
+            **self.sandbox.spawn_kwargs(),
+        )
+        # Idle workers are not sampled; each turn samples between monitor.begin() and end()
+        self.sandbox.attach(self.process, sample=False)
+        self._lines = iter_lines(self.process.stdout)
+        # A long-lived --verbose process must have its stderr drained or the pipe fills up
+        self._stderr_task = asyncio.create_task(drain_to_ring(self.process.stderr, self.stderr_tail))
+        logger.info(f"Spawned Claude worker pid={self.process.pid} in {self.working_dir}")
+
+    @property
+    def alive(self) -> bool:
+        return self.process is not None and self.process.returncode is None
+
+    @property
+    def busy(self) -> bool:
+        return self.lock.locked()
+
+    async def run_turn(
+        self, message: str, timeout: float, on_line: Optional[Callable[[bytes], None]] = None
+    ) -> AsyncIterator[CLIEvent]:
+        """Send one user turn and yield stream-json events up to and including its result.
+
+        The caller must hold ``self.lock`` for the whole iteration. If the iteration is
+        abandoned before the ``result`` event the worker is in an unknown state and must
+        be discarded.
+
+        Args:
+            message: User message to send.
+            timeout: Overall deadline for the turn in seconds.
+            on_line: Called with every raw stdout line (used to record transcripts).
+
+        Yields:
+            Typed CLI events (see ``codec``).
+        """
+        if not self.alive:
+            raise WorkerDiedError("Worker process is not running")
+
+        self.last_used = time.time()
+        self.turns += 1
+        self.sandbox.monitor.begin()
+        try:
+            line = dumps({"type": "user", "message": {"role": "user", "content": message}}) + b"\n"
+            self.process.stdin.write(line)
+            await self.process.stdin.drain()
+
+            loop = asyncio.get_running_loop()
+            deadline = loop.time() + timeout
+            while True:
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    raise asyncio.TimeoutError()
+                try:
+                    raw = await asyncio.wait_for(anext(self._lines), timeout=remaining)
+                except StopAsyncIteration:
+                    stderr_text = "\n".join(self.stderr_tail)
+                    raise WorkerDiedError(stderr_text or "Worker process exited unexpectedly")
+
+                if on_line is not None:
+                    on_line(raw)
+                if not raw.strip():
+                    continue
+                try:
+                    event = decode_cli_event(raw)
+                except DecodeError:
+                    logger.debug(f"Could not parse JSON line: {raw[:200]!r}")
+                    continue
+                if event is None:
+                    continue
+
+                yield event
+                if isinstance(event, ResultEvent):
+                    self.last_used = time.time()
+                    return
+        finally:
+            self.sandbox.monitor.end()
+
+    def turn_usage(self) -> Optional[Dict[str, Any]]:
+        """Peak RSS and CPU time of the process tree during the last turn"""
+        if self.sandbox is None:
+            return None
+        return self.sandbox.usage()
+
+    def kill(self):
+        """Kill the process and its children without waiting for it"""
+        if self.alive:
+            self.sandbox.kill()
+
+    async def stop(self):
+        """Kill the process and wait for it to exit"""
+        self.kill()
+        if self.process is not None:
+            await self.process.wait()
+        if self.sandbox is not None:
+            await self.sandbox.close()
+        if self._stderr_task is not None:
+            self._stderr_task.cancel()
+
+
+class ClaudeWorkerPool:
+    """Pool of pre-spawned Claude Code CLI workers pinned to chat sessions.
+
+    Spare workers are spawned ahead of time in their own workspace directory. The
+    first turn of a fresh session adopts a spare (and its directory), so no process
+    startup sits on the hot path; later turns of that session reuse the pinned worker
+    over its long-lived stdin.
+    """
+
+    def __init__(
+        self,
+        min_size: Optional[int] = None,
+        max_size: Optional[int] = None,
+        idle_timeout: Optional[float] = None,
+        health_interval: Optional[float] = None,
+        workspaces: Optional[WorkspacePool] = None,
+        limits: Optional[RunLimits] = None,
+        cgroups: Optional[CgroupController] = None,
+        workspace_env: Optional[Callable[[str], Dict[str, str]]] = None,
+    ):
+        self.min_size = min_size if min_size is not None else int(os.getenv("CLAUDE_POOL_MIN_SIZE", 1))
+        self.max_size = max_size if max_size is not None else int(os.getenv("CLAUDE_POOL_MAX_SIZE", 4))
+        self.idle_timeout = idle_timeout if idle_timeout is not None else float(os.getenv("CLAUDE_POOL_IDLE_TIMEOUT", 600))
+        self.health_interval = (
+            health_interval if health_interval is not None else float(os.getenv("CLAUDE_POOL_HEALTH_INTERVAL", 30))
+        )
+        self.workspaces = workspaces if workspaces is not None else WorkspacePool(size=0)
+        self.limits = limits if limits is not None else RunLimits.from_env()
+        self.cgroups = cgroups if cgroups is not None else CgroupController()
+        # Extra environment for a worker in a given directory (e.g. its MCP gateway workspace)
+        self.workspace_env = workspace_env
+        self.command: List[str] = []
+        self.env: Dict[str, str] = {}
+        self.spares: List[ClaudeWorker] = []
+        self.pinned: Dict[str, ClaudeWorker] = {}
+        self._spawning = 0
+        self._closed = False
+        self._replenishing: Set[asyncio.Task] = set()
+        self._maintenance_task: Optional[asyncio.Task] = None
+
+    @property
+    def size(self) -> int:
+        return len(self.spares) + len(self.pinned) + self._spawning
+
+    async def start(self, command: List[str], env: Optional[Dict[str, str]] = None):
+        """Start the pool and its maintenance loop.
+
+        Args:
+            command: Full CLI command line for a worker, including stream-json flags.
+            env: Environment for the worker processes.
+        """
+        self.command = command
+        self.env = env if env is not None else os.environ.copy()
+        await self._replenish()
+        self._maintenance_task = asyncio.create_task(self._maintenance_loop())
+        logger.info(f"Claude worker pool started (min={self.min_size}, max={self.max_size})")
+
+    async def shutdown(self):
+        """Stop every worker and the maintenance loop"""
+        self._closed = True
+        if self._maintenance_task is not None:
+            self._maintenance_task.cancel()
+            self._maintenance_task = None
+        # Let in-flight spawns finish so their processes are disposed rather than orphaned
+        await asyncio.gather(*self._replenishing, return_exceptions=True)
+        workers = self.spares + list(self.pinned.values())
+        self.spares = []
+        self.pinned = {}
+        await asyncio.gather(*(self._dispose(w) for w in workers), return_exceptions=True)
+
+    async def acquire(self, session, extra_args: Optional[List[str]] = None, fresh: bool = False) -> Optional[ClaudeWorker]:
+        """Get the worker pinned to ``session``, pinning a new one if needed.
+
+        Args:
+            session: The ChatSession the turn belongs to.
+            extra_args: Extra CLI arguments (e.g. ``--resume``) for a worker spawned for this session.
+                Sessions that need them never adopt a spare.
+            fresh: The session has not run a turn yet, so its directory can be swapped for a spare's.
+
+        Returns:
+            A live worker, or None when the pool is at capacity with every worker busy.
+        """
+        worker = self.pinned.get(session.session_id)
+        if worker is not None:
+            if worker.alive:
+                return worker
+            logger.warning(f"Pinned worker for session {session.session_id} died, respawning")
+            await self.discard(worker)
+
+        # Only a session that has not run yet can move into a spare's directory
+        spare = self._pop_spare() if fresh and not extra_args else None
+        if spare is not None:
+            self.workspaces.release(session.working_dir)
+            session.working_dir = spare.working_dir
+            self._pin(spare, session.session_id)
+            task = asyncio.create_task(self._replenish())
+            self._replenishing.add(task)
+            task.add_done_callback(self._replenishing.discard)
+            return spare
+
+        # Re-checked after each eviction: another acquire may have taken the slot meanwhile
+        while self.size >= self.max_size:
+            if not await self._evict_idle():
+                return None
+
+        worker = ClaudeWorker(
+            self.command + (extra_args or []), session.working_dir, self._env(session.working_dir), self.limits, self.cgroups
+        )
+        self._spawning += 1
+        try:
+            await worker.start()
+        finally:
+            self._spawning -= 1
+        self._pin(worker, session.session_id)
+        return worker
+
+    async def discard(self, worker: ClaudeWorker):
+        """Remove a worker from the pool and stop it"""
+        if worker in self.spares:
+            self.spares.remove(worker)
+        if worker.session_id is not None and self.pinned.get(worker.session_id) is worker:
+            del self.pinned[worker.session_id]
+        await self._dispose(worker)
+
+    def release_session(self, session_id: str):
+        """Kill the worker pinned to a session that is being cleaned up"""
+        worker = self.pinned.pop(session_id, None)
+        if worker is not None:
+            worker.kill()
+            # Reap it and release its cgroup in the background
+            asyncio.create_task(worker.stop())
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "spare": len(self.spares),
+            "pinned": len(self.pinned),
+            "busy": sum(1 for w in self.pinned.values() if w.busy),
+            "spawning": self._spawning,
+        }
+
+    def _env(self, working_dir: str) -> Dict[str, str]:
+        if self.workspace_env is None:
+            return self.env
+        return {**self.env, **self.workspace_env(working_dir)}
+
+    def _pin(self, worker: ClaudeWorker, session_id: str):
+        worker.session_id = session_id
+        self.pinned[session_id] = worker
+
+    def _pop_spare(self) -> Optional[ClaudeWorker]:
+        while self.spares:
+            worker = self.spares.pop(0)
+            if worker.alive:
+                return worker
+            asyncio.create_task(self._dispose(worker))
+        return None
+
+    async def _evict_idle(self) -> bool:
+        """Stop the least recently used idle worker to make room. Returns True on success."""
+        candidates = [w for w in self.spares] + [w for w in self.pinned.values() if not w.busy]
+        if not candidates:
+            return False
+        victim = min(candidates, key=lambda w: w.last_used)
+        # Wait for it to exit so the pool never runs more than max_size processes
+        await self.discard(victim)
+        return True
+
+    async def _spawn_spare(self):
+        working_dir = await self.workspaces.acquire()
+        worker = ClaudeWorker(self.command, working_dir, self._env(working_dir), self.limits, self.cgroups)
+        self._spawning += 1
+        try:
+            await worker.start()
+        except Exception as e:
+            logger.error(f"Failed to spawn Claude worker: {e}")
+            self.workspaces.release(working_dir)
+            return
+        finally:
+            self._spawning -= 1
+        if self._closed:
+            # Finished starting after shutdown
+            await self._dispose(worker)
+            return
+        self.spares.append(worker)
+
+    async def _replenish(self):
+        if self._closed:
+            return
+        missing = min(self.min_size - len(self.spares) - self._spawning, self.max_size - self.size)
+        if missing > 0:
+            await asyncio.gather(*(self._spawn_spare() for _ in range(missing)))
+
+    async def _dispose(self, worker: ClaudeWorker):
+        await worker.stop()
+        # Spares own their directory; pinned workers run in a directory owned by the session
+        if worker.session_id is None:
+            self.workspaces.release(worker.working_dir)
+
+    async def _maintenance_loop(self):
+        while True:
+            await asyncio.sleep(self.health_interval)
+            try:
+                await self._check_health()
+            except Exception as e:
+                logger.error(f"Worker pool maintenance failed: {e}")
+
+    async def _check_health(self):
+        now = time.time()
+
+        for worker in list(self.spares) + list(self.pinned.values()):
+            if not worker.busy and not worker.alive:
+                logger.warning(f"Claude worker pid={worker.process.pid if worker.process else None} exited, removing")
+                await self.discard(worker)
+
+        for worker in list(self.pinned.values()):
+            if not worker.busy and now - worker.last_used > self.idle_timeout:
+                logger.info(f"Reaping idle worker for session {worker.session_id}")
+                await self.discard(worker)
+
+        surplus = len(self.spares) - self.min_size
+        for worker in sorted(self.spares, key=lambda w: w.last_used):
+            if surplus <= 0:
+                break
+            if now - worker.last_used > self.idle_timeout:
+                await self.discard(worker)
+                surplus -= 1
+
+        await self._replenish()
@@ -0,0 +1,145 @@
+"""
+Pool of pre-created, template-seeded session working directories
+"""
+
+import asyncio
+import fcntl
+import logging
+import os
+import shutil
+import tempfile
+import uuid
+from collections import deque
+from functools import partial
+from typing import Deque, Dict, Optional, Set
+
+logger = logging.getLogger(__name__)
+
+# ioctl request for a copy-on-write clone of a whole file (btrfs, XFS, bcachefs)
+FICLONE = 0x40049409
+
+SEED_MODES = ("reflink", "hardlink", "copy")
+
+
+def _clone_file(src: str, dst: str, mode: str = "reflink"):
+    """Copy one template file, sharing its data blocks when the filesystem allows it"""
+    if mode == "hardlink":
+        try:
+            os.link(src, dst)
+            return
+        except OSError:
+            pass
+    elif mode == "reflink":
+        try:
+            with open(src, "rb") as s, open(dst, "wb") as d:
+                fcntl.ioctl(d.fileno(), FICLONE, s.fileno())
+            shutil.copystat(src, dst)
+            return
+        except OSError:
+            pass
+    shutil.copy2(src, dst)
+
+
+class WorkspacePool:
+    """Keeps ``size`` session directories ready so creating a session is a pop.
+
+    Directories are created under ``root`` (a tmpfs mount works well) and seeded from
+    ``template`` with reflinks, hardlinks or plain copies. Hardlinks share inodes with
+    the template, so only use them for templates the CLI never edits in place. Released
+    directories are renamed out of the way at once and deleted in the background.
+    """
+
+    def __init__(
+        self,
+        root: Optional[str] = None,
+        template: Optional[str] = None,
+        size: Optional[int] = None,
+        seed_mode: Optional[str] = None,
+    ):
+        self.root = root or os.getenv("WORKSPACE_ROOT") or tempfile.gettempdir()
+        self.template = template or os.getenv("WORKSPACE_TEMPLATE") or None
+        self.size = size if size is not None else int(os.getenv("WORKSPACE_POOL_SIZE", 4))
+        self.seed_mode = (seed_mode or os.getenv("WORKSPACE_SEED_MODE", "reflink")).lower()
+        if self.seed_mode not in SEED_MODES:
+            logger.warning(f"Unknown WORKSPACE_SEED_MODE '{self.seed_mode}', using copy")
+            self.seed_mode = "copy"
+        self._ready: Deque[str] = deque()
+        self._refill = asyncio.Event()
+        self._refill_task: Optional[asyncio.Task] = None
+        self._releasing: Set[asyncio.Task] = set()
+        self.misses = 0
+
+    async def start(self):
+        """Create the root and start filling the pool in the background"""
+        os.makedirs(self.root, exist_ok=True)
+        if self.template and not os.path.isdir(self.template):
+            logger.warning(f"Workspace template {self.template} does not exist, directories will be empty")
+            self.template = None
+        self._refill_task = asyncio.create_task(self._refill_loop())
+        self._refill.set()
+
+    async def stop(self):
+        """Stop refilling, delete unused directories and wait for pending deletions"""
+        if self._refill_task is not None:
+            self._refill_task.cancel()
+            self._refill_task = None
+        while self._ready:
+            self.release(self._ready.popleft())
+        if self._releasing:
+            await asyncio.gather(*self._releasing, return_exceptions=True)
+
+    async def acquire(self) -> str:
+        """Take a seeded directory, provisioning one on the spot if the pool is empty"""
+        self._refill.set()
+        if self._ready:
+            return self._ready.popleft()
+        self.misses += 1
+        return await asyncio.to_thread(self._provision)
+
+    async def restore(self, path: str):
+        """Recreate a known session directory (e.g. after eviction), seeding it if it was gone"""
+        if os.path.isdir(path):
+            return
+        await asyncio.to_thread(self._seed, path)
+
+    def release(self, path: str):
+        """Give a directory back; it is deleted in the background"""
+        trash = os.path.join(os.path.dirname(path), f".{os.path.basename(path)}.released-{uuid.uuid4().hex[:8]}")
+        try:
+            # Free the path immediately so a returning session can recreate it safely
+            os.rename(path, trash)
+        except FileNotFoundError:
+            return
+        except OSError as e:
+            logger.warning(f"Failed to release workspace {path}: {e}")
+            return
+        task = asyncio.create_task(asyncio.to_thread(shutil.rmtree, trash, True))
+        self._releasing.add(task)
+        task.add_done_callback(self._releasing.discard)
+
+    def stats(self) -> Dict[str, int]:
+        return {"ready": len(self._ready), "misses": self.misses, "releasing": len(self._releasing)}
+
+    def _seed(self, path: str):
+        if self.template:
+            shutil.copytree(
+                self.template, path, symlinks=True, copy_function=partial(_clone_file, mode=self.seed_mode), dirs_exist_ok=True
+            )
+        else:
+            os.makedirs(path, exist_ok=True)
+
+    def _provision(self) -> str:
+        path = tempfile.mkdtemp(prefix="claude_session_", dir=self.root)
+        self._seed(path)
+        return path
+
+    async def _refill_loop(self):
+        while True:
+            await self._refill.wait()
+            self._refill.clear()
+            while len(self._ready) < self.size:
+                try:
+                    self._ready.append(await asyncio.to_thread(self._provision))
+                except OSError as e:
+                    logger.error(f"Failed to provision workspace under {self.root}: {e}")
+                    break
@@ -0,0 +1,129 @@
+"""
+Microbenchmark for the CLI event codec (backend/codec.py)
+
+Measures events/sec for decoding stream-json lines and for encoding WebSocket frames,
+comparing the previous json.loads + ``get("type")`` chain with each installed codec.
+
+    uv run python benchmarks/codec_bench.py [--events 50000] [--repeat 5]
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "backend"))
+
+import codec  # noqa: E402
+
+
+def sample_lines():
+    """A typical turn: init, a few assistant chunks, tool calls and the result"""
+    events = [
+        {"type": "system", "subtype": "init", "session_id": "0b7f", "tools": ["Bash", "Read", "Edit"], "model": "x"},
+        {
+            "type": "assistant",
+            "message": {
+                "id": "msg_1",
+                "role": "assistant",
+                "content": [{"type": "text", "text": "ファイルを確認します。" * 8}],
+                "usage": {"input_tokens": 1200, "output_tokens": 48},
+            },
+            "session_id": "0b7f",
+        },
+        {
+            "type": "assistant",
+            "message": {
+                "id": "msg_2",
+                "role": "assistant",
+                "content": [{"type": "tool_use", "id": "tu_1", "name": "Read", "input": {"file_path": "/tmp/notes.md"}}],
+            },
+            "session_id": "0b7f",
+        },
+        {
+            "type": "user",
+            "message": {"role": "user", "content": [{"type": "tool_result", "tool_use_id": "tu_1", "content": "x" * 2000}]},
+        },
+        {
+            "type": "assistant",
+            "message": {"id": "msg_3", "role": "assistant", "content": [{"type": "text", "text": "Done. " * 40}]},
+        },
+        {"type": "result", "subtype": "success", "result": "Done. " * 40, "is_error": False, "session_id": "0b7f"},
+    ]
+    return [json.dumps(e, ensure_ascii=False).encode("utf-8") for e in events]
+
+
+def legacy_decode(line):
+    """The previous path: stdlib json.loads and a chain of type comparisons"""
+    data = json.loads(line)
+    kind = data.get("type")
+    if kind == "assistant":
+        for item in data.get("message", {}).get("content", []):
+            if item.get("type") == "text":
+                item.get("text", "")
+    elif kind == "tool_use":
+        data.get("name", "")
+    elif kind == "result":
+        data.get("result", "")
+    elif kind == "system":
+        data.get("subtype", "")
+    return data
+
+
+def legacy_encode(frame):
+    return json.dumps(frame)
+
+
+def measure(fn, items, count, repeat):
+    """Best-of-``repeat`` events/sec of ``fn`` over ``count`` items"""
+    batch = (items * (count // len(items) + 1))[:count]
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for item in batch:
+            fn(item)
+        best = min(best, time.perf_counter() - start)
+    return count / best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--events", type=int, default=50000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    lines = sample_lines()
+    frames = [
+        {"type": "stream", "request_id": "r1", "data": {"session_id": "0b7f", "seq": i, "content": "チャンク " * 20}}
+        for i in range(len(lines))
+    ]
+
+    rows = [
+        (
+            "legacy",
+            measure(legacy_decode, lines, args.events, args.repeat),
+            measure(legacy_encode, frames, args.events, args.repeat),
+        )
+    ]
+    for name in codec.AVAILABLE_CODECS:
+        codec.codec = codec.select_codec(name)
+        rows.append(
+            (
+                name,
+                measure(codec.decode_cli_event, lines, args.events, args.repeat),
+                measure(codec.dumps_text, frames, args.events, args.repeat),
+            )
+        )
+
+    baseline_decode, baseline_encode = rows[0][1], rows[0][2]
+    print(f"{'codec':<10}{'decode ev/s':>14}{'speedup':>9}{'encode fr/s':>14}{'speedup':>9}")
+    for name, decode_rate, encode_rate in rows:
+        print(
+            f"{name:<10}{decode_rate:>14,.0f}{decode_rate / baseline_decode:>8.2f}x"
+            f"{encode_rate:>14,.0f}{encode_rate / baseline_encode:>8.2f}x"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,287 @@
+"""
+Load test for the backend against the stub CLI
+
+Starts the backend with ``CLAUDE_CLI_COMMAND=stub`` (replaying recorded transcripts or
+synthetic runs), drives it with N concurrent clients over ``/ws/{client_id}`` or the
+REST chat endpoints, and reports time-to-first-token, latency, throughput and the
+server's CPU and RSS. No network access or Claude account is needed.
+
+    uv run python benchmarks/load_test.py --clients 20 --requests 5 --mode ws
+    uv run python benchmarks/load_test.py --mode stream --transcripts recordings/ --speed 2 --jitter 0.2
+
+Server CPU and RSS are read from /proc, so they are only reported on Linux.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+from typing import Dict, List, Optional, Tuple
+
+import httpx
+import websockets
+
+BACKEND_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "backend")
+CLK_TCK = os.sysconf("SC_CLK_TCK") if hasattr(os, "sysconf") else 100
+
+
+def percentile(values: List[float], p: float) -> Optional[float]:
+    """Nearest-rank percentile"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, int(round(p / 100 * len(ordered) + 0.5)) - 1))
+    return ordered[index]
+
+
+class ProcessSampler:
+    """Samples CPU time and RSS of a process and its children from /proc"""
+
+    def __init__(self, pid: int, interval: float = 0.1):
+        self.pid = pid
+        self.interval = interval
+        self.peak_rss = 0
+        self._task: Optional[asyncio.Task] = None
+        self._cpu_start = None
+
+    def cpu_seconds(self) -> Optional[Dict[str, float]]:
+        try:
+            with open(f"/proc/{self.pid}/stat", "r") as f:
+                # Fields after the parenthesized command name; utime is field 14
+                fields = f.read().rsplit(")", 1)[1].split()
+        except OSError:
+            return None
+        utime, stime, cutime, cstime = (int(v) / CLK_TCK for v in fields[11:15])
+        return {"server": utime + stime, "children": cutime + cstime}
+
+    def rss_bytes(self) -> int:
+        try:
+            with open(f"/proc/{self.pid}/status", "r") as f:
+                for line in f:
+                    if line.startswith("VmRSS:"):
+                        return int(line.split()[1]) * 1024
+        except OSError:
+            pass
+        return 0
+
+    async def _loop(self):
+        while True:
+            self.peak_rss = max(self.peak_rss, self.rss_bytes())
+            await asyncio.sleep(self.interval)
+
+    def start(self):
+        self._cpu_start = self.cpu_seconds()
+        self._task = asyncio.create_task(self._loop())
+
+    def stop(self) -> Dict[str, Optional[float]]:
+        self._task.cancel()
+        end = self.cpu_seconds()
+        if end is None or self._cpu_start is None:
+            return {"server_cpu_seconds": None, "cli_cpu_seconds": None, "peak_rss_mb": None}
+        return {
+            "server_cpu_seconds": round(end["server"] - self._cpu_start["server"], 3),
+            # Only exited, reaped CLI processes are counted here
+            "cli_cpu_seconds": round(end["children"] - self._cpu_start["children"], 3),
+            "peak_rss_mb": round(self.peak_rss / 1024 / 1024, 1),
+        }
+
+
+class Result:
+    def __init__(self):
+        self.ttft: List[float] = []
+        self.latency: List[float] = []
+        self.errors = 0
+        self.bytes = 0
+
+
+async def ws_client(base_url: str, client: int, requests: int, result: Result):
+    url = base_url.replace("http", "ws", 1) + f"/ws/bench-{client}"
+    async with websockets.connect(url, max_size=None) as ws:
+        for i in range(requests):
+            request_id = uuid.uuid4().hex
+            started = time.perf_counter()
+            first = None
+            await ws.send(
+                json.dumps(
+                    {"type": "message", "request_id": request_id, "message": f"benchmark {i}", "session_id": f"bench-{client}"}
+                )
+            )
+            while True:
+                frame = json.loads(await ws.recv())
+                if frame.get("request_id") != request_id:
+                    continue
+                kind = frame.get("type")
+                if kind in ("stream", "stream_batch"):
+                    events = frame["data"] if kind == "stream_batch" else [frame["data"]]
+                    for event in events:
+                        if event.get("type") == "text":
+                            first = first or time.perf_counter()
+                            result.bytes += len(event["content"].encode("utf-8"))
+                elif kind == "response":
+                    end = time.perf_counter()
+                    if not frame["data"]["success"]:
+                        result.errors += 1
+                    break
+                elif kind in ("busy", "error"):
+                    end = time.perf_counter()
+                    result.errors += 1
+                    break
+            result.latency.append(end - started)
+            result.ttft.append((first or end) - started)
+
+
+async def rest_client(base_url: str, client: int, requests: int, result: Result, stream: bool):
+    async with httpx.AsyncClient(base_url=base_url, timeout=None) as http:
+        for i in range(requests):
+            body = {"message": f"benchmark {i}", "session_id": f"bench-{client}"}
+            started = time.perf_counter()
+            if not stream:
+                # /api/chat answers in one piece, so the first token arrives with the response
+                response = await http.post("/api/chat", json=body)
+                end = time.perf_counter()
+                ok = response.status_code == 200 and response.json()["success"]
+                if ok:
+                    result.bytes += len(response.json()["response"].encode("utf-8"))
+                result.errors += 0 if ok else 1
+                result.latency.append(end - started)
+                result.ttft.append(end - started)
+                continue
+
+            first = None
+            ok = False
+            async with http.stream("POST", "/api/chat/stream?format=ndjson", json=body) as response:
+                async for line in response.aiter_lines():
+                    if not line.strip():
+                        continue
+                    event = json.loads(line)
+                    if event["type"] == "text":
+                        first = first or time.perf_counter()
+                        result.bytes += len(event["content"].encode("utf-8"))
+                    elif event["type"] == "result":
+                        ok = event["success"]
+            end = time.perf_counter()
+            result.errors += 0 if ok else 1
+            result.latency.append(end - started)
+            result.ttft.append((first or end) - started)
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_server(args, state_dir: str) -> Tuple[subprocess.Popen, str]:
+    port = free_port()
+    env = {
+        **os.environ,
+        "CLAUDE_CLI_COMMAND": "stub",
+        "CLAUDE_STATE_DIR": state_dir,
+        "CLAUDE_STUB_SPEED": str(args.speed),
+        "CLAUDE_STUB_JITTER": str(args.jitter),
+        "PORT": str(port),
+    }
+    if args.transcripts:
+        env["CLAUDE_STUB_TRANSCRIPTS"] = os.path.abspath(args.transcripts)
+    for assignment in args.env:
+        key, _, value = assignment.partition("=")
+        env[key] = value
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1", "--port", str(port), "--log-level", "warning"],
+        cwd=BACKEND_DIR,
+        env=env,
+        stdout=None if args.verbose else subprocess.DEVNULL,
+        stderr=None if args.verbose else subprocess.DEVNULL,
+    )
+    return process, f"http://127.0.0.1:{port}"
+
+
+async def wait_ready(base_url: str, timeout: float = 30):
+    deadline = time.monotonic() + timeout
+    async with httpx.AsyncClient(base_url=base_url) as http:
+        while time.monotonic() < deadline:
+            try:
+                if (await http.get("/ready")).status_code == 200:
+                    return
+            except httpx.TransportError:
+                pass
+            await asyncio.sleep(0.2)
+    raise RuntimeError("Backend did not become ready")
+
+
+async def run(args) -> Dict[str, object]:
+    with tempfile.TemporaryDirectory(prefix="llm-assistant-bench-") as state_dir:
+        process, base_url = start_server(args, state_dir)
+        try:
+            await wait_ready(base_url)
+            sampler = ProcessSampler(process.pid)
+            result = Result()
+            sampler.start()
+            started = time.perf_counter()
+            if args.mode == "ws":
+                clients = [ws_client(base_url, c, args.requests, result) for c in range(args.clients)]
+            else:
+                clients = [rest_client(base_url, c, args.requests, result, args.mode == "stream") for c in range(args.clients)]
+            await asyncio.gather(*clients)
+            elapsed = time.perf_counter() - started
+            resources = sampler.stop()
+        finally:
+            process.terminate()
+            try:
+                process.wait(10)
+            except subprocess.TimeoutExpired:
+                process.kill()
+
+    def ms(value):
+        return round(value * 1000, 1) if value is not None else None
+
+    completed = len(result.latency)
+    return {
+        "mode": args.mode,
+        "clients": args.clients,
+        "requests": completed,
+        "errors": result.errors,
+        "elapsed_seconds": round(elapsed, 3),
+        "throughput_rps": round(completed / elapsed, 2) if elapsed else None,
+        "streamed_kb_per_second": round(result.bytes / 1024 / elapsed, 1) if elapsed else None,
+        "ttft_p50_ms": ms(percentile(result.ttft, 50)),
+        "ttft_p99_ms": ms(percentile(result.ttft, 99)),
+        "latency_p50_ms": ms(percentile(result.latency, 50)),
+        "latency_p99_ms": ms(percentile(result.latency, 99)),
+        "server_cpu_percent": (
+            round(resources["server_cpu_seconds"] / elapsed * 100, 1) if resources["server_cpu_seconds"] is not None else None
+        ),
+        **resources,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--clients", type=int, default=10, help="Concurrent simulated clients")
+    parser.add_argument("--requests", type=int, default=5, help="Requests per client, sent one after another")
+    parser.add_argument("--mode", choices=("ws", "rest", "stream"), default="ws", help="ws, /api/chat or /api/chat/stream")
+    parser.add_argument("--transcripts", help="Transcript file or directory recorded with CLAUDE_RECORD_DIR")
+    parser.add_argument("--speed", type=float, default=1.0, help="Replay speed; 0 replays without delays")
+    parser.add_argument("--jitter", type=float, default=0.0, help="Random +/- fraction applied to replay delays")
+    parser.add_argument("--env", action="append", default=[], metavar="KEY=VALUE", help="Extra backend environment")
+    parser.add_argument("--json", action="store_true", help="Print the report as JSON")
+    parser.add_argument("--verbose", action="store_true", help="Show the backend's log output")
+    args = parser.parse_args()
+
+    report = asyncio.run(run(args))
+    if args.json:
+        print(json.dumps(report, indent=2))
+        return
+    width = max(len(key) for key in report)
+    for key, value in report.items():
+        print(f"{key:<{width}}  {value}")
+
+
+if __name__ == "__main__":
+    main()
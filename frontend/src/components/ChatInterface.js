@@ -1,87 +1,292 @@
-import React, { useState, useEffect, useRef } from 'react';
-import axios from 'axios';
-import { marked } from 'marked';
-import hljs from 'highlight.js';
+import React, { useState, useEffect, useRef, memo } from 'react';
 import 'highlight.js/styles/github-dark.css';
 import './ChatInterface.css';
 import VoiceRecognition from './VoiceRecognition';
+import VirtualMessageList from './VirtualMessageList';
+import { MarkdownBlock, StreamingMarkdown } from './Markdown';
 
-// Configure marked for code highlighting
-marked.setOptions({
-  highlight: function(code, lang) {
-    if (lang && hljs.getLanguage(lang)) {
-      try {
-        return hljs.highlight(code, { language: lang }).value;
-      } catch (err) {}
-    }
-    try {
-      return hljs.highlightAuto(code).value;
-    } catch (err) {
-      return code;
-    }
+const frameDecoder = new TextDecoder();
+
+// Distance from the bottom within which the view keeps following new output
+const STICK_TO_BOTTOM_PX = 80;
+
+// Each tab has its own chat session (and so its own CLI conversation), kept across reloads of that tab
+const SESSION_STORAGE_KEY = 'llm-assistant-session-id';
+
+const newSessionId = () => {
+  if (crypto.randomUUID) {
+    return crypto.randomUUID();
   }
-});
+  // randomUUID needs a secure context; plain http (e.g. over Tailscale) only has getRandomValues
+  return Array.from(crypto.getRandomValues(new Uint8Array(16)), (b) => b.toString(16).padStart(2, '0')).join('');
+};
+
+const getSessionId = () => {
+  let sessionId = sessionStorage.getItem(SESSION_STORAGE_KEY);
+  if (!sessionId) {
+    sessionId = newSessionId();
+    sessionStorage.setItem(SESSION_STORAGE_KEY, sessionId);
+  }
+  return sessionId;
+};
+
+const MessageRow = memo(({ message }) => (
+  <div className={`message ${message.type}`}>
+    <div className="message-header">
+      <span className="message-sender">
+        {message.type === 'user' ? 'You' : 'Assistant'}
+      </span>
+      <span className="message-time">
+        {message.timestamp.toLocaleTimeString()}
+      </span>
+      {message.type === 'assistant' && (
+        <span className={`message-status ${message.success ? 'success' : 'error'}`}>
+          {message.success ? '✓' : '✗'}
+        </span>
+      )}
+    </div>
+    <MarkdownBlock className="message-content" text={message.content} />
+    {message.error && (
+      <div className="message-error">
+        Error: {message.error}
+      </div>
+    )}
+  </div>
+));
+
+const renderMessage = (message) => <MessageRow message={message} />;
 
 const ChatInterface = () => {
-  const [messages, setMessages] = useState([]);
+  // Append-only message log: adding a message bumps the count instead of copying the array
+  const messagesRef = useRef([]);
+  const nextMessageIdRef = useRef(0);
+  const [messageCount, setMessageCount] = useState(0);
   const [inputMessage, setInputMessage] = useState('');
   const [isLoading, setIsLoading] = useState(false);
   const [websocket, setWebsocket] = useState(null);
   const [connectionStatus, setConnectionStatus] = useState('disconnected');
   const [intermediateMessage, setIntermediateMessage] = useState('');
-  const messagesEndRef = useRef(null);
+  const [streamingText, setStreamingText] = useState('');
+  const messagesContainerRef = useRef(null);
+  const atBottomRef = useRef(true);
   const clientId = useRef(Math.random().toString(36).substr(2, 9));
+  const sessionId = useRef(getSessionId());
+  // Streamed text is rebuilt client-side from sequence-numbered deltas
+  const streamPartsRef = useRef([]);
+  const lastSeqRef = useRef(0);
+  const isLoadingRef = useRef(false);
+  // Request id of the run this tab is waiting for
+  const currentRequestIdRef = useRef(null);
+  // Aborts the streaming REST request used when the WebSocket is down
+  const restAbortRef = useRef(null);
+
+  useEffect(() => {
+    isLoadingRef.current = isLoading;
+  }, [isLoading]);
+
+  const resetStream = () => {
+    streamPartsRef.current = [];
+    lastSeqRef.current = 0;
+    setStreamingText('');
+  };
+
+  const requestResync = (ws) => {
+    ws.send(JSON.stringify({ type: 'resync', session_id: sessionId.current }));
+  };
+
+  // Watch the session's runs; the server replays what this tab missed after lastSeq
+  const subscribe = (ws) => {
+    ws.send(JSON.stringify({
+      type: 'subscribe',
+      session_id: sessionId.current,
+      request_id: currentRequestIdRef.current,
+      since: lastSeqRef.current
+    }));
+  };
+
+  const appendMessage = (message) => {
+    messagesRef.current.push({ ...message, id: ++nextMessageIdRef.current });
+    setMessageCount(messagesRef.current.length);
+  };
+
+  const handleScroll = () => {
+    const container = messagesContainerRef.current;
+    atBottomRef.current = container.scrollHeight - container.scrollTop - container.clientHeight < STICK_TO_BOTTOM_PX;
+  };
 
-  const scrollToBottom = () => {
-    messagesEndRef.current?.scrollIntoView({ behavior: "smooth" });
+  // Follow new messages and streamed text unless the user has scrolled up
+  const stickToBottom = () => {
+    const container = messagesContainerRef.current;
+    if (container && atBottomRef.current) {
+      container.scrollTop = container.scrollHeight;
+    }
   };
 
   useEffect(() => {
-    scrollToBottom();
-  }, [messages]);
+    stickToBottom();
+  }, [messageCount, streamingText]);
+
+  const applyStreamEvents = (events, ws) => {
+    let textChanged = false;
+    let status = null;
+
+    for (const streamData of events) {
+      if (streamData.seq !== undefined) {
+        if (streamData.seq <= lastSeqRef.current) {
+          // Already covered by a resync snapshot
+          continue;
+        }
+        if (streamData.seq !== lastSeqRef.current + 1 && ws) {
+          // Missed deltas: ask the server for the full text so far
+          requestResync(ws);
+        }
+        lastSeqRef.current = streamData.seq;
+      }
+
+      if (streamData.type === 'text') {
+        streamPartsRef.current.push(streamData.content || '');
+        textChanged = true;
+        status = '';
+      } else if (streamData.type === 'tool_use') {
+        // Show tool usage information
+        status = `Using tool: ${streamData.tool_name}`;
+      }
+    }
+
+    // One state update per frame, however many events it carried
+    if (textChanged) {
+      setStreamingText(streamPartsRef.current.join(''));
+    }
+    if (status !== null) {
+      setIntermediateMessage(status);
+    }
+  };
 
   // WebSocket connection
   useEffect(() => {
     const connectWebSocket = () => {
       const ws = new WebSocket(`ws://localhost:8000/ws/${clientId.current}`);
+      // The backend sends binary frames by default (WS_FRAME_FORMAT)
+      ws.binaryType = 'arraybuffer';
       
       ws.onopen = () => {
         console.log('WebSocket connected');
         setConnectionStatus('connected');
         setWebsocket(ws);
+        // Catch up on a response that was still streaming when the connection dropped,
+        // and follow runs started from other tabs
+        subscribe(ws);
       };
 
       ws.onmessage = (event) => {
-        const data = JSON.parse(event.data);
+        const raw = typeof event.data === 'string' ? event.data : frameDecoder.decode(event.data);
+        const data = JSON.parse(raw);
+
+        if (data.type === 'run') {
+          // A run of this session started elsewhere (another tab): follow it while idle.
+          // Runs of any other session are never adopted, whatever the server sends
+          const ownSession = data.data.session_id === sessionId.current;
+          if (ownSession && !data.data.done && !isLoadingRef.current && data.request_id !== currentRequestIdRef.current) {
+            currentRequestIdRef.current = data.request_id;
+            isLoadingRef.current = true;
+            setIsLoading(true);
+            setIntermediateMessage('');
+            resetStream();
+            appendMessage({
+              type: 'user',
+              content: data.data.message,
+              timestamp: new Date()
+            });
+          }
+          return;
+        }
         
+        if (data.request_id && data.request_id !== currentRequestIdRef.current) {
+          // Frame of a run this tab is no longer waiting for
+          return;
+        }
+
         if (data.type === 'stream') {
           // Handle intermediate updates
-          const streamData = data.data;
-          
-          if (streamData.type === 'text') {
-            // Show intermediate text as status
-            setIntermediateMessage(`Processing: ${streamData.content?.substring(0, 100)}...`);
-          } else if (streamData.type === 'tool_use') {
-            // Show tool usage information
-            setIntermediateMessage(`Using tool: ${streamData.tool_name}`);
+          applyStreamEvents([data.data], ws);
+
+        } else if (data.type === 'stream_batch') {
+          // Several stream events coalesced into one frame by the server
+          applyStreamEvents(data.data, ws);
+
+        } else if (data.type === 'resync') {
+          const snapshot = data.data;
+          if (snapshot.content !== null && snapshot.seq >= lastSeqRef.current) {
+            streamPartsRef.current = [snapshot.content];
+            lastSeqRef.current = snapshot.seq;
+            setStreamingText(snapshot.content);
           }
-          
+
         } else if (data.type === 'response') {
           // Final response received
           const responseData = data.data;
           
-          setMessages(prev => [...prev, {
-            id: Date.now(),
+          appendMessage({
             type: 'assistant',
             content: responseData.response,
             timestamp: new Date(),
             success: responseData.success,
             error: responseData.error
-          }]);
+          });
           
           // Reset state
+          currentRequestIdRef.current = null;
           setIsLoading(false);
           setIntermediateMessage('');
+          resetStream();
+
+        } else if (data.type === 'queued') {
+          // Server is saturated: show our place in the queue until a slot frees up
+          setIntermediateMessage(`Waiting in queue (position ${data.data.position})`);
+
+        } else if (data.type === 'busy') {
+          appendMessage({
+            type: 'assistant',
+            content: 'The server is busy right now. Please try again in a moment.',
+            timestamp: new Date(),
+            success: false,
+            error: data.data.error
+          });
+
+          currentRequestIdRef.current = null;
+          setIsLoading(false);
+          setIntermediateMessage('');
+          resetStream();
+
+        } else if (data.type === 'error') {
+          // The run failed on the server before producing a response
+          appendMessage({
+            type: 'assistant',
+            content: streamPartsRef.current.join(''),
+            timestamp: new Date(),
+            success: false,
+            error: data.data.error
+          });
+
+          currentRequestIdRef.current = null;
+          setIsLoading(false);
+          setIntermediateMessage('');
+          resetStream();
+
+        } else if (data.type === 'cancelled') {
+          // Keep whatever was streamed before the run was stopped
+          appendMessage({
+            type: 'assistant',
+            content: streamPartsRef.current.join(''),
+            timestamp: new Date(),
+            success: false,
+            error: 'Cancelled'
+          });
+
+          currentRequestIdRef.current = null;
+          setIsLoading(false);
+          setIntermediateMessage('');
+          resetStream();
         }
       };
 
@@ -112,56 +317,120 @@ const ChatInterface = () => {
     if (!message.trim()) return;
 
     const userMessage = {
-      id: Date.now(),
       type: 'user',
       content: message,
       timestamp: new Date()
     };
 
-    setMessages(prev => [...prev, userMessage]);
+    appendMessage(userMessage);
     setInputMessage('');
     setIsLoading(true);
     
     // Reset intermediate message for new message
     setIntermediateMessage('');
+    resetStream();
 
     // Send via WebSocket if connected, otherwise use REST API
     if (websocket && websocket.readyState === WebSocket.OPEN) {
+      const requestId = Math.random().toString(36).substr(2, 9);
+      currentRequestIdRef.current = requestId;
       websocket.send(JSON.stringify({
+        type: 'message',
+        request_id: requestId,
         message: message,
-        session_id: 'default'
+        session_id: sessionId.current
       }));
     } else {
-      // Fallback to REST API
+      // Fallback to the streaming REST API (NDJSON: one event per line)
+      const addAssistantMessage = (content, success, error) => {
+        appendMessage({
+          type: 'assistant',
+          content,
+          timestamp: new Date(),
+          success,
+          error
+        });
+      };
+      const controller = new AbortController();
+      restAbortRef.current = controller;
+      currentRequestIdRef.current = Math.random().toString(36).substr(2, 9);
+
       try {
-        const response = await axios.post('/api/chat', {
-          message: message,
-          session_id: 'default'
+        const response = await fetch('/api/chat/stream?format=ndjson', {
+          method: 'POST',
+          headers: { 'Content-Type': 'application/json' },
+          body: JSON.stringify({ message: message, session_id: sessionId.current }),
+          signal: controller.signal
         });
+        if (!response.ok) {
+          throw new Error(`HTTP ${response.status}`);
+        }
 
-        setMessages(prev => [...prev, {
-          id: Date.now() + 1,
-          type: 'assistant',
-          content: response.data.response,
-          timestamp: new Date(),
-          success: response.data.success,
-          error: response.data.error
-        }]);
+        const reader = response.body.getReader();
+        const decoder = new TextDecoder();
+        let buffer = '';
+        let outcome = null;
+        while (outcome === null) {
+          const { done, value } = await reader.read();
+          if (done) break;
+          buffer += decoder.decode(value, { stream: true });
+          const lines = buffer.split('\n');
+          buffer = lines.pop();
+
+          const streamEvents = [];
+          for (const line of lines) {
+            if (!line.trim()) continue;  // keepalive
+            const streamData = JSON.parse(line);
+            if (streamData.type === 'text' || streamData.type === 'tool_use') {
+              streamEvents.push(streamData);
+            } else if (streamData.type === 'queued') {
+              setIntermediateMessage(`Waiting in queue (position ${streamData.position})`);
+            } else {
+              outcome = streamData;
+            }
+          }
+          applyStreamEvents(streamEvents, null);
+        }
+
+        if (outcome?.type === 'result') {
+          addAssistantMessage(outcome.response, outcome.success, outcome.error);
+        } else if (outcome?.type === 'busy') {
+          addAssistantMessage('The server is busy right now. Please try again in a moment.', false, outcome.error);
+        } else {
+          throw new Error(outcome?.error || 'Stream ended without a result');
+        }
       } catch (error) {
-        setMessages(prev => [...prev, {
-          id: Date.now() + 1,
-          type: 'assistant',
-          content: 'Error: Failed to send message. Please check the connection.',
-          timestamp: new Date(),
-          success: false,
-          error: error.message
-        }]);
+        if (error.name === 'AbortError') {
+          // Keep whatever was streamed before the run was stopped
+          addAssistantMessage(streamPartsRef.current.join(''), false, 'Cancelled');
+        } else {
+          addAssistantMessage('Error: Failed to send message. Please check the connection.', false, error.message);
+        }
       } finally {
+        restAbortRef.current = null;
+        currentRequestIdRef.current = null;
         setIsLoading(false);
+        setIntermediateMessage('');
+        resetStream();
       }
     }
   };
 
+  const cancelRequest = () => {
+    if (restAbortRef.current) {
+      // Closing the HTTP stream makes the server cancel the run
+      restAbortRef.current.abort();
+      return;
+    }
+    if (websocket && websocket.readyState === WebSocket.OPEN && currentRequestIdRef.current) {
+      websocket.send(JSON.stringify({
+        type: 'cancel',
+        request_id: currentRequestIdRef.current,
+        session_id: sessionId.current
+      }));
+    }
+  };
+
   const handleSubmit = (e) => {
     e.preventDefault();
     sendMessage(inputMessage);
@@ -181,37 +450,6 @@ const ChatInterface = () => {
     // Optionally show error to user
   };
 
-  const renderMessage = (message) => {
-    const htmlContent = marked(message.content);
-    
-    return (
-      <div key={message.id} className={`message ${message.type}`}>
-        <div className="message-header">
-          <span className="message-sender">
-            {message.type === 'user' ? 'You' : 'Assistant'}
-          </span>
-          <span className="message-time">
-            {message.timestamp.toLocaleTimeString()}
-          </span>
-          {message.type === 'assistant' && (
-            <span className={`message-status ${message.success ? 'success' : 'error'}`}>
-              {message.success ? '✓' : '✗'}
-            </span>
-          )}
-        </div>
-        <div 
-          className="message-content"
-          dangerouslySetInnerHTML={{ __html: htmlContent }}
-        />
-        {message.error && (
-          <div className="message-error">
-            Error: {message.error}
-          </div>
-        )}
-      </div>
-    );
-  };
-
   return (
     <div className="chat-interface">
       <div className="connection-status">
@@ -219,8 +457,8 @@ const ChatInterface = () => {
         Connection: {connectionStatus}
       </div>
       
-      <div className="messages-container">
-        {messages.length === 0 && (
+      <div className="messages-container" ref={messagesContainerRef} onScroll={handleScroll}>
+        {messageCount === 0 && (
           <div className="welcome-message">
             <h3>Welcome to LLM Assistant Bot!</h3>
             <p>Start a conversation by typing a message below.</p>
@@ -228,7 +466,12 @@ const ChatInterface = () => {
           </div>
         )}
         
-        {messages.map(renderMessage)}
+        <VirtualMessageList
+          items={messagesRef.current}
+          scrollRef={messagesContainerRef}
+          renderItem={renderMessage}
+          onLayout={stickToBottom}
+        />
         
         {isLoading && (
           <div className="message assistant loading">
@@ -237,11 +480,14 @@ const ChatInterface = () => {
               <span className="message-time">thinking...</span>
             </div>
             <div className="message-content">
+              {streamingText && (
+                <StreamingMarkdown text={streamingText} />
+              )}
               {intermediateMessage ? (
                 <div className="intermediate-message">
                   {intermediateMessage}
                 </div>
-              ) : (
+              ) : !streamingText && (
                 <div className="loading-indicator">
                   <span></span>
                   <span></span>
@@ -251,8 +497,6 @@ const ChatInterface = () => {
             </div>
           </div>
         )}
-        
-        <div ref={messagesEndRef} />
       </div>
 
       <form className="input-form" onSubmit={handleSubmit}>
@@ -271,13 +515,23 @@ const ChatInterface = () => {
             disabled={isLoading}
             className="message-input"
           />
-          <button 
-            type="submit" 
-            disabled={isLoading || !inputMessage.trim()}
-            className="send-button"
-          >
-            Send
-          </button>
+          {isLoading && currentRequestIdRef.current ? (
+            <button
+              type="button"
+              onClick={cancelRequest}
+              className="send-button stop-button"
+            >
+              Stop
+            </button>
+          ) : (
+            <button 
+              type="submit" 
+              disabled={isLoading || !inputMessage.trim()}
+              className="send-button"
+            >
+              Send
+            </button>
+          )}
         </div>
       </form>
     </div>
@@ -0,0 +1,99 @@
+import React, { memo, useEffect, useRef } from 'react';
+import { marked } from 'marked';
+import { highlightCodeBlocks } from './highlighter';
+
+// Rendered HTML by markdown source, so rows scrolled back into view are not parsed again
+const HTML_CACHE_SIZE = 500;
+const htmlCache = new Map();
+
+export const renderMarkdown = (text) => {
+  let html = htmlCache.get(text);
+  if (html === undefined) {
+    html = marked.parse(text);
+    if (htmlCache.size >= HTML_CACHE_SIZE) {
+      htmlCache.delete(htmlCache.keys().next().value);
+    }
+  } else {
+    htmlCache.delete(text);
+  }
+  htmlCache.set(text, html);
+  return html;
+};
+
+const FENCE = /^ {0,3}(`{3,}|~{3,})/;
+
+// Splits streamed markdown into finished blocks, which never change again, and the
+// tail still being written. Only complete lines are scanned, once each; a blank line
+// outside a code fence ends a block.
+export class MarkdownStream {
+  constructor() {
+    this.reset();
+  }
+
+  reset() {
+    this.blocks = [];
+    this.blockStart = 0;
+    this.scanned = 0;
+    this.fence = null;
+  }
+
+  update(text) {
+    if (text.length < this.scanned) {
+      // A new response, or a resync that replaced the text
+      this.reset();
+    }
+    let pos = this.scanned;
+    let newline = text.indexOf('\n', pos);
+    while (newline !== -1) {
+      const line = text.slice(pos, newline);
+      const fence = FENCE.exec(line);
+      if (fence) {
+        if (this.fence === null) {
+          this.fence = fence[1];
+        } else if (fence[1][0] === this.fence[0] && fence[1].length >= this.fence.length && !line.trim().slice(fence[1].length)) {
+          this.fence = null;
+        }
+      } else if (this.fence === null && !line.trim()) {
+        const block = text.slice(this.blockStart, newline + 1);
+        if (block.trim()) {
+          this.blocks.push(block);
+        }
+        this.blockStart = newline + 1;
+      }
+      pos = newline + 1;
+      newline = text.indexOf('\n', pos);
+    }
+    this.scanned = pos;
+    return { blocks: this.blocks, tail: text.slice(this.blockStart) };
+  }
+}
+
+// Markdown rendered once per source text, with code blocks highlighted off the main thread
+export const MarkdownBlock = memo(({ text, className }) => {
+  const ref = useRef(null);
+  const html = renderMarkdown(text);
+
+  useEffect(() => {
+    highlightCodeBlocks(ref.current);
+  }, [html]);
+
+  return <div ref={ref} className={className} dangerouslySetInnerHTML={{ __html: html }} />;
+});
+
+// Streaming text: finished blocks are memoized, only the tail is parsed again on each delta
+export const StreamingMarkdown = ({ text }) => {
+  const streamRef = useRef(null);
+  if (streamRef.current === null) {
+    streamRef.current = new MarkdownStream();
+  }
+  const { blocks, tail } = streamRef.current.update(text);
+
+  return (
+    <>
+      {blocks.map((block, index) => (
+        <MarkdownBlock key={index} text={block} />
+      ))}
+      {tail && <div dangerouslySetInnerHTML={{ __html: marked.parse(tail) }} />}
+    </>
+  );
+};
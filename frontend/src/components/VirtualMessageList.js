@@ -0,0 +1,122 @@
+import React, { useEffect, useLayoutEffect, useRef, useState } from 'react';
+
+// Keeps a row's measured height up to date while it is mounted
+const VirtualRow = ({ id, observer, children }) => {
+  const ref = useRef(null);
+
+  useLayoutEffect(() => {
+    const node = ref.current;
+    if (!observer || !node) {
+      return undefined;
+    }
+    observer.observe(node);
+    return () => observer.unobserve(node);
+  }, [observer]);
+
+  return (
+    <div ref={ref} className="virtual-row" data-row-id={id}>
+      {children}
+    </div>
+  );
+};
+
+// Renders only the rows near the viewport of scrollRef; the rest are replaced by padding.
+// Rows are measured once rendered, unmeasured ones count as estimatedHeight.
+const VirtualMessageList = ({ items, scrollRef, renderItem, onLayout, estimatedHeight = 120, overscan = 800 }) => {
+  const listRef = useRef(null);
+  const heightsRef = useRef(new Map());
+  const [viewport, setViewport] = useState({ top: 0, height: 0 });
+  const [observer, setObserver] = useState(null);
+  const [, setLayoutVersion] = useState(0);
+
+  useEffect(() => {
+    if (typeof ResizeObserver === 'undefined') {
+      return undefined;
+    }
+    const rowObserver = new ResizeObserver((entries) => {
+      let changed = false;
+      for (const entry of entries) {
+        const id = entry.target.dataset.rowId;
+        const height = entry.target.offsetHeight;
+        if (height && heightsRef.current.get(id) !== height) {
+          heightsRef.current.set(id, height);
+          changed = true;
+        }
+      }
+      if (changed) {
+        setLayoutVersion((version) => version + 1);
+      }
+    });
+    setObserver(rowObserver);
+    return () => rowObserver.disconnect();
+  }, []);
+
+  useEffect(() => {
+    const container = scrollRef.current;
+    if (!container) {
+      return undefined;
+    }
+    let frame = null;
+    const update = () => {
+      frame = null;
+      const offset = listRef.current ? listRef.current.offsetTop : 0;
+      setViewport({ top: container.scrollTop - offset, height: container.clientHeight });
+    };
+    // At most one layout per animation frame, however fast the scroll events come
+    const schedule = () => {
+      if (frame === null) {
+        frame = requestAnimationFrame(update);
+      }
+    };
+    update();
+    container.addEventListener('scroll', schedule, { passive: true });
+    const containerObserver = typeof ResizeObserver !== 'undefined' ? new ResizeObserver(schedule) : null;
+    containerObserver?.observe(container);
+    return () => {
+      container.removeEventListener('scroll', schedule);
+      containerObserver?.disconnect();
+      if (frame !== null) {
+        cancelAnimationFrame(frame);
+      }
+    };
+  }, [scrollRef]);
+
+  useLayoutEffect(() => {
+    if (onLayout) {
+      onLayout();
+    }
+  });
+
+  const heightOf = (item) => heightsRef.current.get(String(item.id)) ?? estimatedHeight;
+  const windowTop = viewport.top - overscan;
+  const windowBottom = viewport.top + viewport.height + overscan;
+
+  let start = 0;
+  let before = 0;
+  while (start < items.length && before + heightOf(items[start]) < windowTop) {
+    before += heightOf(items[start]);
+    start += 1;
+  }
+  let end = start;
+  let bottom = before;
+  while (end < items.length && bottom < windowBottom) {
+    bottom += heightOf(items[end]);
+    end += 1;
+  }
+  let after = 0;
+  for (let i = end; i < items.length; i += 1) {
+    after += heightOf(items[i]);
+  }
+
+  return (
+    <div ref={listRef} className="virtual-message-list" style={{ paddingTop: before, paddingBottom: after }}>
+      {items.slice(start, end).map((item) => (
+        <VirtualRow key={item.id} id={item.id} observer={observer}>
+          {renderItem(item)}
+        </VirtualRow>
+      ))}
+    </div>
+  );
+};
+
+export default VirtualMessageList;
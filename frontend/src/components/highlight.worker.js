@@ -0,0 +1,20 @@
+/* eslint-disable no-restricted-globals */
+import hljs from 'highlight.js';
+
+// Auto-detection tries every language, so very large unlabeled blocks are left plain
+const MAX_AUTO_DETECT_CHARS = 20000;
+
+self.onmessage = ({ data }) => {
+  const { id, code, language } = data;
+  let html = null;
+  try {
+    if (language && hljs.getLanguage(language)) {
+      html = hljs.highlight(code, { language }).value;
+    } else if (code.length <= MAX_AUTO_DETECT_CHARS) {
+      html = hljs.highlightAuto(code).value;
+    }
+  } catch (err) {
+    html = null;
+  }
+  self.postMessage({ id, html });
+};
@@ -0,0 +1,92 @@
+// Syntax highlighting runs in a Web Worker, so big or auto-detected code blocks never block the UI
+
+const CACHE_SIZE = 300;
+const cache = new Map();
+const inFlight = new Map();
+const pending = new Map();
+let worker = null;
+let nextId = 0;
+
+const remember = (key, html) => {
+  if (cache.size >= CACHE_SIZE) {
+    cache.delete(cache.keys().next().value);
+  }
+  cache.set(key, html);
+};
+
+const getWorker = () => {
+  if (worker === null) {
+    try {
+      worker = new Worker(new URL('./highlight.worker.js', import.meta.url));
+      worker.onmessage = ({ data }) => {
+        const request = pending.get(data.id);
+        pending.delete(data.id);
+        if (request) {
+          remember(request.key, data.html);
+          inFlight.delete(request.key);
+          request.resolve(data.html);
+        }
+      };
+      worker.onerror = (error) => {
+        console.error('Highlight worker error:', error);
+      };
+    } catch (err) {
+      // No worker support: code blocks stay plain
+      worker = false;
+    }
+  }
+  return worker || null;
+};
+
+export const highlightCode = (code, language) => {
+  const key = `${language}\u0000${code}`;
+  if (cache.has(key)) {
+    return Promise.resolve(cache.get(key));
+  }
+  if (inFlight.has(key)) {
+    return inFlight.get(key);
+  }
+  const highlighter = getWorker();
+  if (!highlighter) {
+    return Promise.resolve(null);
+  }
+  const promise = new Promise((resolve) => {
+    const id = ++nextId;
+    pending.set(id, { key, resolve });
+    highlighter.postMessage({ id, code, language });
+  });
+  inFlight.set(key, promise);
+  return promise;
+};
+
+const applyHighlight = (block, html) => {
+  if (html !== null && html !== undefined) {
+    block.innerHTML = html;
+    block.classList.add('hljs');
+  }
+};
+
+// Highlight every code block under root; cached results are applied right away
+export const highlightCodeBlocks = (root) => {
+  if (!root) {
+    return;
+  }
+  root.querySelectorAll('pre code').forEach((block) => {
+    if (block.dataset.highlighted) {
+      return;
+    }
+    block.dataset.highlighted = 'true';
+    const language = (/language-(\S+)/.exec(block.className) || [])[1] || '';
+    const code = block.textContent;
+    const key = `${language}\u0000${code}`;
+    if (cache.has(key)) {
+      applyHighlight(block, cache.get(key));
+      return;
+    }
+    highlightCode(code, language).then((html) => {
+      if (block.isConnected && block.textContent === code) {
+        applyHighlight(block, html);
+      }
+    });
+  });
+};
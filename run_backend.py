@@ -22,8 +22,11 @@ if __name__ == "__main__":
     host = os.getenv("HOST", "0.0.0.0")
     port = int(os.getenv("PORT", 8000))
     debug = os.getenv("DEBUG", "true").lower() == "true"
+    # router: proxy sessions to the backend nodes listed in ROUTER_NODES
+    mode = os.getenv("APP_MODE", "backend")
+    app = "router:app" if mode == "router" else "main:app"
 
-    print(f"Starting LLM Assistant Bot backend on {host}:{port}")
+    print(f"Starting LLM Assistant Bot {mode} on {host}:{port}")
     print(f"Debug mode: {debug}")
 
-    uvicorn.run("main:app", host=host, port=port, reload=debug, log_level="info")
+    uvicorn.run(app, host=host, port=port, reload=debug, log_level="info")
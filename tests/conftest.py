@@ -0,0 +1,7 @@
+import pytest
+
+
+@pytest.fixture
+def anyio_backend():
+    # The backend is built on asyncio (tasks, futures, subprocesses)
+    return "asyncio"
@@ -0,0 +1,121 @@
+import asyncio
+import os
+import sys
+
+try:
+    import resource
+except ImportError:  # Not available on Windows
+    resource = None
+
+import pytest
+from process_utils import CgroupController, RunLimits, RunSandbox, iter_lines
+
+pytestmark = pytest.mark.anyio
+
+
+def reader(data: bytes, limit: int = 16) -> asyncio.StreamReader:
+    stream = asyncio.StreamReader(limit=limit)
+    stream.feed_data(data)
+    stream.feed_eof()
+    return stream
+
+
+async def collect(stream, max_bytes=None):
+    return [line async for line in iter_lines(stream, max_bytes=max_bytes)]
+
+
+def alive(pid: int) -> bool:
+    """True while the process exists and is not a zombie"""
+    try:
+        with open(f"/proc/{pid}/stat", "r") as f:
+            return f.read().rsplit(")", 1)[1].split()[0] != "Z"
+    except OSError:
+        return False
+
+
+async def test_iter_lines_splits_on_newlines():
+    lines = await collect(reader(b'{"a": 1}\n{"b": 2}\r\n'))
+
+    assert lines == [b'{"a": 1}', b'{"b": 2}']
+
+
+async def test_iter_lines_joins_lines_longer_than_the_buffer():
+    long_line = b"x" * 100
+
+    lines = await collect(reader(long_line + b"\nshort\n", limit=16))
+
+    assert lines == [long_line, b"short"]
+
+
+async def test_iter_lines_returns_an_unterminated_last_line():
+    lines = await collect(reader(b"first\nlast"))
+
+    assert lines == [b"first", b"last"]
+
+
+async def test_iter_lines_skips_lines_over_max_bytes():
+    lines = await collect(reader(b"ok\n" + b"y" * 200 + b"\nafter\n", limit=16), max_bytes=50)
+
+    assert lines == [b"ok", b"after"]
+
+
+async def test_iter_lines_yields_a_line_before_the_stream_ends():
+    stream = asyncio.StreamReader(limit=16)
+    lines = iter_lines(stream)
+    stream.feed_data(b"early\n")
+
+    assert await asyncio.wait_for(lines.__anext__(), 1) == b"early"
+    stream.feed_eof()
+    assert [line async for line in lines] == []
+
+
+@pytest.mark.skipif(not os.path.isdir("/proc"), reason="needs /proc")
+async def test_sandbox_kills_the_whole_process_tree():
+    sandbox = RunSandbox(RunLimits(), CgroupController(root=""))
+    process = await asyncio.create_subprocess_exec("sh", "-c", "sleep 30 & sleep 30 & wait", **sandbox.spawn_kwargs())
+    sandbox.attach(process, sample=False)
+    for _ in range(100):
+        members = sandbox.monitor._members()
+        if len(members) >= 3:
+            break
+        await asyncio.sleep(0.02)
+    assert len(members) == 3
+
+    sandbox.kill()
+    await process.wait()
+    for _ in range(100):
+        if not any(alive(pid) for pid in members):
+            break
+        await asyncio.sleep(0.02)
+
+    assert not any(alive(pid) for pid in members)
+    await sandbox.close()
+
+
+@pytest.mark.skipif(not os.path.isdir("/proc"), reason="needs /proc")
+async def test_sandbox_reports_usage_of_the_tree():
+    sandbox = RunSandbox(RunLimits(), CgroupController(root=""))
+    # Burn some CPU in a child of the CLI so the tree, not just the leader, is measured
+    script = "import subprocess, sys; subprocess.run([sys.executable, '-c', 'sum(range(3 * 10**7))'])"
+    process = await asyncio.create_subprocess_exec(sys.executable, "-c", script, **sandbox.spawn_kwargs())
+    sandbox.attach(process, sample=False)
+    sandbox.monitor.interval = 0.02
+    sandbox.monitor.start()
+    await process.wait()
+    usage = await sandbox.close()
+
+    assert usage["peak_processes"] >= 2
+    assert usage["peak_rss_bytes"] > 0
+    assert usage["cpu_seconds"] > 0
+
+
+@pytest.mark.skipif(not hasattr(resource, "prlimit"), reason="needs resource.prlimit")
+async def test_sandbox_applies_rlimits_to_the_spawned_process():
+    sandbox = RunSandbox(RunLimits(open_files=64), CgroupController(root=""))
+    process = await asyncio.create_subprocess_exec("sleep", "30", **sandbox.spawn_kwargs())
+    sandbox.attach(process, sample=False)
+
+    assert resource.prlimit(process.pid, resource.RLIMIT_NOFILE) == (64, 64)
+    sandbox.kill()
+    await process.wait()
+    await sandbox.close()
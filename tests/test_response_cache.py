@@ -0,0 +1,94 @@
+import pytest
+from response_cache import ResponseCache
+
+pytestmark = pytest.mark.anyio
+
+EVENTS = [{"type": "text", "content": "answer", "seq": 1}]
+RESULT = {"response": "answer", "success": True}
+
+
+def make_cache(tmp_path, **kwargs):
+    options = {"enabled": True, "ttl": 60, "memory_entries": 8, "disk_max_mb": 1, "cache_dir": str(tmp_path / "cache")}
+    options.update(kwargs)
+    return ResponseCache(**options)
+
+
+async def test_keys_ignore_whitespace_and_are_shared_by_sessions(tmp_path):
+    cache = make_cache(tmp_path)
+
+    assert cache.key("What is  MCP?") == cache.key(" What is MCP? ")
+    assert cache.key("What is MCP?", "claude -p") != cache.key("What is MCP?", "claude -p --model other")
+
+
+async def test_key_changes_with_the_mcp_config(tmp_path):
+    config = tmp_path / ".mcp.json"
+    config.write_text('{"mcpServers": {}}')
+    cache = make_cache(tmp_path, mcp_config_path=str(config))
+    before = cache.key("prompt")
+
+    config.write_text('{"mcpServers": {"arxiv": {}}}')
+    # Both writes may fall within one mtime tick; forget the memoized hash
+    cache._mcp_hash = (None, "")
+
+    assert cache.key("prompt") != before
+
+
+async def test_hit_from_memory_then_from_disk(tmp_path):
+    cache = make_cache(tmp_path)
+    key = cache.key("prompt")
+    assert await cache.get(key) is None
+
+    await cache.put(key, EVENTS, RESULT, "s1")
+    entry = await cache.get(key)
+    assert entry["events"] == EVENTS and entry["result"] == RESULT
+    assert "cli_session_id" not in entry
+
+    # Another backend process sharing the state directory
+    other = make_cache(tmp_path)
+    assert (await other.get(key))["result"] == RESULT
+    assert (cache.memory_hits, cache.misses, other.disk_hits) == (1, 1, 1)
+
+
+async def test_expired_entries_are_not_served(tmp_path):
+    cache = make_cache(tmp_path, ttl=-1)
+    key = cache.key("prompt")
+    await cache.put(key, EVENTS, RESULT, "s1")
+
+    assert await cache.get(key) is None
+    assert await make_cache(tmp_path, ttl=-1).get(key) is None
+
+
+async def test_memory_tier_evicts_least_recently_used(tmp_path):
+    cache = make_cache(tmp_path, memory_entries=2, disk_max_mb=0)
+    keys = [cache.key(f"prompt {i}") for i in range(3)]
+    for key in keys:
+        await cache.put(key, EVENTS, RESULT, "s1")
+
+    assert await cache.get(keys[0]) is None
+    assert await cache.get(keys[2]) is not None
+    assert cache.evictions == 1
+
+
+async def test_purge_session_drops_its_entries_only(tmp_path):
+    cache = make_cache(tmp_path)
+    deleted = cache.key("deleted session's prompt")
+    kept = cache.key("other session's prompt")
+    await cache.put(deleted, EVENTS, RESULT, "deleted")
+    await cache.put(kept, EVENTS, RESULT, "kept")
+
+    await cache.purge_session("deleted")
+
+    assert await cache.get(deleted) is None
+    assert await cache.get(kept) is not None
+    assert await make_cache(tmp_path).get(deleted) is None
+    assert cache.purged == 1
+
+
+async def test_purge_session_drops_entries_stored_by_another_process(tmp_path):
+    writer = make_cache(tmp_path)
+    key = writer.key("prompt")
+    await writer.put(key, EVENTS, RESULT, "s1")
+
+    await make_cache(tmp_path).purge_session("s1")
+
+    assert await make_cache(tmp_path).get(key) is None
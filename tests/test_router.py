@@ -0,0 +1,127 @@
+import httpx
+import pytest
+from router import HashRing, SessionRouter
+
+pytestmark = pytest.mark.anyio
+
+NODES = ["http://node-a", "http://node-b", "http://node-c"]
+SESSIONS = [f"session-{i}" for i in range(2000)]
+
+
+def owners(ring):
+    return {session_id: ring.owner(session_id) for session_id in SESSIONS}
+
+
+def test_owner_is_stable_and_spread_over_the_nodes():
+    ring = HashRing(NODES, vnodes=128)
+
+    assert owners(ring) == owners(HashRing(reversed(NODES), vnodes=128))
+    counts = {node: 0 for node in NODES}
+    for owner in owners(ring).values():
+        counts[owner] += 1
+    # Each node holds roughly a third of the sessions
+    assert all(len(SESSIONS) * 0.2 < count < len(SESSIONS) * 0.47 for count in counts.values())
+
+
+def test_removing_a_node_moves_only_its_sessions():
+    ring = HashRing(NODES, vnodes=128)
+    before = owners(ring)
+
+    ring.remove("http://node-b")
+    after = owners(ring)
+
+    moved = [s for s in SESSIONS if before[s] != after[s]]
+    assert moved and all(before[s] == "http://node-b" for s in moved)
+    # They move to the next node of their preference list
+    assert all(after[s] == HashRing(NODES, vnodes=128).preference_list(s)[1] for s in moved)
+
+
+def test_adding_a_node_takes_sessions_only_for_itself():
+    ring = HashRing(NODES[:2], vnodes=128)
+    before = owners(ring)
+
+    ring.add("http://node-c")
+    after = owners(ring)
+
+    moved = [s for s in SESSIONS if before[s] != after[s]]
+    assert moved and all(after[s] == "http://node-c" for s in moved)
+    assert len(moved) < len(SESSIONS) * 0.47
+
+
+def test_preference_list_names_every_node_once():
+    ring = HashRing(NODES, vnodes=8)
+
+    for session_id in SESSIONS[:50]:
+        nodes = ring.preference_list(session_id)
+        assert sorted(nodes) == sorted(NODES)
+        assert nodes[0] == ring.owner(session_id)
+    assert HashRing().owner("s") is None
+
+
+def make_router(ready):
+    """A router whose nodes answer /ready with 200 while ``ready[url]`` is true"""
+
+    def handler(request):
+        url = f"{request.url.scheme}://{request.url.host}"
+        return httpx.Response(200 if ready[url] else 503)
+
+    router = SessionRouter(nodes=NODES, vnodes=64, health_interval=60, failure_threshold=2, connect_timeout=1)
+    router.client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    return router
+
+
+async def test_nodes_join_rotation_after_a_passing_check():
+    ready = {url: True for url in NODES}
+    router = make_router(ready)
+    assert router.candidates("s") == []
+
+    await router.check_all()
+
+    assert [node.url for node in router.candidates("s")] == router.ring.preference_list("s")
+    await router.client.aclose()
+
+
+async def test_node_leaves_rotation_after_consecutive_failures_and_returns():
+    ready = {url: True for url in NODES}
+    router = make_router(ready)
+    await router.check_all()
+    session_id = next(s for s in SESSIONS if router.ring.owner(s) == "http://node-a")
+    other = next(s for s in SESSIONS if router.ring.owner(s) == "http://node-b")
+
+    ready["http://node-a"] = False
+    await router.check_all()
+    # One failure is below the threshold
+    assert router.candidates(session_id)[0].url == "http://node-a"
+
+    await router.check_all()
+    assert router.candidates(session_id)[0].url == router.ring.preference_list(session_id)[1]
+    assert router.candidates(other)[0].url == "http://node-b"
+    assert router.nodes["http://node-a"].last_error == "HTTP 503"
+
+    ready["http://node-a"] = True
+    await router.check_all()
+    assert router.candidates(session_id)[0].url == "http://node-a"
+    await router.client.aclose()
+
+
+async def test_refused_connection_fails_over_at_once():
+    ready = {url: True for url in NODES}
+    router = make_router(ready)
+    await router.check_all()
+    owner = router.candidates("s")[0]
+
+    router.mark_failed(owner, httpx.ConnectError("refused"))
+
+    assert owner not in router.candidates("s")
+    assert router.failovers == 1
+    await router.client.aclose()
+
+
+def test_nodes_can_be_added_and_removed():
+    router = SessionRouter(nodes=NODES[:1], vnodes=16, health_interval=60, failure_threshold=2, connect_timeout=1)
+
+    router.add_node("http://node-b/")
+    assert set(router.nodes) == {"http://node-a", "http://node-b"}
+    assert router.remove_node("http://node-a")
+    assert not router.remove_node("http://node-a")
+    assert router.ring.nodes == ["http://node-b"]
@@ -0,0 +1,154 @@
+import asyncio
+
+import pytest
+from scheduler import ExecutionScheduler, SchedulerBusyError
+
+pytestmark = pytest.mark.anyio
+
+
+async def settle():
+    """Let queued tasks run until they block"""
+    for _ in range(5):
+        await asyncio.sleep(0)
+
+
+async def queue_runs(scheduler, requests, order):
+    """Start one waiting acquire per (label, session_id, kwargs) and record the grant order"""
+
+    async def run(label, session_id, kwargs):
+        ticket = await scheduler.acquire(session_id, **kwargs)
+        order.append((label, ticket))
+
+    tasks = [asyncio.create_task(run(label, session_id, kwargs)) for label, session_id, kwargs in requests]
+    await settle()
+    return tasks
+
+
+async def drain(scheduler, order, count):
+    """Release granted tickets one by one until ``count`` runs have been served"""
+    released = 0
+    while released < count:
+        await settle()
+        scheduler.release(order[released][1])
+        released += 1
+
+
+async def test_grants_immediately_while_slots_are_free():
+    scheduler = ExecutionScheduler(max_concurrent=2, max_per_client=2, max_queue=4)
+
+    first = await scheduler.acquire("a")
+    second = await scheduler.acquire("b")
+
+    assert scheduler.active == 2
+    assert scheduler.queued == 0
+    scheduler.release(first)
+    scheduler.release(second)
+    assert scheduler.active == 0
+
+
+async def test_round_robin_across_sessions():
+    scheduler = ExecutionScheduler(max_concurrent=1, max_per_client=4, max_queue=8)
+    holder = await scheduler.acquire("busy")
+    order = []
+    tasks = await queue_runs(scheduler, [("a1", "a", {}), ("a2", "a", {}), ("a3", "a", {}), ("b1", "b", {})], order)
+    assert scheduler.queued == 4
+
+    scheduler.release(holder)
+    await drain(scheduler, order, 4)
+    await asyncio.gather(*tasks)
+
+    # Session b is not stuck behind the three requests session a queued first
+    assert [label for label, _ in order] == ["a1", "b1", "a2", "a3"]
+
+
+async def test_rejects_when_the_queue_is_full():
+    scheduler = ExecutionScheduler(max_concurrent=1, max_per_client=1, max_queue=1)
+    holder = await scheduler.acquire("a")
+    waiting = asyncio.create_task(scheduler.acquire("b"))
+    await settle()
+
+    with pytest.raises(SchedulerBusyError):
+        await scheduler.acquire("c")
+
+    assert scheduler.rejected == 1
+    scheduler.release(holder)
+    scheduler.release(await waiting)
+
+
+async def test_cancel_while_queued_frees_the_place():
+    scheduler = ExecutionScheduler(max_concurrent=1, max_per_client=4, max_queue=4)
+    holder = await scheduler.acquire("a")
+    cancelled = asyncio.create_task(scheduler.acquire("b"))
+    later = asyncio.create_task(scheduler.acquire("c"))
+    await settle()
+    assert scheduler.queued == 2
+
+    cancelled.cancel()
+    await settle()
+    assert scheduler.queued == 1
+
+    scheduler.release(holder)
+    ticket = await later
+    assert ticket.session_id == "c"
+    assert scheduler.active == 1
+    scheduler.release(ticket)
+    assert scheduler.active == 0
+
+
+async def test_per_client_limit():
+    scheduler = ExecutionScheduler(max_concurrent=4, max_per_client=1, max_queue=4)
+    first = await scheduler.acquire("a", client_id="tab")
+    second = asyncio.create_task(scheduler.acquire("b", client_id="tab"))
+    other = await scheduler.acquire("c", client_id="other-tab")
+    await settle()
+
+    assert not second.done()
+    scheduler.release(first)
+    scheduler.release(await second)
+    scheduler.release(other)
+
+
+async def test_client_priority_is_ignored_by_default():
+    scheduler = ExecutionScheduler(max_concurrent=1, max_per_client=4, max_queue=4)
+    holder = await scheduler.acquire("busy")
+    order = []
+    tasks = await queue_runs(scheduler, [("normal", "a", {}), ("greedy", "b", {"priority": 10**6})], order)
+
+    scheduler.release(holder)
+    await drain(scheduler, order, 2)
+    await asyncio.gather(*tasks)
+
+    assert [label for label, _ in order] == ["normal", "greedy"]
+    assert order[1][1].priority == 0
+
+
+async def test_client_priority_is_clamped():
+    scheduler = ExecutionScheduler(max_concurrent=1, max_per_client=4, max_queue=4, max_priority=2)
+    holder = await scheduler.acquire("busy")
+    order = []
+    requests = [("normal", "a", {}), ("low", "b", {"priority": -50}), ("high", "c", {"priority": 50})]
+    tasks = await queue_runs(scheduler, requests, order)
+
+    scheduler.release(holder)
+    await drain(scheduler, order, 3)
+    await asyncio.gather(*tasks)
+
+    assert [label for label, _ in order] == ["high", "normal", "low"]
+    assert [ticket.priority for _, ticket in order] == [2, 0, -2]
+
+
+async def test_reports_queue_positions():
+    scheduler = ExecutionScheduler(max_concurrent=1, max_per_client=4, max_queue=4)
+    holder = await scheduler.acquire("busy")
+    positions = {"a": [], "b": []}
+    first = asyncio.create_task(scheduler.acquire("a", on_position=positions["a"].append))
+    await settle()
+    second = asyncio.create_task(scheduler.acquire("b", on_position=positions["b"].append))
+    await settle()
+
+    scheduler.release(holder)
+    scheduler.release(await first)
+    scheduler.release(await second)
+
+    assert positions["a"] == [1]
+    assert positions["b"] == [2, 1]
@@ -0,0 +1,148 @@
+import asyncio
+
+import pytest
+from session_bus import SessionBus
+
+pytestmark = pytest.mark.anyio
+
+
+class Client:
+    """A subscriber that records every frame it is sent"""
+
+    def __init__(self):
+        self.frames = []
+
+    def enqueue(self, message):
+        self.frames.append(message)
+        return True
+
+    def types(self):
+        return [frame["type"] for frame in self.frames]
+
+
+def stream(bus, session_id, request_id, *seqs):
+    for seq in seqs:
+        bus.publish(session_id, {"type": "stream", "request_id": request_id, "data": {"type": "text", "seq": seq}})
+
+
+def final(request_id):
+    return {"type": "response", "request_id": request_id, "data": {"response": "done", "success": True}}
+
+
+async def test_frames_fan_out_to_the_session_subscribers_only():
+    bus = SessionBus(replay_events=16, linger=60, orphan_grace=60)
+    tabs = [Client(), Client()]
+    other = Client()
+    for tab in tabs:
+        bus.subscribe("s", tab)
+    bus.subscribe("other", other)
+
+    bus.begin("s", "r1", "hello")
+    stream(bus, "s", "r1", 1)
+    bus.finish("s", "r1", final("r1"))
+
+    for tab in tabs:
+        assert tab.types() == ["run", "stream", "response"]
+    assert tab.frames[0]["data"] == {"session_id": "s", "message": "hello", "done": False}
+    assert other.frames == []
+
+
+async def test_late_subscriber_gets_the_events_after_since():
+    bus = SessionBus(replay_events=16, linger=60, orphan_grace=60)
+    bus.subscribe("s", Client())
+    bus.begin("s", "r1", "hello")
+    stream(bus, "s", "r1", 1, 2, 3)
+
+    late = Client()
+    bus.subscribe("s", late, request_id="r1", since=1)
+    stream(bus, "s", "r1", 4)
+
+    assert late.types() == ["run", "stream_batch", "stream"]
+    assert [event["seq"] for event in late.frames[1]["data"]] == [2, 3]
+    assert late.frames[1]["replay"] is True
+    assert bus.replayed_events == 2
+
+
+async def test_finished_run_is_replayed_with_its_final_frame():
+    bus = SessionBus(replay_events=16, linger=60, orphan_grace=60)
+    bus.begin("s", "r1", "hello")
+    stream(bus, "s", "r1", 1, 2)
+    bus.finish("s", "r1", final("r1"))
+
+    reconnected = Client()
+    bus.subscribe("s", reconnected, request_id="r1", since=2)
+
+    assert reconnected.types() == ["run", "response"]
+    assert reconnected.frames[0]["data"]["done"] is True
+
+
+async def test_resync_snapshot_when_the_ring_no_longer_reaches_back():
+    snapshot = {"session_id": "s", "seq": 6, "content": "text so far"}
+    bus = SessionBus(replay_events=2, linger=60, orphan_grace=60, snapshot=lambda session_id: snapshot)
+    bus.begin("s", "r1", "hello")
+    stream(bus, "s", "r1", 1, 2, 3, 4, 5, 6)
+
+    late = Client()
+    bus.subscribe("s", late, request_id="r1", since=1)
+
+    assert late.types() == ["run", "resync", "stream_batch"]
+    assert late.frames[1]["data"] == snapshot
+    assert [event["seq"] for event in late.frames[2]["data"]] == [5, 6]
+    assert bus.snapshot_resyncs == 1
+
+
+async def test_finished_run_past_the_ring_sends_only_the_final_frame():
+    bus = SessionBus(replay_events=2, linger=60, orphan_grace=60, snapshot=lambda session_id: None)
+    bus.begin("s", "r1", "hello")
+    stream(bus, "s", "r1", 1, 2, 3, 4)
+    bus.finish("s", "r1", final("r1"))
+
+    late = Client()
+    bus.subscribe("s", late)
+
+    # The final response carries the whole text; partial deltas would be a gap
+    assert late.types() == ["run", "response"]
+
+
+async def test_run_without_subscribers_is_cancelled_after_the_grace_period():
+    bus = SessionBus(replay_events=16, linger=60, orphan_grace=0.05)
+    task = asyncio.create_task(asyncio.sleep(60))
+    tab = Client()
+    bus.subscribe("s", tab)
+    bus.begin("s", "r1", "hello", task=task)
+
+    bus.unsubscribe_all(tab)
+    await asyncio.sleep(0.1)
+
+    assert task.cancelled()
+    assert bus.orphans_cancelled == 1
+
+
+async def test_resubscribing_within_the_grace_period_keeps_the_run():
+    bus = SessionBus(replay_events=16, linger=60, orphan_grace=0.05)
+    task = asyncio.create_task(asyncio.sleep(60))
+    tab = Client()
+    bus.subscribe("s", tab)
+    bus.begin("s", "r1", "hello", task=task)
+
+    bus.unsubscribe("s", tab)
+    reconnected = Client()
+    bus.subscribe("s", reconnected)
+    await asyncio.sleep(0.1)
+
+    assert not task.done()
+    assert bus.orphans_cancelled == 0
+    task.cancel()
+
+
+async def test_finished_runs_and_idle_channels_are_pruned_after_linger():
+    bus = SessionBus(replay_events=16, linger=0.01, orphan_grace=60)
+    tab = Client()
+    bus.subscribe("s", tab)
+    bus.begin("s", "r1", "hello")
+    bus.finish("s", "r1", final("r1"))
+    await asyncio.sleep(0.05)
+
+    assert bus.get_run("s", "r1") is None
+    bus.unsubscribe("s", tab)
+    assert bus.stats()["sessions"] == 0
@@ -0,0 +1,154 @@
+import asyncio
+
+import pytest
+from session_lanes import SessionLanes
+
+pytestmark = pytest.mark.anyio
+
+
+class Runner:
+    """A runner that streams the given events, then waits for ``finish`` before returning"""
+
+    def __init__(self, events=()):
+        self.events = list(events)
+        self.calls = 0
+        self.running = 0
+        self.max_running = 0
+        self.started = asyncio.Event()
+        self.finish = asyncio.Event()
+
+    async def __call__(self, stream):
+        self.calls += 1
+        self.running += 1
+        self.max_running = max(self.max_running, self.running)
+        self.started.set()
+        try:
+            for event in self.events:
+                await stream(event)
+            await self.finish.wait()
+            return {"response": f"run {self.calls}", "success": True}
+        finally:
+            self.running -= 1
+
+
+def collector():
+    events = []
+
+    async def callback(event):
+        events.append(event)
+
+    return events, callback
+
+
+async def test_runs_of_one_session_are_serialized():
+    lanes = SessionLanes(coalesce_window=0)
+    runner = Runner()
+    first = asyncio.create_task(lanes.submit("s", "first", None, runner))
+    second = asyncio.create_task(lanes.submit("s", "second", None, runner))
+    await runner.started.wait()
+    await asyncio.sleep(0)
+
+    assert runner.calls == 1
+    assert lanes.is_busy("s")
+    runner.finish.set()
+    await asyncio.gather(first, second)
+
+    assert runner.calls == 2
+    assert runner.max_running == 1
+    assert not lanes.is_busy("s")
+
+
+async def test_different_sessions_run_concurrently():
+    lanes = SessionLanes(coalesce_window=0)
+    runner = Runner()
+    tasks = [asyncio.create_task(lanes.submit(session_id, "hello", None, runner)) for session_id in ("a", "b")]
+    for _ in range(5):
+        await asyncio.sleep(0)
+
+    assert runner.running == 2
+    runner.finish.set()
+    await asyncio.gather(*tasks)
+
+
+async def test_identical_prompts_share_one_run():
+    lanes = SessionLanes(coalesce_window=60)
+    runner = Runner(events=[{"type": "text", "seq": 1}, {"type": "text", "seq": 2}])
+    first_events, first_callback = collector()
+    second_events, second_callback = collector()
+
+    first = asyncio.create_task(lanes.submit("s", "same  prompt", first_callback, runner))
+    await runner.started.wait()
+    await asyncio.sleep(0)
+    # Joins after both events were streamed: it gets them replayed, then the same result
+    second = asyncio.create_task(lanes.submit("s", " same prompt ", second_callback, runner))
+    await asyncio.sleep(0)
+    runner.finish.set()
+    results = await asyncio.gather(first, second)
+
+    assert runner.calls == 1
+    assert lanes.coalesced == 1
+    assert results[0] == results[1]
+    assert first_events == second_events == runner.events
+
+
+async def test_prompts_outside_the_window_are_not_coalesced():
+    lanes = SessionLanes(coalesce_window=0)
+    runner = Runner()
+    first = asyncio.create_task(lanes.submit("s", "prompt", None, runner))
+    await runner.started.wait()
+    second = asyncio.create_task(lanes.submit("s", "prompt", None, runner))
+    runner.finish.set()
+    await asyncio.gather(first, second)
+
+    assert runner.calls == 2
+    assert lanes.coalesced == 0
+
+
+async def test_cancel_while_queued_never_runs():
+    lanes = SessionLanes(coalesce_window=0)
+    runner = Runner()
+    running = asyncio.create_task(lanes.submit("s", "first", None, runner))
+    await runner.started.wait()
+    queued = asyncio.create_task(lanes.submit("s", "second", None, runner))
+    await asyncio.sleep(0)
+
+    queued.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await queued
+    runner.finish.set()
+    await running
+    await asyncio.sleep(0)
+
+    assert runner.calls == 1
+    assert not lanes.is_busy("s")
+
+
+async def test_coalesced_run_continues_while_a_waiter_remains():
+    lanes = SessionLanes(coalesce_window=60)
+    runner = Runner()
+    leaving = asyncio.create_task(lanes.submit("s", "prompt", None, runner))
+    staying = asyncio.create_task(lanes.submit("s", "prompt", None, runner))
+    await runner.started.wait()
+
+    leaving.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await leaving
+    runner.finish.set()
+
+    assert (await staying)["success"]
+    assert runner.calls == 1
+
+
+async def test_run_is_cancelled_when_every_waiter_leaves():
+    lanes = SessionLanes(coalesce_window=60)
+    runner = Runner()
+    waiter = asyncio.create_task(lanes.submit("s", "prompt", None, runner))
+    await runner.started.wait()
+
+    waiter.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await waiter
+    await asyncio.sleep(0)
+
+    assert runner.running == 0
+    assert not lanes.is_busy("s")